@@ -6,6 +6,7 @@ import hashlib module for encoding password
 import jwt for token encoding and decoding
 import string and random for generating unique code
 from helper import some helper functions
+import stats to count registrations for the statistics
 global variable SECRET is for token encoding and decoding
 '''
 import re
@@ -13,9 +14,10 @@ import hashlib
 import string
 from random import randint
 import jwt
-from data import users, create_user
+from data import users, handle_index, create_user
 from error import InputError, AccessError
 from helper import get_user_from_email, get_user_from_token, random_str_generate
+from stats import count_registered
 SECRET = 'grape6'
 
 def auth_login(email, password):
@@ -144,6 +146,7 @@ def auth_register(email, password, name_first, name_last):
     handle = handle_initial(name_first, name_last, len(users) + 1)
     token = token_generate(len(users) + 1, 'register')
     new_user = create_user(email, pw_encode(password), name_first, name_last, handle, token)
+    count_registered()
     return {
         'u_id' : new_user['u_id'],
         'token' : new_user['token'],
@@ -238,9 +241,8 @@ def handle_initial(name_first, name_last, u_id):
     handle = (name_first + name_last).lower()
     if len(handle) > 20:
         handle = handle[:20]
-    for user in users:
-        if user['handle'] == handle:
-            handle = (str(u_id) + handle)[:20]
+    if handle in handle_index:
+        handle = (str(u_id) + handle)[:20]
     return handle
 
 def pw_encode(password):
@@ -0,0 +1,181 @@
+'''
+import array for the sorted low bits of sparse chunks
+import bisect to find low bits in a sparse chunk
+
+This module is a compressed bitmap of non negative ints (u_id),
+used by membership.py for very large channels.
+
+Like a roaring bitmap, ints are split by their high bits into chunks
+of 65536. A chunk with few members is kept as a sorted array of its
+low bits, 2 bytes each, and it becomes a 65536 bit bytearray (8KB),
+changed in place, once the array would be larger than that,
+at DENSE_LIMIT members.
+'''
+from array import array
+from bisect import bisect_left, insort
+
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+CHUNK_BYTES = (1 << CHUNK_BITS) // 8
+# a chunk is stored as a bytearray once it holds this many members,
+# 4096 low bits of 2 bytes are as large as the bytearray
+DENSE_LIMIT = CHUNK_BYTES // 2
+# byte value -> positions of its set bits, dense chunks are decoded a byte at a time
+BYTE_BITS = [tuple(bit for bit in range(8) if (byte >> bit) & 1) for byte in range(256)]
+
+class Bitmap:
+    '''
+    A set of non negative ints supporting `in`, len(), add, discard,
+    ordered iteration and intersection, without materialising lists.
+    '''
+    def __init__(self, values=()):
+        # high bits -> array('H') of sorted low bits, or bytearray of low bits
+        self.chunks = {}
+        # high bits -> number of values in the chunk
+        self.sizes = {}
+        self.count = 0
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value):
+        chunk = self.chunks.get(value >> CHUNK_BITS)
+        if chunk is None:
+            return False
+        return chunk_has(chunk, value & CHUNK_MASK)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        # the keys are copied and every chunk is read from a copy,
+        # so iterating is safe while other threads add or discard members
+        for high in sorted(self.chunks):
+            chunk = self.chunks.get(high)
+            if chunk is None:
+                continue
+            base = high << CHUNK_BITS
+            # a dense chunk is decoded a byte at a time into its low bits
+            if isinstance(chunk, bytearray):
+                lows = to_sparse(bytes(chunk))
+            else:
+                lows = array('H', chunk)
+            for low in lows:
+                yield base + low
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return 'Bitmap(' + repr(list(self)) + ')'
+
+    def add(self, value):
+        '''
+        Add value, it will return True if it was not in the bitmap
+        '''
+        if value in self:
+            return False
+        high = value >> CHUNK_BITS
+        low = value & CHUNK_MASK
+        chunk = self.chunks.get(high)
+        size = self.sizes.get(high, 0) + 1
+        if chunk is None:
+            self.chunks[high] = array('H', [low])
+        elif isinstance(chunk, bytearray):
+            chunk[low >> 3] |= 1 << (low & 7)
+        else:
+            insort(chunk, low)
+            if size >= DENSE_LIMIT:
+                self.chunks[high] = to_dense(chunk)
+        self.sizes[high] = size
+        self.count += 1
+        return True
+
+    def discard(self, value):
+        '''
+        Remove value, it will return True if it was in the bitmap
+        '''
+        if value not in self:
+            return False
+        high = value >> CHUNK_BITS
+        low = value & CHUNK_MASK
+        chunk = self.chunks[high]
+        size = self.sizes[high] - 1
+        if size == 0:
+            del self.chunks[high]
+            del self.sizes[high]
+        else:
+            if isinstance(chunk, bytearray):
+                chunk[low >> 3] &= ~(1 << (low & 7))
+                if size < DENSE_LIMIT // 2:
+                    self.chunks[high] = to_sparse(chunk)
+            else:
+                del chunk[bisect_left(chunk, low)]
+            self.sizes[high] = size
+        self.count -= 1
+        return True
+
+    def intersection(self, other):
+        '''
+        It will return a new Bitmap of the values in both bitmaps
+        '''
+        result = Bitmap()
+        for high, chunk in self.chunks.items():
+            other_chunk = other.chunks.get(high)
+            if other_chunk is None:
+                continue
+            if isinstance(chunk, bytearray) and isinstance(other_chunk, bytearray):
+                common = int.from_bytes(chunk, 'little') & int.from_bytes(other_chunk, 'little')
+                common = common.to_bytes(CHUNK_BYTES, 'little')
+                size = popcount(common)
+                if size < DENSE_LIMIT:
+                    common = to_sparse(common)
+                else:
+                    common = bytearray(common)
+            else:
+                if isinstance(chunk, bytearray):
+                    chunk, other_chunk = other_chunk, chunk
+                common = array('H', [low for low in chunk if chunk_has(other_chunk, low)])
+                size = len(common)
+            if size != 0:
+                result.chunks[high] = common
+                result.sizes[high] = size
+                result.count += size
+        return result
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+def chunk_has(chunk, low):
+    '''
+    It will return True if low is in a chunk of either kind
+    '''
+    if isinstance(chunk, bytearray):
+        return (chunk[low >> 3] >> (low & 7)) & 1 == 1
+    idx = bisect_left(chunk, low)
+    return idx < len(chunk) and chunk[idx] == low
+
+def popcount(bits):
+    '''
+    It will return the number of set bits of a bytes like bitmask
+    '''
+    return bin(int.from_bytes(bits, 'little')).count('1')
+
+def to_dense(chunk):
+    '''
+    It will return the bytearray bitmask of sorted low bits
+    '''
+    bits = bytearray(CHUNK_BYTES)
+    for low in chunk:
+        bits[low >> 3] |= 1 << (low & 7)
+    return bits
+
+def to_sparse(bits):
+    '''
+    It will return the sorted array of low bits of a bytes like bitmask
+    '''
+    chunk = array('H')
+    for byte_idx, byte in enumerate(bits):
+        if byte != 0:
+            base = byte_idx << 3
+            chunk.extend(base + bit for bit in BYTE_BITS[byte])
+    return chunk
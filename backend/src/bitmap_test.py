@@ -0,0 +1,56 @@
+''' Test file for bitmap.py '''
+
+import random
+from array import array
+from bitmap import Bitmap, DENSE_LIMIT
+
+def test_bitmap_standard():
+    '''
+    add, discard, `in`, len and ordered iteration
+    '''
+    bitmap = Bitmap([5, 3, 70000])
+    assert len(bitmap) == 3
+    assert list(bitmap) == [3, 5, 70000]
+    assert 5 in bitmap
+    assert 4 not in bitmap
+    assert 70000 in bitmap
+    assert bitmap.add(4) is True
+    assert bitmap.add(4) is False
+    assert bitmap.discard(70000) is True
+    assert bitmap.discard(70000) is False
+    assert list(bitmap) == [3, 4, 5]
+    assert bitmap == [3, 4, 5]
+    assert len(bitmap.chunks) == 1
+
+def test_bitmap_dense_chunks():
+    '''
+    a chunk becomes a bytearray once dense and a sorted array again once sparse
+    '''
+    bitmap = Bitmap(range(DENSE_LIMIT - 1))
+    assert isinstance(bitmap.chunks[0], array)
+    assert bitmap.chunks[0].itemsize * len(bitmap.chunks[0]) < 8192
+    bitmap.add(DENSE_LIMIT - 1)
+    assert isinstance(bitmap.chunks[0], bytearray)
+    assert len(bitmap.chunks[0]) == 8192
+    dense = bitmap.chunks[0]
+    bitmap.add(DENSE_LIMIT + 7)
+    assert bitmap.chunks[0] is dense
+    bitmap.discard(DENSE_LIMIT + 7)
+    assert len(bitmap) == DENSE_LIMIT
+    assert list(bitmap) == list(range(DENSE_LIMIT))
+    for value in range(DENSE_LIMIT // 2 + 1):
+        bitmap.discard(value)
+    assert isinstance(bitmap.chunks[0], array)
+    assert list(bitmap) == list(range(DENSE_LIMIT // 2 + 1, DENSE_LIMIT))
+
+def test_bitmap_intersection():
+    '''
+    intersection of dense and sparse chunks matches set intersection
+    '''
+    rand = random.Random(1531)
+    values_a = set(rand.sample(range(300000), 50000))
+    values_b = set(rand.sample(range(300000), 3000)) | set(range(200000, 230000))
+    common = Bitmap(values_a) & Bitmap(values_b)
+    assert len(common) == len(values_a & values_b)
+    assert list(common) == sorted(values_a & values_b)
+    assert len(Bitmap([1, 2]) & Bitmap([3])) == 0
@@ -2,9 +2,32 @@
 import data.py for data storing
 import error.py for error raising
 from helper import some helper functions
+import islice for paging through messages without copying them
+import dumps for encoding pages that are not cached
+import locks, readers hold the channel's read lock and mutators its write lock
+import time for archive timestamps
+import stats to count joins and leaves for the statistics
+import stream to stop the streams of users who can no longer read the channel
 '''
+import time
+from itertools import islice
+from json import dumps
+from data import users, channels, channel_index, messages, edit_history
+from data import member_projections, roles
+from data import channel_name_index, listall_pages, cold_storage, freeze_messages
 from error import InputError, AccessError
 from helper import get_user_from_id, get_user_from_token, get_channel_from_id, is_user_an_owner
+from helper import get_message_handle, live_messages, touch_channel
+from page_cache import first_page, first_page_json
+from membership import add_member, remove_member, drop_channel, members_page
+from locks import channel_lock
+from snapshot import new_version
+from search_index import unindex_message, drop_time_column
+from mentions import unindex_mentions
+from unread import mark_read, drop_channel_counters
+from stats import count_membership, drop_channel_stats
+from search_parallel import drop_segment
+from stream import drop_subscribers
 
 def channel_invite(token, channel_id, u_id):
     '''
@@ -45,24 +68,93 @@ def channel_invite(token, channel_id, u_id):
     if auth_user['u_id'] not in channel['all_members']:
         raise AccessError(description='Not a member')
 
-    # invited_user is already in channel
-    if invited_user['u_id'] in channel['all_members']:
-        return {
+    with channel_lock(channel_id).write():
+        # invited_user may already be in channel, then nothing changes
+        if add_member(invited_user['u_id'], channel_id) is True:
+            mark_read(invited_user['u_id'], channel_id)
+            count_membership(channel_id, 'joins')
+    return {
+    }
+
+def channel_invite_bulk(token, channel_id, u_ids):
+    '''
+    This will invite many users to join a channel with channel_id at once.
+    The authorised user is checked once, all invited users are resolved
+    in one pass over users, and users who are already members are skipped.
+    Invalid u_ids do not stop the others from being invited.
+
+    Args:
+        param1: invitor's token.
+        param2: target channel.
+        param3: list of invited users' u_id
+
+    Returns:
+        This will return a dictionary with one result per given u_id, in order.
+        {
+            'results': [
+                {
+                    'u_id': u_id,
+                    'status': 'invited' / 'already_member' / 'invalid_u_id',
+                },
+            ],
         }
 
-    channel['all_members'].append(u_id)
-    invited_user['channels'].append(channel_id)
+    Raises:
+        InputError:
+            channel_id does not refer to a valid channel.
+        AccessError:
+            1. the authorised user is not already a member of the channel.
+            2. given token does not refer to a valid token
+    '''
+    auth_user = get_user_from_token(token)
+    channel = get_channel_from_id(channel_id)
+
+    # access error when given token does not refer to a valid user
+    if auth_user is None:
+        raise AccessError(description='Invalid Token')
+    # input error when channel_id does not refer to a valid channel.
+    if channel is None:
+        raise InputError(description='Invalid channel_id')
+    # accesss error when the authorised user is not a member of the channel
+    if auth_user['u_id'] not in channel['all_members']:
+        raise AccessError(description='Not a member')
+
+    # resolve every invited user in one pass
+    wanted = set(u_ids)
+    valid_u_ids = {user['u_id'] for user in users if user['u_id'] in wanted}
+
+    with channel_lock(channel_id).write():
+        results = []
+        for u_id in u_ids:
+            if u_id not in valid_u_ids:
+                status = 'invalid_u_id'
+            elif add_member(u_id, channel_id) is True:
+                mark_read(u_id, channel_id)
+                count_membership(channel_id, 'joins')
+                status = 'invited'
+            else:
+                status = 'already_member'
+            results.append({
+                'u_id': u_id,
+                'status': status,
+            })
     return {
+        'results': results,
     }
 
-def channel_details(token, channel_id):
+def channel_details(token, channel_id, start=0, limit=None, count_only=False):
     '''
     This will provide basic details about a channel whose Channel Id is channel_id.
     Also, the authorised user is part of that channel.
+    For large channels, all_members can be paged with start and limit,
+    or only the number of owners and members can be asked for.
 
     Args:
         param1: authorised user's token.
         param2: target channel.
+        param3: index of the first member to return (only used with limit)
+        param4: max number of members to return, None for all of them
+        param5: return only the counts if True
 
     Returns:
         This will return a dictionary with channel details.
@@ -71,11 +163,19 @@ def channel_details(token, channel_id):
             'owner_members': owner_details,
             'all_members': all_details,
         }
+        With limit, all_members holds one page and the dictionary also has
+        'start' and 'end' ("start + limit", or -1 if there are no more members).
+        With count_only, it will return
+        {
+            'name': channel['name'],
+            'owner_count': number of owners,
+            'member_count': number of members,
+        }
 
     Raises:
         InputError:
             1. channel_id does not refer to a valid channel.
-            2. u_id does not refer to a valid user.
+            2. start is greater than the number of members, or limit is not positive.
         AccessError:
             1. the authorised user is not already a member of the channel.
             2. given token does not refer to a valid token
@@ -93,10 +193,33 @@ def channel_details(token, channel_id):
     if auth_user['u_id'] not in channel['all_members']:
         raise AccessError(description='Not a member')
 
+    if count_only is True:
+        return {
+            'name': channel['name'],
+            'owner_count': len(channel['owner_members']),
+            'member_count': len(channel['all_members']),
+        }
+
+    if limit is None:
+        return {
+            'name': channel['name'],
+            'owner_members': member_initials(channel['owner_members']),
+            'all_members': member_initials(channel['all_members']),
+        }
+
+    # input error when the page is out of range
+    member_count = len(channel['all_members'])
+    if limit <= 0 or start < 0 or start > member_count:
+        raise InputError(description='Invalid start or limit')
+    end = start + limit
+    if end >= member_count:
+        end = -1
     return {
         'name': channel['name'],
-        'owner_members': list(map(member_initial, channel['owner_members'])),
-        'all_members': list(map(member_initial, channel['all_members'])),
+        'owner_members': member_initials(channel['owner_members']),
+        'all_members': member_initials(members_page(channel_id, start, start + limit)),
+        'start': start,
+        'end': end,
     }
 
 def channel_messages(token, channel_id, start):
@@ -139,38 +262,141 @@ def channel_messages(token, channel_id, start):
     if channel is None:
         raise InputError(description='Invalid channel_id')
 
-    all_msgs = list(reversed(channel['messages']))
-    # input error when start is greater than the total number
-    # of messages in the channel
-    if start > len(all_msgs):
-        raise InputError(description='Invalid start index')
+    with channel_lock(channel_id).read():
+        # removed messages are tombstones in storage, they are not counted
+        msg_list = channel['messages']
+        tombstones = channel['tombstones']
+        total = len(msg_list) - len(tombstones)
+        # input error when start is greater than the total number
+        # of messages in the channel
+        if start > total:
+            raise InputError(description='Invalid start index')
+
+        # access error when Authorised user is not a member of channel with channel_id
+        if auth_user['u_id'] not in channel['all_members']:
+            raise AccessError(description='Not a member')
+
+        end = start + 50
+        if end >= total:
+            end = -1
+        if start == 0:
+            return_messages = list(first_page(channel)['messages'])
+            # the newest messages are seen
+            mark_read(auth_user['u_id'], channel_id)
+        else:
+            # walk from the newest message, skipping tombstones,
+            # and stop as soon as the page is full
+            live_msgs = (msg for msg in reversed(msg_list) if msg['message_id'] not in tombstones)
+            return_messages = list(islice(live_msgs, start, start + 50))
+        for msg in return_messages:
+            if auth_user['u_id'] in msg['reacts'][0]['u_ids']:
+                msg['reacts'][0]['is_this_user_reacted'] = True
+            else:
+                msg['reacts'][0]['is_this_user_reacted'] = False
+        return {
+            'messages' : return_messages,
+            'start' : start,
+            'end' : end,
+        }
+
+def channel_messages_json(token, channel_id, start):
+    '''
+    This is the JSON encoded version of channel_messages for the server.
+    The first page is served from the channel's pre-encoded page cache,
+    other pages are encoded as usual.
 
+    Args:
+        param1: authorised user's token.
+        param2: target channel.
+        param3: start index of messages
+
+    Returns:
+        This will return the same text as dumps(channel_messages(...)).
+
+    Raises:
+        Same errors as channel_messages.
+    '''
+    if start != 0:
+        return dumps(channel_messages(token, channel_id, start))
+
+    auth_user = get_user_from_token(token)
+    channel = get_channel_from_id(channel_id)
+    # access error when given token does not refer to a valid user
+    if auth_user is None:
+        raise AccessError(description='Invalid token')
+    # input error when Channel ID is not a valid channel
+    if channel is None:
+        raise InputError(description='Invalid channel_id')
     # access error when Authorised user is not a member of channel with channel_id
     if auth_user['u_id'] not in channel['all_members']:
         raise AccessError(description='Not a member')
 
-    return_messages = []
-    end = start + 50
-    if end >= len(all_msgs):
-        end = -1
-        for msg in all_msgs[start:]:
-            if auth_user['u_id'] in msg['reacts'][0]['u_ids']:
-                msg['reacts'][0]['is_this_user_reacted'] = True
-            else:
-                msg['reacts'][0]['is_this_user_reacted'] = False
-            return_messages.append(msg)
-    else:
-        for msg in all_msgs[start:end]:
+    with channel_lock(channel_id).read():
+        mark_read(auth_user['u_id'], channel_id)
+        return first_page_json(channel, auth_user['u_id'])
+
+def channel_pinned(token, channel_id, start):
+    '''
+    This will return up to 50 pinned messages of channel with channel_id,
+    most recently pinned first, read from the channel's pinned index.
+    Like channel_messages, "end" is "start + 50", or -1 when there are
+    no more pinned messages to load.
+
+    Args:
+        param1: authorised user's token.
+        param2: target channel.
+        param3: start index of pinned messages
+
+    Returns:
+        This will return a dictionary.
+        {
+            'messages' : (a list of messages),
+            'start' : (start index),
+            'end' : (end index),
+        }
+
+    Raises:
+        InputError:
+            1. channel_id does not refer to a valid channel.
+            2. start is greater than the total number of pinned messages in the channel.
+        AccessError:
+            1. Authorised user is not a member of channel with channel_id.
+            2. given token does not refer to a valid token
+    '''
+    auth_user = get_user_from_token(token)
+    channel = get_channel_from_id(channel_id)
+    # access error when given token does not refer to a valid user
+    if auth_user is None:
+        raise AccessError(description='Invalid token')
+    # input error when Channel ID is not a valid channel
+    if channel is None:
+        raise InputError(description='Invalid channel_id')
+    # access error when Authorised user is not a member of channel with channel_id
+    if auth_user['u_id'] not in channel['all_members']:
+        raise AccessError(description='Not a member')
+
+    with channel_lock(channel_id).read():
+        pinned = channel['pinned']
+        # input error when start is greater than the number of pinned messages
+        if start > len(pinned):
+            raise InputError(description='Invalid start index')
+
+        end = start + 50
+        if end >= len(pinned):
+            end = -1
+        return_messages = []
+        for message_id in islice(reversed(pinned), start, start + 50):
+            msg = get_message_handle(message_id)['message']
             if auth_user['u_id'] in msg['reacts'][0]['u_ids']:
                 msg['reacts'][0]['is_this_user_reacted'] = True
             else:
                 msg['reacts'][0]['is_this_user_reacted'] = False
             return_messages.append(msg)
-    return {
-        'messages' : return_messages,
-        'start' : start,
-        'end' : end,
-    }
+        return {
+            'messages' : return_messages,
+            'start' : start,
+            'end' : end,
+        }
 
 def channel_leave(token, channel_id):
     '''
@@ -203,10 +429,13 @@ def channel_leave(token, channel_id):
     if auth_user['u_id'] not in channel['all_members']:
         raise AccessError(description='Not a member')
 
-    auth_user['channels'].remove(channel_id)
-    channel['all_members'].remove(auth_user['u_id'])
-    if auth_user['u_id'] in channel['owner_members']:
-        channel['owner_members'].remove(auth_user['u_id'])
+    with channel_lock(channel_id).write():
+        if remove_member(auth_user['u_id'], channel_id) is True:
+            count_membership(channel_id, 'leaves')
+            drop_subscribers(channel_id, auth_user['u_id'])
+        if auth_user['u_id'] in channel['owner_members']:
+            channel['owner_members'].remove(auth_user['u_id'])
+            roles[auth_user['u_id']]['owned'].discard(channel_id)
     return {
     }
 
@@ -243,13 +472,11 @@ def channel_join(token, channel_id):
     if channel['public'] is False and auth_user['permission_id'] != 1:
         raise AccessError(description='Not permitted to join')
 
-    # already in the channel
-    if channel_id in auth_user['channels']:
-        return {
-        }
-
-    channel['all_members'].append(auth_user['u_id'])
-    auth_user['channels'].append(channel_id)
+    with channel_lock(channel_id).write():
+        # nothing changes if already in the channel
+        if add_member(auth_user['u_id'], channel_id) is True:
+            mark_read(auth_user['u_id'], channel_id)
+            count_membership(channel_id, 'joins')
     return {
     }
 
@@ -291,17 +518,19 @@ def channel_addowner(token, channel_id, u_id):
     if invited_user is None:
         raise InputError(description='Invalid u_id')
 
-    # input error when When user with user id u_id
-    # is already an owner of the channel
-    if invited_user['u_id'] in channel['owner_members']:
-        raise InputError(description='Already an owner')
+    with channel_lock(channel_id).write():
+        # input error when When user with user id u_id
+        # is already an owner of the channel
+        if invited_user['u_id'] in channel['owner_members']:
+            raise InputError(description='Already an owner')
 
-    # access error when the authorised user is not
-    # an owner of the flockr, or an owner of this channel
-    if is_user_an_owner(token, channel_id) is False:
-        raise AccessError(description='Not permitted to add')
+        # access error when the authorised user is not
+        # an owner of the flockr, or an owner of this channel
+        if is_user_an_owner(token, channel_id) is False:
+            raise AccessError(description='Not permitted to add')
 
-    channel['owner_members'].append(u_id)
+        channel['owner_members'].append(u_id)
+        roles[u_id]['owned'].add(channel_id)
     return {
     }
 
@@ -341,40 +570,136 @@ def channel_removeowner(token, channel_id, u_id):
     # input error when u_id does not refer to a valid user
     if removed_user is None:
         raise InputError(description='Invalid u_id')
-    # input error when user with user id u_id is not an owner of the channel
-    if removed_user['u_id'] not in channel['owner_members']:
-        raise InputError(description='Not a owner of channel')
+    with channel_lock(channel_id).write():
+        # input error when user with user id u_id is not an owner of the channel
+        if removed_user['u_id'] not in channel['owner_members']:
+            raise InputError(description='Not a owner of channel')
+
+        # accesss error when the authorised user is not
+        # an owner of the flockr, or an owner of this channel
+        if is_user_an_owner(token, channel_id) is False:
+            raise AccessError(description='Not permitted to remove')
+        channel['owner_members'].remove(u_id)
+        roles[u_id]['owned'].discard(channel_id)
+    return {
+    }
 
+def channel_archive(token, channel_id):
+    '''
+    This will archive an inactive channel. Its messages are compressed into
+    cold storage along with its members, and the channel is dropped from
+    channels, the channel name index, the message index and the membership
+    index, so listings and searches no longer scan it.
+    Its channel_id stays reserved, ids are never reused.
+    Edit history of its messages is not kept, and messages sent later
+    to it are dropped.
+
+    Args:
+        param1: authorised user's token.
+        param2: target channel.
+
+    Returns:
+        This will return an empty dictionary.
+
+    Raises:
+        InputError:
+            1. Channel ID is not a valid channel
+            2. An active standup is currently running in this channel
+        AccessError:
+            1. when the authorised user is not an owner of
+                the flockr, or an owner of this channel
+            2. given token does not refer to a valid token
+    '''
+    auth_user = get_user_from_token(token)
+    channel = get_channel_from_id(channel_id)
+    # access error when given token does not refer to a valid user
+    if auth_user is None:
+        raise AccessError(description='Invalid token')
+    # input error when Channel ID is not a valid channel
+    if channel is None:
+        raise InputError(description='Invalid channel_id')
     # accesss error when the authorised user is not
     # an owner of the flockr, or an owner of this channel
     if is_user_an_owner(token, channel_id) is False:
-        raise AccessError(description='Not permitted to remove')
-    channel['owner_members'].remove(u_id)
+        raise AccessError(description='Not permitted to archive')
+
+    with channel_lock(channel_id).write():
+        # input error when a standup is running, its message would be lost
+        if channel['time_standupend'] != 0:
+            raise InputError(description='Standup is active')
+
+        cold_storage[channel_id] = {
+            'channel_id' : channel_id,
+            'name' : channel['name'],
+            'public' : channel['public'],
+            'owner_members' : list(channel['owner_members']),
+            'all_members' : drop_channel(channel_id),
+            'messages' : freeze_messages(live_messages(channel)),
+            'pinned' : list(channel['pinned']),
+            'time_archived' : int(time.time()),
+        }
+        for msg in live_messages(channel):
+            unindex_message(channel_id, msg['message_id'], msg['message'], msg['u_id'])
+            unindex_mentions(msg['message_id'])
+        drop_time_column(channel_id)
+        drop_segment(channel_id)
+        drop_channel_counters(channel_id, [msg['message_id'] for msg in channel['messages']])
+        drop_channel_stats(channel_id)
+        drop_subscribers(channel_id)
+        for msg in channel['messages']:
+            messages.pop(msg['message_id'], None)
+            edit_history.pop(msg['message_id'], None)
+        for u_id in channel['owner_members']:
+            roles[u_id]['owned'].discard(channel_id)
+        channels.remove(channel)
+        del channel_index[channel_id]
+        channel_name_index.remove((channel['name'], channel_id))
+        channel['archived'] = True
+        touch_channel(channel)
+    new_version('channels')
+    new_version('channel_names')
+    listall_pages.clear()
     return {
     }
 
 ########## help functions ##########
 
-def member_initial(u_id):
+def member_initials(u_ids):
     '''
-    This is a simple helper function.
-    It will return a member type data with given u_id if it exists in data,
-    else return False
+    This is a helper function to get the member type data of many users at once.
+    Projections are cached in data.member_projections by u_id, and all the
+    users missing from the cache are resolved together in one pass over users,
+    instead of one scan per member.
+    The cache entry of a user is dropped when the user's name or photo changes.
 
     Args:
-        param1: u_id
+        param1: iterable of u_id
 
     Returns:
-        This will return member(dictionary) if u_id refers to a valid user in data,
-        else return False.
+        This will return a list of member(dictionary), in the same order as u_ids.
 
     Raises:
         this will not raise any error
     '''
-    user = get_user_from_id(u_id)
-    return {
-        'u_id' : user['u_id'],
-        'name_first' : user['name_first'],
-        'name_last' : user['name_last'],
-        'profile_img_url' : user['profile_img_url'],
-    }
+    u_ids = list(u_ids)
+    # read the cache once per user, a profile change may drop an entry
+    # at any time, so the result is built from this local copy
+    found = {}
+    for u_id in u_ids:
+        projection = member_projections.get(u_id)
+        if projection is not None:
+            found[u_id] = projection
+    missing = {u_id for u_id in u_ids if u_id not in found}
+    if len(missing) != 0:
+        for user in users:
+            if user['u_id'] in missing:
+                found[user['u_id']] = {
+                    'u_id' : user['u_id'],
+                    'name_first' : user['name_first'],
+                    'name_last' : user['name_last'],
+                    'profile_img_url' : user['profile_img_url'],
+                }
+        for u_id in missing:
+            if u_id in found:
+                member_projections[u_id] = found[u_id]
+    return [found[u_id] for u_id in u_ids]
@@ -13,9 +13,10 @@ import pytest
 import auth
 import channel
 from channels import channels_create
-from data import channels
+from data import channels, roles
 from error import InputError, AccessError
-from other import clear
+from other import clear, admin_userpermission_change
+from helper import is_user_an_owner
 
 def test_channel_addowner():
     '''
@@ -146,4 +147,31 @@ def test_addowner_invalid_token():
     channel.channel_invite(token_1, channel_id, u2_id)
     with pytest.raises(AccessError):
         assert channel.channel_addowner('invalid_token', channel_id, u2_id)
-    
\ No newline at end of file
+    
+def test_channel_owner_roles():
+    '''
+        #the role map read by is_user_an_owner follows
+        #addowner, removeowner, leave and permission changes
+    '''
+    clear()
+    auth.auth_register('test1@test.com', 'password', 'user1_name', 'user1_name')
+    token_1 = auth.auth_login('test1@test.com', 'password')['token']
+    u2_id = auth.auth_register('test2@test.com', 'password', 'user2_name', 'user2_name')['u_id']
+    token_2 = auth.auth_login('test2@test.com', 'password')['token']
+    channel_id = channels_create(token_1, 'channel_name', True)['channel_id']
+    channel.channel_join(token_2, channel_id)
+
+    assert is_user_an_owner(token_1, channel_id) is True
+    assert is_user_an_owner(token_2, channel_id) is False
+    channel.channel_addowner(token_1, channel_id, u2_id)
+    assert roles[u2_id]['owned'] == {channel_id}
+    assert is_user_an_owner(token_2, channel_id) is True
+    channel.channel_removeowner(token_1, channel_id, u2_id)
+    assert is_user_an_owner(token_2, channel_id) is False
+    admin_userpermission_change(token_1, u2_id, 1)
+    assert is_user_an_owner(token_2, channel_id) is True
+    admin_userpermission_change(token_1, u2_id, 2)
+    channel.channel_addowner(token_1, channel_id, u2_id)
+    channel.channel_leave(token_2, channel_id)
+    assert roles[u2_id]['owned'] == set()
+    assert is_user_an_owner('invalid_token', channel_id) is False
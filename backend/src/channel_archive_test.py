@@ -0,0 +1,102 @@
+'''
+    channel_archive_test:
+        1. channel_archive() moves messages to cold storage and
+            drops the channel from listings, search and the indexes
+        2. channel ids are not reused after archiving
+        3. input error, Channel ID is not a valid channel
+        4. input error, a standup is active in the channel
+        5. access error, the authorised user is not an owner
+        6. access error, given token is invalid
+'''
+import pytest
+from auth import auth_register, auth_login
+from channel import channel_archive, channel_join, channel_messages
+from channels import channels_create, channels_list, channels_listall
+from message import message_send, message_edit, message_pin
+from standup import standup_start
+from other import clear, search
+from data import users, channels, messages, cold_storage, thaw_messages
+from membership import channels_of, member_count
+from error import InputError, AccessError
+
+@pytest.fixture
+def initial_data():
+    '''
+    register 2 users, user 1 creates 2 channels, user 2 joins the first
+    and user 1 sends 3 messages to it
+    '''
+    clear()
+    auth_register('test1@test.com', 'password', 'user1', 'user1')
+    auth_login('test1@test.com', 'password')
+    auth_register('test2@test.com', 'password', 'user2', 'user2')
+    auth_login('test2@test.com', 'password')
+    channels_create(users[0]['token'], 'channel_1', True)
+    channels_create(users[0]['token'], 'channel_2', True)
+    channel_join(users[1]['token'], 1)
+    for text in ['hello', 'world', 'again']:
+        message_send(users[0]['token'], 1, text)
+
+def test_archive_standard(initial_data):
+    '''
+    the archived channel leaves every hot path and its messages are kept cold
+    '''
+    message_pin(users[0]['token'], 10002)
+    assert channel_archive(users[0]['token'], 1) == {}
+
+    assert [channel['channel_id'] for channel in channels] == [2]
+    assert channels_listall(users[0]['token']) == {
+        'channels' : [{'channel_id' : 2, 'name' : 'channel_2'}],
+    }
+    assert channels_listall(users[0]['token'], 10)['channels'] == [
+        {'channel_id' : 2, 'name' : 'channel_2'},
+    ]
+    assert channels_list(users[1]['token']) == {'channels' : []}
+    assert channels_of(users[0]['u_id']) == [2]
+    assert member_count(1) == 0
+    assert search(users[0]['token'], 'hello') == {'messages' : []}
+    assert 10001 not in messages
+
+    archived = cold_storage[1]
+    assert archived['name'] == 'channel_1'
+    assert archived['all_members'] == [1, 2]
+    assert archived['owner_members'] == [1]
+    assert archived['pinned'] == [10002]
+    assert [msg['message'] for msg in thaw_messages(archived['messages'])] == [
+        'hello', 'world', 'again',
+    ]
+
+    with pytest.raises(InputError):
+        channel_messages(users[0]['token'], 1, 0)
+    with pytest.raises(InputError):
+        message_edit(users[0]['token'], 10001, 'edited')
+
+def test_archive_ids_reserved(initial_data):
+    '''
+    a channel created after an archive gets a new id
+    '''
+    channel_archive(users[0]['token'], 2)
+    assert channels_create(users[0]['token'], 'channel_3', True)['channel_id'] == 3
+    clear()
+    auth_register('test1@test.com', 'password', 'user1', 'user1')
+    assert channels_create(users[0]['token'], 'channel_1', True)['channel_id'] == 1
+    assert cold_storage == {}
+
+def test_archive_errors(initial_data):
+    '''
+    1. input error when given channel_id is invalid
+    2. input error when a standup is active
+    3. access error when user is not an owner
+    4. access error when given token is invalid
+    '''
+    with pytest.raises(InputError):
+        channel_archive(users[0]['token'], 3)
+    with pytest.raises(AccessError):
+        channel_archive(users[1]['token'], 1)
+    with pytest.raises(AccessError):
+        channel_archive('invalid_token', 1)
+    standup_start(users[0]['token'], 2, 1)
+    with pytest.raises(InputError):
+        channel_archive(users[0]['token'], 2)
+    channel_archive(users[0]['token'], 1)
+    with pytest.raises(InputError):
+        channel_archive(users[0]['token'], 1)
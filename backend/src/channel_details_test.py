@@ -3,12 +3,16 @@
         1. channel_detaisl() works well (no error)
         2. input error when Channel ID is not a valid channel
         3. access error when Authorised user is not a member of channel with channel_id
+        4. member projections are cached and refreshed after profile changes
+        5. paged and count only details
+        6. a projection dropped by a profile change while details are built
 '''
 import pytest
 import auth
 import channel
 from channels import channels_create
-from data import users, channels
+from data import users, channels, member_projections
+from user import user_profile_setname
 from error import InputError, AccessError
 from other import clear
 
@@ -78,3 +82,83 @@ def test_details_accesserror_not_authorised_member():
     # access error when given token does not refer to a valid user
     with pytest.raises(AccessError):
         assert channel.channel_details('invalid_token', channel_id)
+
+def test_details_projection_cache():
+    '''
+        #register user1 and user2, user2 joins channel1
+        #details fill the cache and a new name shows up after setname
+    '''
+    clear()
+    u1_id = auth.auth_register('test1@test.com', 'password', 'user1_name', 'user1_name')['u_id']
+    token_1 = auth.auth_login('test1@test.com', 'password')['token']
+    u2_id = auth.auth_register('test2@test.com', 'password', 'user2_name', 'user2_name')['u_id']
+    token_2 = auth.auth_login('test2@test.com', 'password')['token']
+    channel_id = channels_create(token_1, 'channel_name', True)['channel_id']
+    channel.channel_join(token_2, channel_id)
+    assert member_projections == {}
+    channel.channel_details(token_1, channel_id)
+    assert set(member_projections) == {u1_id, u2_id}
+    user_profile_setname(token_2, 'new_first', 'new_last')
+    assert u2_id not in member_projections
+    details = channel.channel_details(token_1, channel_id)
+    assert details['all_members'][1] == {
+        'u_id' : u2_id,
+        'name_first' : 'new_first',
+        'name_last' : 'new_last',
+        'profile_img_url' : '',
+    }
+
+def test_details_projection_dropped_meanwhile(monkeypatch):
+    '''
+        #user1 is cached, user2 is not
+        #user1 changes name while the missing projections are filled
+    '''
+    clear()
+    u1_id = auth.auth_register('test1@test.com', 'password', 'user1_name', 'user1_name')['u_id']
+    token_1 = auth.auth_login('test1@test.com', 'password')['token']
+    u2_id = auth.auth_register('test2@test.com', 'password', 'user2_name', 'user2_name')['u_id']
+    channel_id = channels_create(token_1, 'channel_name', True)['channel_id']
+    channel.channel_details(token_1, channel_id)
+
+    class ChangingUsers(list):
+        def __iter__(self):
+            member_projections.pop(u1_id, None)
+            return super().__iter__()
+
+    monkeypatch.setattr(channel, 'users', ChangingUsers(users))
+    members = channel.member_initials([u1_id, u2_id])
+    assert [member['u_id'] for member in members] == [u1_id, u2_id]
+    assert u2_id in member_projections
+
+def test_details_paged_and_count_only():
+    '''
+        #register 5 users, all of them join channel1
+        #page through members 2 at a time and ask for counts only
+    '''
+    clear()
+    tokens = []
+    for idx in range(5):
+        email = 'test' + str(idx) + '@test.com'
+        auth.auth_register(email, 'password', 'user_name', 'user_name')
+        tokens.append(auth.auth_login(email, 'password')['token'])
+    channel_id = channels_create(tokens[0], 'channel_name', True)['channel_id']
+    for token in tokens[1:]:
+        channel.channel_join(token, channel_id)
+
+    details = channel.channel_details(tokens[0], channel_id, 0, 2)
+    assert [member['u_id'] for member in details['all_members']] == [1, 2]
+    assert [member['u_id'] for member in details['owner_members']] == [1]
+    assert details['start'] == 0
+    assert details['end'] == 2
+    details = channel.channel_details(tokens[0], channel_id, 4, 2)
+    assert [member['u_id'] for member in details['all_members']] == [5]
+    assert details['end'] == -1
+
+    details = channel.channel_details(tokens[0], channel_id, count_only=True)
+    assert details == {'name' : 'channel_name', 'owner_count' : 1, 'member_count' : 5}
+
+    # input error when the page is out of range
+    with pytest.raises(InputError):
+        channel.channel_details(tokens[0], channel_id, 6, 2)
+    with pytest.raises(InputError):
+        channel.channel_details(tokens[0], channel_id, 0, 0)
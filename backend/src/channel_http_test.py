@@ -55,6 +55,92 @@ def initial_basics(url):
                 channel_data['is_public'] = False
             requests.post(url + 'channels/create', json=channel_data)
 
+########################################
+############ pinned tests ##############
+########################################
+# 1. standard test
+# 2. error when invalid start
+def test_pinned_standard(url, initial_basics):
+    '''
+    user 4 sends two messages to channel 1 and pins the first one
+    '''
+    send_data = {
+        'token' : token_generate(4, 'login'),
+        'channel_id' : 1,
+        'message' : 'msg',
+    }
+    requests.post(url + 'message/send', json=send_data)
+    requests.post(url + 'message/send', json=send_data)
+    pin_data = {
+        'token' : token_generate(4, 'login'),
+        'message_id' : 10001,
+    }
+    requests.post(url + 'message/pin', json=pin_data)
+    params = {
+        'token' : token_generate(4, 'login'),
+        'channel_id' : 1,
+        'start' : 0,
+    }
+    resp = requests.get(url + 'channel/pinned', params=params)
+    assert resp.status_code == 200
+    assert json.loads(resp.text)['end'] == -1
+    assert len(json.loads(resp.text)['messages']) == 1
+    assert json.loads(resp.text)['messages'][0]['message_id'] == 10001
+
+def test_pinned_error_invalid_start(url, initial_basics):
+    '''
+    error when start is greater than the number of pinned messages
+    '''
+    params = {
+        'token' : token_generate(4, 'login'),
+        'channel_id' : 1,
+        'start' : 1,
+    }
+    resp = requests.get(url + 'channel/pinned', params=params)
+    assert resp.status_code == 400
+
+########################################
+############ stream tests ##############
+########################################
+# 1. standard test
+# 2. error when authorised user is not a member of given channel
+def test_stream_standard(url, initial_basics):
+    '''
+    user 4 listens to channel 1 and receives the message it sends
+    '''
+    params = {
+        'token' : token_generate(4, 'login'),
+        'channel_id' : 1,
+    }
+    resp = requests.get(url + 'channel/stream', params=params, stream=True, timeout=5)
+    assert resp.status_code == 200
+    assert resp.headers['Content-Type'].startswith('text/event-stream')
+    send_data = {
+        'token' : token_generate(4, 'login'),
+        'channel_id' : 1,
+        'message' : 'msg',
+    }
+    requests.post(url + 'message/send', json=send_data)
+    lines = resp.iter_lines(chunk_size=1, decode_unicode=True)
+    assert next(lines) == ': connected'
+    assert next(lines) == ''
+    assert next(lines) == 'event: message_new'
+    data = json.loads(next(lines)[len('data: '):])
+    assert data['message'] == 'msg'
+    assert data['message_id'] == 10001
+    resp.close()
+
+def test_stream_error_not_member(url, initial_basics):
+    '''
+    error when user 1 is not a member of channel 1
+    '''
+    params = {
+        'token' : token_generate(1, 'login'),
+        'channel_id' : 1,
+    }
+    resp = requests.get(url + 'channel/stream', params=params)
+    assert resp.status_code == 400
+
 ########################################
 ############ invite tests ##############
 ########################################
@@ -152,6 +238,26 @@ def test_invite_error_not_member(url, initial_basics):
     resp = requests.post(url + 'channel/invite', json=data)
     assert resp.status_code == 400
 
+def test_invite_bulk(url, initial_basics):
+    '''
+    user 4 invites user 1, user 2 and an unknown user to channel1 at once
+    '''
+    data = {
+        'token' : token_generate(4, 'login'),
+        'channel_id' : 1,
+        'u_ids' : [1, 2, 42],
+    }
+    resp = requests.post(url + 'channel/invite/bulk', json=data)
+    assert resp.status_code == 200
+    assert [result['status'] for result in json.loads(resp.text)['results']] == \
+        ['invited', 'invited', 'invalid_u_id']
+    detail_data = {
+        'token' : token_generate(4, 'login'),
+        'channel_id' : 1,
+    }
+    resp = requests.get(url + 'channel/details', params=detail_data)
+    assert len(json.loads(resp.text)['all_members']) == 3
+
 ########################################
 ########### details tests ##############
 ########################################
@@ -191,6 +297,29 @@ def test_details_standar(url, initial_basics):
     assert len(json.loads(resp.text)['all_members']) == 3
     assert len(json.loads(resp.text)['owner_members']) == 1
 
+def test_details_count_only(url, initial_basics):
+    '''
+    user 4 asks for the member count of channel 1 and a page of members
+    '''
+    detail_data = {
+        'token' : token_generate(4, 'login'),
+        'channel_id' : 1,
+        'count_only' : 'true',
+    }
+    resp = requests.get(url + 'channel/details', params=detail_data)
+    assert resp.status_code == 200
+    assert json.loads(resp.text) == {'name' : 'channel1', 'owner_count' : 1, 'member_count' : 1}
+    detail_data = {
+        'token' : token_generate(4, 'login'),
+        'channel_id' : 1,
+        'start' : 0,
+        'limit' : 10,
+    }
+    resp = requests.get(url + 'channel/details', params=detail_data)
+    assert resp.status_code == 200
+    assert json.loads(resp.text)['end'] == -1
+    assert len(json.loads(resp.text)['all_members']) == 1
+
 def test_details_error_invalid_channel(url, initial_basics):
     '''
     error when given channel_id is invalid
@@ -572,3 +701,29 @@ def test_rmowner_error_no_permissino(url, initial_basics):
     }
     resp = requests.post(url + 'channel/removeowner', json=data)
     assert resp.status_code == 400
+
+########################################
+########### archive tests ##############
+########################################
+# 1. standard test
+# 2. error when no permission
+def test_archive_standard(url, initial_basics):
+    data = {
+        'token' : token_generate(4, 'login'),
+        'channel_id' : 1,
+    }
+    resp = requests.post(url + 'channel/archive', json=data)
+    assert resp.status_code == 200
+    resp = requests.get(url + 'channels/listall', params={'token' : token_generate(4, 'login')})
+    channel_ids = [channel['channel_id'] for channel in json.loads(resp.text)['channels']]
+    assert channel_ids == [2, 3]
+    resp = requests.post(url + 'channel/archive', json=data)
+    assert resp.status_code == 400
+
+def test_archive_error_no_permission(url, initial_basics):
+    data = {
+        'token' : token_generate(5, 'login'),
+        'channel_id' : 1,
+    }
+    resp = requests.post(url + 'channel/archive', json=data)
+    assert resp.status_code == 400
@@ -12,6 +12,8 @@ from other import clear
         2. input error, Channel ID is not a valid channel
         3. input error, u_id does not refer to a valid user
         4. access error, the authorised user is not already a member of the channel
+        5. channel_invite_bulk() reports a result per user
+        6. channel_invite_bulk() errors
     
     3 help functions:
         1. is_user_in_channel(channel_id, u_id)
@@ -100,3 +102,48 @@ def test_invite_AccessError_not_authorised_member():
     # access error when gievn token does not refer to a valid token
     with pytest.raises(AccessError):
         channel.channel_invite('invalid_token', channel_id, u2_id)
+
+def test_channel_invite_bulk():
+    #valid test
+    # register user1 to user4, user1 creates a channel
+    # user1 invites user2, user3, user2 again, a non-existing user and itself
+    clear()
+    tokens = []
+    for idx in range(4):
+        email = 'test' + str(idx + 1) + '@test.com'
+        auth.auth_register(email, 'password', 'user_name', 'user_name')
+        tokens.append(auth.auth_login(email, 'password')['token'])
+    channel_id = channels_create(tokens[0], 'channel_name', True)['channel_id']
+    resp = channel.channel_invite_bulk(tokens[0], channel_id, [2, 3, 2, 100, 1])
+    assert resp == {
+        'results': [
+            {'u_id': 2, 'status': 'invited'},
+            {'u_id': 3, 'status': 'invited'},
+            {'u_id': 2, 'status': 'already_member'},
+            {'u_id': 100, 'status': 'invalid_u_id'},
+            {'u_id': 1, 'status': 'already_member'},
+        ],
+    }
+    assert list(channels[0]['all_members']) == [1, 2, 3]
+    assert channel_id in users[1]['channels']
+    assert channel_id in users[2]['channels']
+    assert channel_id not in users[3]['channels']
+    assert channel.channel_invite_bulk(tokens[0], channel_id, []) == {'results': []}
+
+def test_channel_invite_bulk_errors():
+    # register user1 and user2, user1 creates a channel
+    clear()
+    auth.auth_register('test1@test.com', 'password', 'user1_name', 'user1_name')
+    token_1 = auth.auth_login('test1@test.com', 'password')['token']
+    auth.auth_register('test2@test.com', 'password', 'user2_name', 'user2_name')
+    token_2 = auth.auth_login('test2@test.com', 'password')['token']
+    channel_id = channels_create(token_1, 'channel_name', True)['channel_id']
+    # input error, Channel ID is not a valid channel
+    with pytest.raises(InputError):
+        channel.channel_invite_bulk(token_1, channel_id + 1, [2])
+    # access error, the authorised user is not a member of the channel
+    with pytest.raises(AccessError):
+        channel.channel_invite_bulk(token_2, channel_id, [2])
+    # access error, invalid token
+    with pytest.raises(AccessError):
+        channel.channel_invite_bulk('invalid_token', channel_id, [2])
@@ -0,0 +1,82 @@
+import pytest
+import auth
+import channel
+import message
+from data import users, channels
+from error import InputError, AccessError
+from channels import channels_create
+from other import clear
+
+'''
+    test:
+        1. channel_pinned() returns pinned messages, most recently pinned first
+        2. pinned index follows pin, unpin and remove
+        3. input error when Channel ID is not a valid channel
+        4. input error when start is greater than the number of pinned messages
+        5. access error when Authorised user is not a member of channel with channel_id
+'''
+
+@pytest.fixture
+def initial_users():
+    clear()
+    auth.auth_register('test1@test.com', 'password', 'name_first', 'name_last')
+    token_1 = auth.auth_login('test1@test.com', 'password')['token']
+    auth.auth_register('test2@test.com', 'password', 'name_first', 'name_last')
+    token_2 = auth.auth_login('test2@test.com', 'password')['token']
+    auth.auth_register('test3@test.com', 'password', 'name_first', 'name_last')
+    token_3 = auth.auth_login('test3@test.com', 'password')['token']
+    channel_id = channels_create(token_1, 'channel1', True)['channel_id']
+    channels_create(token_3, 'channel1', True)
+    channel.channel_join(token_2, channel_id)
+
+@pytest.fixture
+def initial_msg():
+    for index in range(60):
+        message.message_send(users[0]['token'], channels[0]['channel_id'], str(index + 1))
+
+def test_pinned_standard(initial_users, initial_msg):
+    resp = channel.channel_pinned(users[1]['token'], channels[0]['channel_id'], 0)
+    assert resp == {'messages' : [], 'start' : 0, 'end' : -1}
+
+    message.message_pin(users[0]['token'], 10005)
+    message.message_pin(users[0]['token'], 10002)
+    message.message_react(users[1]['token'], 10002, 1)
+    resp = channel.channel_pinned(users[1]['token'], channels[0]['channel_id'], 0)
+    assert [msg['message_id'] for msg in resp['messages']] == [10002, 10005]
+    assert resp['messages'][0]['is_pinned'] is True
+    assert resp['messages'][0]['reacts'][0]['is_this_user_reacted'] is True
+    assert resp['messages'][1]['reacts'][0]['is_this_user_reacted'] is False
+    assert resp['end'] == -1
+
+    message.message_unpin(users[0]['token'], 10005)
+    message.message_pin(users[0]['token'], 10005)
+    message.message_remove(users[0]['token'], 10002)
+    resp = channel.channel_pinned(users[1]['token'], channels[0]['channel_id'], 0)
+    assert [msg['message_id'] for msg in resp['messages']] == [10005]
+
+def test_pinned_pages(initial_users, initial_msg):
+    for index in range(55):
+        message.message_pin(users[0]['token'], 10001 + index)
+    resp = channel.channel_pinned(users[0]['token'], channels[0]['channel_id'], 0)
+    assert len(resp['messages']) == 50
+    assert resp['end'] == 50
+    assert resp['messages'][0]['message_id'] == 10055
+    resp = channel.channel_pinned(users[0]['token'], channels[0]['channel_id'], 50)
+    assert len(resp['messages']) == 5
+    assert resp['end'] == -1
+    assert resp['messages'][4]['message_id'] == 10001
+
+def test_pinned_errors(initial_users, initial_msg):
+    message.message_pin(users[0]['token'], 10001)
+    # input error when Channel ID is not a valid channel
+    with pytest.raises(InputError):
+        channel.channel_pinned(users[0]['token'], 123123, 0)
+    # input error when start is greater than the number of pinned messages
+    with pytest.raises(InputError):
+        channel.channel_pinned(users[0]['token'], channels[0]['channel_id'], 2)
+    # access error when Authorised user is not a member of channel with channel_id
+    with pytest.raises(AccessError):
+        channel.channel_pinned(users[2]['token'], channels[0]['channel_id'], 0)
+    # access error when given token does not refer to a valid user
+    with pytest.raises(AccessError):
+        channel.channel_pinned('invalid_token', channels[0]['channel_id'], 0)
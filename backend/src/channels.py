@@ -7,10 +7,26 @@
 
     error module contains custom exceptions, including InputError
     and AccessError
+
+    bisect module keeps the channel name index sorted and finds name prefixes
+
+    json module pre-serialises cached channels_listall pages
+
+    snapshot module gives channels_listall an immutable view of the channels
+    while other threads create new ones
 """
-from data import users, channels, create_new_channel
+from bisect import bisect_left, bisect_right, insort
+from json import dumps
+from data import users, channels, create_new_channel, channel_name_index, listall_pages
+from data import next_channel_id
 from error import InputError, AccessError
 from helper import get_user_from_token, get_channel_from_id
+from membership import channels_of
+from snapshot import new_version, view_version, read_snapshot
+from unread import unread_counts
+
+# max number of cached channels_listall pages
+LISTALL_CACHE_SIZE = 256
 
 #### INTERFACE FUNCTION IMPLEMENTATIONS ####
 def channels_list(token):
@@ -29,36 +45,74 @@ def channels_list(token):
     auth_user = get_user_from_token(token)
     if auth_user is None:
         raise AccessError(description="Unauthorised access")
-    # get list of channel_id
-    user_channels = auth_user['channels']
+    # get list of channel_id from the membership index
+    user_channels = channels_of(auth_user['u_id'])
     return {
         'channels': list(map(channel_detail, user_channels)),
     }
 
-def channels_listall(token):
+def channels_unread(token):
     """
-        Provides a list of all channels (and their associated details).
+        Provides the number of unread messages in every channel the
+        authorised user is a part of, from the unread counters, without
+        reading any message.
 
-        :param token: The token of any authorised user 
+        :param token: The token of the user in question
         :type token: str
 
-        :return: A dictionary containing a list of all channels and their associated
-        details (name & channel_id) 
+        :return: A dictionary containing a list of channel_id and unread
+        count, in the order of channels_list
         :rtype: dict with nested list
     """
-
     # check token validity
     auth_user = get_user_from_token(token)
     if auth_user is None:
         raise AccessError(description="Unauthorised access")
-    # get list of channel_id
-    all_channels = []
-    for channel in channels:
-        all_channels.append(channel['channel_id'])
+    user_channels = channels_of(auth_user['u_id'])
+    counts = unread_counts(auth_user['u_id'], user_channels)
     return {
-        'channels': list(map(channel_detail, all_channels)),
+        'channels': [{
+            'channel_id' : channel_id,
+            'unread' : count,
+        } for channel_id, count in zip(user_channels, counts)],
     }
 
+def channels_listall(token, limit=None, cursor=None, name_prefix=None):
+    """
+        Provides a list of all channels (and their associated details).
+        Without limit and name_prefix, every channel is listed in order of
+        creation. Otherwise channels are listed in order of name from the
+        sorted channel name index, a page at a time.
+
+        :param token: The token of any authorised user 
+        :type token: str
+
+        :param limit: The max number of channels in a page, None for no limit
+        :type limit: int
+
+        :param cursor: The next_cursor of the previous page, None for the first page
+        :type cursor: int
+
+        :param name_prefix: Only list channels whose name starts with it
+        :type name_prefix: str
+
+        :return: A dictionary containing a list of all channels and their associated
+        details (name & channel_id). A page also has next_cursor, the cursor
+        of the next page or -1 if it is the last one.
+        :rtype: dict with nested list
+    """
+    return listall_page(token, limit, cursor, name_prefix)['page']
+
+def channels_listall_json(token, limit=None, cursor=None, name_prefix=None):
+    """
+        The JSON encoded version of channels_listall for the server.
+        Pages are encoded once and served from cache until a channel is created.
+
+        :return: The same text as dumps(channels_listall(...))
+        :rtype: str
+    """
+    return listall_page(token, limit, cursor, name_prefix)['json']
+
 def channels_create(token, name, is_public):
     """
         Creates a new channel with that name that is either a public or private 
@@ -88,16 +142,32 @@ def channels_create(token, name, is_public):
         raise AccessError(description="Unauthorised access")
 
     # create new channel in data.py
-    new_channel = create_new_channel(len(channels) + 1, is_public, name, user['u_id'])
-
-    # add new channel_id to user's channels list
-    user['channels'].append(new_channel['channel_id'])
+    new_channel = create_new_channel(next_channel_id(), is_public, name, user['u_id'])
+    insort(channel_name_index, (name, new_channel['channel_id']))
+    new_version('channels')
+    new_version('channel_names')
+    listall_pages.clear()
 
     # return channel_id
     return {
         'channel_id': new_channel['channel_id'],
     }
 
+def channel_detail_of(channel):
+    """
+        A helper function to get the details (id & name) of a channel.
+
+        :param channel: channel whose details we want 
+        :type channel: dict
+
+        :return: A dictionary containing the channel's details (id & name)
+        :rtype: dict
+    """
+    return {
+        'channel_id' : channel['channel_id'],
+        'name' : channel['name'],
+    }
+
 def channel_detail(channel_id):
     """
         A helper function to get a channel's details from its id.
@@ -115,3 +185,95 @@ def channel_detail(channel_id):
         'channel_id' : channel['channel_id'],
         'name' : channel['name'],
     }
+
+def listall_page(token, limit, cursor, name_prefix):
+    """
+        A helper function to get a channels_listall page, from cache if it
+        has been built since the last channel was created.
+
+        :return: A dictionary with the page and its JSON encoding
+        {
+            'page' : channels_listall result,
+            'json' : dumps of the page,
+        }
+        :rtype: dict
+    """
+    # check token validity
+    auth_user = get_user_from_token(token)
+    if auth_user is None:
+        raise AccessError(description="Unauthorised access")
+
+    # a page built from an older snapshot is never served from cache
+    version = view_version('channels')
+    key = (limit, cursor, name_prefix)
+    cached = listall_pages.get(key)
+    if cached is not None and cached['version'] == version:
+        return cached
+
+    if limit is None and name_prefix is None and cursor is None:
+        page = {
+            'channels': list(read_snapshot('channels', channel_details_all)),
+        }
+    else:
+        page = build_listall_page(limit, cursor, name_prefix)
+    cached = {
+        'version' : version,
+        'page' : page,
+        'json' : dumps(page),
+    }
+    # keep the cache bounded when many different pages are asked for
+    if len(listall_pages) >= LISTALL_CACHE_SIZE:
+        listall_pages.clear()
+    listall_pages[key] = cached
+    return cached
+
+def build_listall_page(limit, cursor, name_prefix):
+    """
+        A helper function to read a page of channels, in order of name,
+        from the sorted channel name index.
+
+        :return: A dictionary with a list of channels and next_cursor
+        :rtype: dict with nested list
+    """
+    if limit is not None and limit <= 0:
+        raise InputError(description="Limit must be positive")
+    if name_prefix is None:
+        name_prefix = ''
+
+    name_index = read_snapshot('channel_names', lambda: channel_name_index)
+    # first index whose name has the prefix
+    lower = bisect_left(name_index, (name_prefix,))
+    if cursor is not None:
+        cursor_channel = get_channel_from_id(cursor)
+        if cursor_channel is None:
+            raise InputError(description="Invalid cursor")
+        lower = max(lower, bisect_right(name_index,
+                                        (cursor_channel['name'], cursor)))
+
+    page_channels = []
+    next_cursor = -1
+    for idx in range(lower, len(name_index)):
+        name, channel_id = name_index[idx]
+        if not name.startswith(name_prefix):
+            break
+        if limit is not None and len(page_channels) == limit:
+            next_cursor = page_channels[-1]['channel_id']
+            break
+        page_channels.append({
+            'channel_id' : channel_id,
+            'name' : name,
+        })
+    return {
+        'channels': page_channels,
+        'next_cursor': next_cursor,
+    }
+
+def channel_details_all():
+    """
+        A helper function to get the details (id & name) of every channel,
+        in order of creation, for the channels snapshot.
+
+        :return: A list of channel details
+        :rtype: list of dict
+    """
+    return [channel_detail_of(channel) for channel in list(channels)]
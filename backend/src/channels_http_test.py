@@ -298,3 +298,59 @@ def test_http_listall_standard_no_channel(url, create_users):
     payload = resp.json()
     assert resp.status_code == 200
     assert len(payload['channels']) == 0
+
+def test_http_listall_paged(url, create_users, create_channels):
+    """
+        Test for paging channels_listall() over http.
+
+        :param url: pytest fixture that starts the server and gets its URL 
+        :type url: pytest fixture
+
+        :param create_users: pytest fixture to create two test users 
+        :type create_users: pytest fixture
+
+        :param create_channels: pytest fixture to create four test channels 
+        :type create_channels: pytest fixture
+    """
+    params = {'token': token_generate(1, 'login'), 'limit': 3, 'name_prefix': 'Channel 0'}
+    resp = requests.get(url + 'channels/listall', params=params)
+    payload = resp.json()
+    assert resp.status_code == 200
+    assert [channel['channel_id'] for channel in payload['channels']] == [1, 2, 3]
+    assert payload['next_cursor'] == 3
+
+    params['cursor'] = payload['next_cursor']
+    payload = requests.get(url + 'channels/listall', params=params).json()
+    assert [channel['channel_id'] for channel in payload['channels']] == [4]
+    assert payload['next_cursor'] == -1
+
+def test_http_unread(url, create_users, create_channels):
+    """
+        Test for the unread counts of channels_unread() over http.
+
+        :param url: pytest fixture that starts the server and gets its URL 
+        :type url: pytest fixture
+
+        :param create_users: pytest fixture to create two test users 
+        :type create_users: pytest fixture
+
+        :param create_channels: pytest fixture to create four test channels 
+        :type create_channels: pytest fixture
+    """
+    requests.post(url + 'channel/join', json={'token': token_generate(2, 'login'),
+                                              'channel_id': 1})
+    for text in ['first', 'second']:
+        requests.post(url + 'message/send', json={'token': token_generate(1, 'login'),
+                                                  'channel_id': 1, 'message': text})
+    resp = requests.get(url + 'channels/unread', params={'token': token_generate(2, 'login')})
+    assert resp.status_code == 200
+    assert resp.json()['channels'] == [
+        {'channel_id': 3, 'unread': 0},
+        {'channel_id': 4, 'unread': 0},
+        {'channel_id': 1, 'unread': 2},
+    ]
+
+    requests.get(url + 'channel/messages', params={'token': token_generate(2, 'login'),
+                                                   'channel_id': 1, 'start': 0})
+    resp = requests.get(url + 'channels/unread', params={'token': token_generate(2, 'login')})
+    assert resp.json()['channels'][2] == {'channel_id': 1, 'unread': 0}
@@ -21,8 +21,9 @@
 """
 import pytest
 from auth import auth_login, auth_register
-from channels import channels_list, channels_listall, channels_create
-from data import users, channels
+from channels import channels_list, channels_listall, channels_listall_json, channels_create
+from data import users, channels, listall_pages
+import json
 from other import clear
 from error import InputError, AccessError
 
@@ -181,6 +182,71 @@ def test_listall_standard(create_users, create_channels):
     assert channel_06_listed['channel_id'] == channel_06['channel_id']
     assert channel_06_listed['name'] == 'Channel 06 User 2'
 
+def test_listall_paged(create_users, create_channels):
+    """
+        Test for paging channels_listall() by name with limit, cursor and
+        name_prefix.
+
+        :param create_users: pytest fixture to create two test users 
+        :type create_users: pytest fixture
+
+        :param create_channels: pytest fixture to create six test channels 
+        :type create_channels: pytest fixture
+    """
+    channels_create(users[1]['token'], 'Alpha', True)
+    channels_create(users[1]['token'], 'Channel 00', True)
+
+    # pages of 3 channels, in order of name
+    page = channels_listall(users[0]['token'], 3)
+    assert [channel['name'] for channel in page['channels']] == \
+        ['Alpha', 'Channel 00', 'Channel 01']
+    page = channels_listall(users[0]['token'], 3, page['next_cursor'])
+    assert [channel['name'] for channel in page['channels']] == \
+        ['Channel 02', 'Channel 03', 'Channel 04 User 2']
+    page = channels_listall(users[0]['token'], 3, page['next_cursor'])
+    assert [channel['name'] for channel in page['channels']] == \
+        ['Channel 05 User 2', 'Channel 06 User 2']
+    assert page['next_cursor'] == -1
+
+    # name prefix, with and without limit
+    page = channels_listall(users[0]['token'], name_prefix='Channel 0')
+    assert len(page['channels']) == 7
+    page = channels_listall(users[0]['token'], 2, name_prefix='Channel 05')
+    assert page == {
+        'channels' : [{'channel_id' : channel_05['channel_id'], 'name' : 'Channel 05 User 2'}],
+        'next_cursor' : -1,
+    }
+    page = channels_listall(users[0]['token'], name_prefix='Beta')
+    assert page == {'channels' : [], 'next_cursor' : -1}
+
+    # invalid limit and cursor
+    with pytest.raises(InputError):
+        channels_listall(users[0]['token'], 0)
+    with pytest.raises(InputError):
+        channels_listall(users[0]['token'], 3, 100)
+
+def test_listall_cached(create_users, create_channels):
+    """
+        Test that channels_listall() pages are encoded once and dropped
+        when a channel is created.
+
+        :param create_users: pytest fixture to create two test users 
+        :type create_users: pytest fixture
+
+        :param create_channels: pytest fixture to create six test channels 
+        :type create_channels: pytest fixture
+    """
+    encoded = channels_listall_json(users[0]['token'])
+    assert json.loads(encoded) == channels_listall(users[1]['token'])
+    assert len(listall_pages) == 1
+    assert channels_listall_json(users[0]['token']) is encoded
+    channels_listall_json(users[0]['token'], 2)
+    assert len(listall_pages) == 2
+
+    channels_create(users[1]['token'], 'Channel 07', True)
+    assert len(listall_pages) == 0
+    assert len(json.loads(channels_listall_json(users[0]['token']))['channels']) == 7
+
 def test_create_invalid_name(create_users, create_channels):
     """
         Test for InputError exception thrown by channels_create() when name
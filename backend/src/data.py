@@ -1,4 +1,11 @@
 import time
+import threading
+import zlib
+from json import dumps, loads
+from membership import add_member, user_channels_view, channel_users_view
+from snapshot import new_version
+from error import InputError
+from message_ids import MSG_ID_BASE
 
 users = [
 
@@ -8,6 +15,78 @@ channels = [
 
 ]
 
+# channel_id -> channel of every channel in channels, see get_channel_from_id
+channel_index = {
+
+}
+
+# (name, channel_id) of every channel, kept sorted for channels_listall paging
+channel_name_index = [
+
+]
+
+# (limit, cursor, name_prefix) -> cached channels_listall page and its json,
+# emptied whenever a channel is created
+listall_pages = {
+
+}
+
+# u_id -> member projection used by channel_details, see member_initials in channel.py
+member_projections = {
+
+}
+
+# message_id -> handle of a sent message, see get_message_handle in helper.py
+messages = {
+
+}
+
+# message_id -> list of (time_edited, previous message) tuples, oldest first
+edit_history = {
+
+}
+
+# u_id -> role of a user, see is_user_an_owner in helper.py
+# {
+#     'global_owner' : True if permission_id is 1,
+#     'owned' : set of channel_id the user is an owner of,
+# }
+roles = {
+
+}
+
+# handle -> u_id of every user, handles are unique
+handle_index = {
+
+}
+
+# token -> u_id of a valid token, a token always decodes to the same u_id.
+# Only tokens signed by the server are kept, see get_user_from_token in helper.py
+decoded_tokens = {
+
+}
+
+# which slice of the channels this process holds, see shard.py.
+# It holds the channels with (channel_id - 1) % count == index,
+# a process running alone holds every channel.
+shard = {
+    'index' : 0,
+    'count' : 1,
+}
+
+# number of channel ids handed out by this process. Ids are never reused,
+# so an archived channel keeps its id reserved
+channel_id_allocator = {
+    'allocated' : 0,
+}
+channel_id_lock = threading.Lock()
+
+# channel_id -> archived channel, its messages are kept compressed,
+# see channel_archive in channel.py
+cold_storage = {
+
+}
+
 def create_user(email, password, name_first, name_last, handle, token):
     '''
     This is a simple helper function to create a new user with given information.
@@ -32,7 +111,7 @@ def create_user(email, password, name_first, name_last, handle, token):
         'name_last' : name_last,
         'email' : email,
         'password' : password,
-        'channels' : [],
+        'channels' : user_channels_view(len(users) + 1),
         'token' : token,
         'handle' : handle,
         'reset_code' : '',
@@ -43,6 +122,12 @@ def create_user(email, password, name_first, name_last, handle, token):
     else:
         new_user['permission_id'] = 2
     users.append(new_user)
+    handle_index[handle] = new_user['u_id']
+    roles[new_user['u_id']] = {
+        'global_owner' : new_user['permission_id'] == 1,
+        'owned' : set(),
+    }
+    new_version('users')
     return new_user
 
 def create_new_channel(channel_id, is_public, name, uid):
@@ -64,22 +149,81 @@ def create_new_channel(channel_id, is_public, name, uid):
     new_channel['public'] = is_public
     new_channel['name'] = name
     new_channel['owner_members'] = [uid]
-    new_channel['all_members'] = [uid]
+    new_channel['all_members'] = channel_users_view(channel_id)
     new_channel['messages'] = []
+    new_channel['tombstones'] = set()
+    new_channel['compacting'] = False
+    new_channel['pinned'] = {}
+    new_channel['version'] = 0
+    new_channel['first_page'] = None
+    new_channel['snapshot'] = None
+    new_channel['archived'] = False
     new_channel['latest_msg_id'] = 0
     new_channel['time_standupend'] = 0
     new_channel['standup_msg'] = ''
 
-    # add new channel to channels list
+    # add new channel to channels list, with its creator as the first member
     channels.append(new_channel)
+    channel_index[channel_id] = new_channel
+    add_member(uid, channel_id)
+    roles[uid]['owned'].add(channel_id)
 
     return new_channel
 
+def next_channel_id():
+    '''
+    This is a simple helper function to allocate the id of the next channel
+    created in this process. Ids only go up, whether or not channels have
+    been archived. They are spread over the shards, so shards never hand
+    out the same id, and a single process counts up from 1.
+
+    Returns:
+        This will return an int
+    '''
+    with channel_id_lock:
+        allocated = channel_id_allocator['allocated']
+        channel_id_allocator['allocated'] += 1
+    return allocated * shard['count'] + shard['index'] + 1
+
+def reset_channel_ids():
+    '''
+    This is a simple helper function to start allocating ids from 1 again
+    when data is cleared.
+    '''
+    with channel_id_lock:
+        channel_id_allocator['allocated'] = 0
+
+def freeze_messages(msg_list):
+    '''
+    This is a simple helper function to compress messages for cold storage.
+
+    Args:
+        param1: list of messages
+
+    Returns:
+        This will return bytes
+    '''
+    return zlib.compress(dumps(msg_list).encode())
+
+def thaw_messages(frozen):
+    '''
+    This is a simple helper function to read messages back from cold storage.
+
+    Args:
+        param1: bytes made by freeze_messages
+
+    Returns:
+        This will return a list of messages
+    '''
+    return loads(zlib.decompress(frozen).decode())
+
 def create_new_msg(message, channel, u_id):
     '''
     This is an helper function to create a new message.
     It will create a timestamp to represent create time.
-    It will create a unique msg_id combining channel_id and channel's msgs
+    It will create a unique msg_id combining channel_id and channel's msgs.
+    The id of a channel's 10000th message would be the first id of the
+    next channel, so the channel takes no more messages.
 
     Args:
         param1: message body (str)
@@ -96,9 +240,14 @@ def create_new_msg(message, channel, u_id):
             'reacts': [react_info],
             'is_pinned': False,
         }
+
+    Raises:
+        InputError: the channel has taken MSG_ID_BASE - 1 messages
     '''
+    if channel['latest_msg_id'] + 1 >= MSG_ID_BASE:
+        raise InputError(description='Channel is full')
     timestamp = int(time.time())
-    msg_id = channel['channel_id'] * 10000 + channel['latest_msg_id'] + 1
+    msg_id = channel['channel_id'] * MSG_ID_BASE + channel['latest_msg_id'] + 1
     react_info = {
         'react_id' : 1,
         'u_ids' : [],
@@ -134,12 +283,12 @@ users = [
         'reset_code' : '',
         'profile_img_url' : '',
         'token' : '1', # for iteration 1
-        'channels' : [ ], # a list to store this user's channel(channel_id)
+        'channels' : view, # this user's channel(channel_id), see membership.py
     },
     {
         'u_id': 2,
         ...
-        'channels' : [ ], # a list to store this user's channel(channel_id)
+        'channels' : view, # this user's channel(channel_id), see membership.py
     },
 ]
 
@@ -149,7 +298,7 @@ channels = [
         'public' : True,
         'name' : 'test channel',
         'owner_members': [1, 2], # a list of u_id
-        'all_members': [1, 2], # a list of u_id
+        'all_members': view, # u_id of members [1, 2], see membership.py
         'messages' : [
             {
                 'message_id': 1,
@@ -160,6 +309,11 @@ channels = [
                 'is_pinned' : False
             },
         ],
+        'tombstones' : set(), # message_id of removed messages still in 'messages'
+        'compacting' : False, # True while a compaction is scheduled
+        'pinned' : {}, # message_id of pinned messages as keys, in pin order
+        'version' : 0, # bumped by every message mutation
+        'first_page' : None, # cached first page of messages, see page_cache.py
         'latest_msg_id' : an int start from 0
         'time_standupend' : 0,
         'standup_str' : '',
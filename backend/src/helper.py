@@ -1,7 +1,7 @@
 import jwt
 import string
 from random import randint
-from data import users, channels
+from data import users, channel_index, messages, roles, decoded_tokens
 
 SECRET = 'grape6'
 
@@ -35,6 +35,9 @@ def get_user_from_id(u_id):
         This will return uesr(dictionary) if u_id refers to a valid user in data,
         else return False.
     '''
+    # users are never removed, so a user is found at position u_id - 1
+    if isinstance(u_id, int) and 0 < u_id <= len(users) and users[u_id - 1]['u_id'] == u_id:
+        return users[u_id - 1]
     for user in users:
         if user['u_id'] == u_id:
             return user
@@ -56,19 +59,39 @@ def get_user_from_token(token):
     Raises:
         this will not raise any error
     '''
+    u_id = get_u_id_from_token(token)
+    if u_id is None:
+        return None
+    return get_user_from_id(u_id)
+
+def get_u_id_from_token(token):
+    '''
+    This is a simple helper function.
+    It will return the u_id of a login token, decoding each token only once.
+
+    Args:
+        param1: token
+
+    Returns:
+        This will return u_id(int) if token can be decoded and user has login,
+        else return None.
+    '''
+    if token in decoded_tokens:
+        return decoded_tokens[token]
     try:
         info = jwt.decode(token.encode('utf-8'), SECRET, algorithms=['HS256'])
-        if info['has_login'] is False:
-            return None
-        return get_user_from_id(info['u_id'])
     except:
         return None
+    u_id = info['u_id'] if info['has_login'] is True else None
+    decoded_tokens[token] = u_id
+    return u_id
 
 def get_channel_from_id(channel_id):
     '''
     This is a simple helper function.
     It will return a channel with given channel_id if it exists in data,
-    else return None
+    else return None. Channels are looked up in data.channel_index,
+    so it does not depend on the number of channels.
 
     Args:
         param1: channel_id
@@ -77,14 +100,35 @@ def get_channel_from_id(channel_id):
         This will return channel(dictionary) if token refers to a valid chanenl in data,
         else return False.
     '''
-    for channel in channels:
-        if channel['channel_id'] == channel_id:
-            return channel
-    return None
+    return channel_index.get(channel_id)
+
+def get_message_handle(message_id):
+    '''
+    This is a simple helper function.
+    It will return the handle of a sent message with given message_id
+    from the message index. Removed and not yet sent messages have no handle.
+    The message inside a handle is the stored record, so it can be
+    edited in place.
+
+    Args:
+        param1: message_id
+
+    Returns:
+        This will return a handle (dictionary) if message_id refers to
+        a sent message, else return None.
+        {
+            'message' : msg,
+            'channel' : channel,
+        }
+    '''
+    return messages.get(message_id)
 
 def is_user_an_owner(token, channel_id):
     '''
     this is a helper function to check ownership.
+    It is a single lookup in the role map data.roles, which is kept
+    current by channels_create, addowner, removeowner, leave, archive
+    and admin_userpermission_change.
 
     Args:
         param1: authorised user's token
@@ -94,13 +138,40 @@ def is_user_an_owner(token, channel_id):
         it will return True if user is the owner of channel or flockr,
         else return False
     '''
-    user = get_user_from_token(token)
-    channel = get_channel_from_id(channel_id)
-    if user['permission_id'] == 1:
-        return True
-    if user['u_id'] in channel['owner_members']:
-        return True
-    return False
+    role = roles.get(get_u_id_from_token(token))
+    if role is None:
+        return False
+    return role['global_owner'] or channel_id in role['owned']
+
+def live_messages(channel):
+    '''
+    This is a simple helper function.
+    It will return the messages of a channel which have not been removed,
+    oldest first. Removed messages stay in storage as tombstones
+    until the channel is compacted.
+
+    Args:
+        param1: channel
+
+    Returns:
+        This will return a list of messages
+    '''
+    tombstones = channel['tombstones']
+    if len(tombstones) == 0:
+        return list(channel['messages'])
+    return [msg for msg in channel['messages'] if msg['message_id'] not in tombstones]
+
+def touch_channel(channel):
+    '''
+    This is a simple helper function.
+    It must be called whenever a message of the channel is sent, edited,
+    removed, reacted or pinned, so caches built on the channel's messages
+    know they are stale.
+
+    Args:
+        param1: channel
+    '''
+    channel['version'] += 1
 
 def random_str_generate(length):
     '''
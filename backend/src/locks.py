@@ -0,0 +1,113 @@
+'''
+import threading for the lock primitives
+import contextmanager so locks can be used in `with` statements
+import channel_id_of to find the channel of a message
+
+Flask handlers and threading.Timer callbacks (message_send_later,
+standup_end) change channels concurrently. Every channel maps to one
+reader/writer lock of a fixed striped table, so reads of a channel run in
+parallel, writes to it are serialised, and channels on other stripes are
+never blocked. Nothing is allocated per channel.
+'''
+import threading
+from contextlib import contextmanager
+from message_ids import channel_id_of
+
+LOCK_STRIPES = 64
+
+class RWLock:
+    '''
+    A writer preferring reader/writer lock.
+    A thread holding the write lock may take the read or write lock again,
+    so helpers like append_msg_to_channel can lock on their own and still
+    be called by a function that already holds the lock.
+    A thread must not take the write lock while holding only the read lock.
+    '''
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = None
+        self.write_depth = 0
+        self.waiting_writers = 0
+
+    def acquire_read(self):
+        with self.cond:
+            if self.writer == threading.get_ident():
+                self.write_depth += 1
+                return
+            while self.writer is not None or self.waiting_writers > 0:
+                self.cond.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.cond:
+            if self.writer == threading.get_ident():
+                self.write_depth -= 1
+                return
+            self.readers -= 1
+            if self.readers == 0:
+                self.cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self.cond:
+            if self.writer == me:
+                self.write_depth += 1
+                return
+            self.waiting_writers += 1
+            while self.writer is not None or self.readers > 0:
+                self.cond.wait()
+            self.waiting_writers -= 1
+            self.writer = me
+            self.write_depth = 1
+
+    def release_write(self):
+        with self.cond:
+            self.write_depth -= 1
+            if self.write_depth == 0:
+                self.writer = None
+                self.cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+lock_table = [RWLock() for _ in range(LOCK_STRIPES)]
+
+def channel_lock(channel_id):
+    '''
+    This is a helper function to get the lock of a channel.
+
+    Args:
+        param1(int): channel_id
+
+    Returns:
+        It will return a RWLock
+    '''
+    return lock_table[hash(channel_id) % LOCK_STRIPES]
+
+def message_lock(message_id):
+    '''
+    This is a helper function to get the lock of the channel a message
+    belongs to, before the message is looked up.
+    create_new_msg keeps every id inside its channel's range, see message_ids.py.
+
+    Args:
+        param1(int): message_id
+
+    Returns:
+        It will return a RWLock
+    '''
+    return channel_lock(channel_id_of(message_id))
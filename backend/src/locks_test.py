@@ -0,0 +1,88 @@
+''' Test file for locks.py '''
+
+import threading
+import time
+from locks import RWLock, channel_lock, message_lock, LOCK_STRIPES
+from other import clear
+from data import users, channels
+from auth import auth_register, auth_login
+from channels import channels_create
+from message import message_send, message_send_later, message_remove
+from helper import live_messages
+
+def test_rwlock_readers_share():
+    '''
+    two threads can hold the read lock at the same time
+    '''
+    lock = RWLock()
+    both_inside = threading.Barrier(2, timeout=5)
+    def reader():
+        with lock.read():
+            both_inside.wait()
+    thread = threading.Thread(target=reader)
+    thread.start()
+    reader()
+    thread.join()
+    assert lock.readers == 0
+
+def test_rwlock_writer_excludes():
+    '''
+    a writer waits for readers and blocks new readers,
+    and the thread holding the write lock can lock again
+    '''
+    lock = RWLock()
+    order = []
+    lock.acquire_read()
+    def writer():
+        with lock.write():
+            with lock.write():
+                with lock.read():
+                    order.append('write')
+    thread = threading.Thread(target=writer)
+    thread.start()
+    while lock.waiting_writers == 0:
+        time.sleep(0.001)
+    order.append('read')
+    lock.release_read()
+    thread.join()
+    assert order == ['read', 'write']
+    assert lock.writer is None
+
+def test_lock_table():
+    '''
+    a message maps to the lock of its channel
+    '''
+    assert channel_lock(3) is channel_lock(3 + LOCK_STRIPES)
+    assert channel_lock(3) is not channel_lock(4)
+    assert message_lock(30007) is channel_lock(3)
+    # the last id a channel gives out, see create_new_msg
+    assert message_lock(19999) is channel_lock(1)
+
+def test_concurrent_send_unique_ids():
+    '''
+    messages sent from many threads, including timers, get unique ids
+    '''
+    clear()
+    auth_register('test1@test.com', 'password', 'user1', 'user1')
+    auth_login('test1@test.com', 'password')
+    channels_create(users[0]['token'], 'channel_1', True)
+    token = users[0]['token']
+
+    def sender():
+        for _ in range(50):
+            msg_id = message_send(token, 1, 'hello')['message_id']
+            message_remove(token, msg_id)
+            message_send(token, 1, 'hello')
+    threads = [threading.Thread(target=sender) for _ in range(8)]
+    later_id = message_send_later(token, 1, 'later', int(time.time()))['message_id']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    while later_id not in [msg['message_id'] for msg in live_messages(channels[0])]:
+        time.sleep(0.01)
+
+    msg_ids = [msg['message_id'] for msg in channels[0]['messages']]
+    assert len(msg_ids) == len(set(msg_ids))
+    assert len(live_messages(channels[0])) == 8 * 50 + 1
+    assert channels[0]['latest_msg_id'] == 8 * 100 + 1
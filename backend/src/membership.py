@@ -0,0 +1,246 @@
+'''
+import threading so both sides of the index change together
+import islice for paging through members without copying them
+import Bitmap for the members of very large channels
+
+This module is the single membership index between users and channels.
+user['channels'] and channel['all_members'] are read only views onto it,
+so the two sides can not drift apart.
+'''
+import threading
+from itertools import islice
+from bitmap import Bitmap
+
+# a channel's members are kept in a Bitmap once there are this many,
+# and back in a dict when it shrinks under half of it
+BITMAP_THRESHOLD = 10000
+
+# u_id -> {channel_id: None}, channel_id -> {u_id: None} or Bitmap of u_id
+# dicts are used as ordered sets, so members are listed in order of joining,
+# members in a Bitmap are listed in order of u_id
+user_channels = {}
+channel_users = {}
+# u_id -> number of times the user's channels changed, see membership_version
+user_versions = {}
+membership_lock = threading.Lock()
+
+class MembershipView:
+    '''
+    A read only, live view of one side of the membership index.
+    It supports `in`, len(), iteration, indexing and comparison with a list,
+    which is all the code reading user['channels'] and
+    channel['all_members'] needs.
+    '''
+    def __init__(self, index, key):
+        self.index = index
+        self.key = key
+
+    def members(self):
+        return self.index.get(self.key, {})
+
+    def __contains__(self, item):
+        return item in self.members()
+
+    def __iter__(self):
+        members = self.members()
+        if isinstance(members, Bitmap):
+            return iter(members)
+        return iter(list(members))
+
+    def __getitem__(self, index):
+        return list(self.members())[index]
+
+    def __len__(self):
+        return len(self.members())
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+def user_channels_view(u_id):
+    '''
+    This is a helper function to get the view stored in user['channels'].
+
+    Args:
+        param1(int): u_id
+
+    Returns:
+        It will return a MembershipView of channel_id
+    '''
+    return MembershipView(user_channels, u_id)
+
+def channel_users_view(channel_id):
+    '''
+    This is a helper function to get the view stored in channel['all_members'].
+
+    Args:
+        param1(int): channel_id
+
+    Returns:
+        It will return a MembershipView of u_id
+    '''
+    return MembershipView(channel_users, channel_id)
+
+def add_member(u_id, channel_id):
+    '''
+    This function adds a user to a channel, on both sides at once.
+
+    Args:
+        param1(int): u_id
+        param2(int): channel_id
+
+    Returns:
+        It will return True if the user was added,
+        False if the user was already a member
+    '''
+    with membership_lock:
+        members = channel_users.setdefault(channel_id, {})
+        if u_id in members:
+            return False
+        if isinstance(members, Bitmap):
+            members.add(u_id)
+        else:
+            members[u_id] = None
+            if len(members) >= BITMAP_THRESHOLD:
+                channel_users[channel_id] = Bitmap(members)
+        user_channels.setdefault(u_id, {})[channel_id] = None
+        user_versions[u_id] = user_versions.get(u_id, 0) + 1
+        return True
+
+def remove_member(u_id, channel_id):
+    '''
+    This function removes a user from a channel, on both sides at once.
+
+    Args:
+        param1(int): u_id
+        param2(int): channel_id
+
+    Returns:
+        It will return True if the user was removed,
+        False if the user was not a member
+    '''
+    with membership_lock:
+        members = channel_users.get(channel_id)
+        if members is None or u_id not in members:
+            return False
+        if isinstance(members, Bitmap):
+            members.discard(u_id)
+            if len(members) < BITMAP_THRESHOLD // 2:
+                channel_users[channel_id] = dict.fromkeys(members)
+        else:
+            del members[u_id]
+        del user_channels[u_id][channel_id]
+        user_versions[u_id] += 1
+        return True
+
+def drop_channel(channel_id):
+    '''
+    This function removes every member of a channel, on both sides at once.
+
+    Args:
+        param1(int): channel_id
+
+    Returns:
+        It will return a list of the former members' u_id
+    '''
+    with membership_lock:
+        members = list(channel_users.pop(channel_id, {}))
+        for u_id in members:
+            user_channels[u_id].pop(channel_id, None)
+            user_versions[u_id] += 1
+        return members
+
+def membership_version(u_id):
+    '''
+    This function gets the version of a user's channels, it changes
+    whenever the user joins or leaves a channel, so results cached
+    over the user's channels know they are stale.
+
+    Returns:
+        It will return an int
+    '''
+    return user_versions.get(u_id, 0)
+
+def is_member(u_id, channel_id):
+    '''
+    This function checks whether a user is a member of a channel.
+
+    Returns:
+        It will return True if the user is a member, else False
+    '''
+    return u_id in channel_users.get(channel_id, {})
+
+def channels_of(u_id):
+    '''
+    This function lists the channels a user is a member of.
+
+    Returns:
+        It will return a list of channel_id, in order of joining
+    '''
+    with membership_lock:
+        return list(user_channels.get(u_id, {}))
+
+def members_of(channel_id):
+    '''
+    This function lists the members of a channel.
+
+    Returns:
+        It will return a list of u_id, in order of joining
+    '''
+    with membership_lock:
+        return list(channel_users.get(channel_id, {}))
+
+def members_page(channel_id, start, stop):
+    '''
+    This function lists one page of the members of a channel,
+    reading the index directly instead of copying every member.
+
+    Returns:
+        It will return a list of u_id, the members from start to stop
+        in the same order as members_of
+    '''
+    with membership_lock:
+        return list(islice(channel_users.get(channel_id, {}), start, stop))
+
+def member_count(channel_id):
+    '''
+    This function counts the members of a channel.
+
+    Returns:
+        It will return the number of members
+    '''
+    return len(channel_users.get(channel_id, {}))
+
+def shared_members(channel_id_a, channel_id_b):
+    '''
+    This function finds the users who are members of both channels,
+    e.g. for invite suggestions. Two large channels are intersected
+    chunk by chunk on their bitmaps, otherwise the smaller channel
+    is checked against the other one.
+
+    Args:
+        param1(int): channel_id
+        param2(int): channel_id
+
+    Returns:
+        It will return a Bitmap of u_id, which supports len() and iteration
+    '''
+    with membership_lock:
+        members_a = channel_users.get(channel_id_a, {})
+        members_b = channel_users.get(channel_id_b, {})
+        if isinstance(members_a, Bitmap) and isinstance(members_b, Bitmap):
+            return members_a & members_b
+        if len(members_a) > len(members_b):
+            members_a, members_b = members_b, members_a
+        return Bitmap(u_id for u_id in members_a if u_id in members_b)
+
+def reset_membership():
+    '''
+    This is a helper function to empty the index when data is cleared.
+    '''
+    with membership_lock:
+        user_channels.clear()
+        channel_users.clear()
+        user_versions.clear()
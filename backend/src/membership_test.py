@@ -0,0 +1,143 @@
+''' Test file for membership.py '''
+
+import threading
+import pytest
+from other import clear
+from data import users, channels
+from auth import auth_register, auth_login
+from channels import channels_create, channels_list
+from channel import channel_join, channel_invite, channel_leave
+from membership import add_member, remove_member, is_member, channels_of, members_of
+from membership import member_count, shared_members, members_page
+from bitmap import Bitmap
+import membership
+
+@pytest.fixture
+def initial_data():
+    '''
+    register 3 users, user 1 creates channel 1 and user 3 creates channel 2
+    '''
+    clear()
+    for idx in range(3):
+        email = 'test' + str(idx + 1) + '@test.com'
+        auth_register(email, 'password', 'user', 'user')
+        auth_login(email, 'password')
+    channels_create(users[0]['token'], 'channel_1', True)
+    channels_create(users[2]['token'], 'channel_2', True)
+
+def test_membership_index(initial_data):
+    '''
+    both sides of the index change together and the views follow them
+    '''
+    assert channels_of(1) == [1]
+    assert members_of(1) == [1]
+    channel_join(users[1]['token'], 1)
+    channel_invite(users[2]['token'], 2, 2)
+    assert channels_of(2) == [1, 2]
+    assert members_of(1) == [1, 2]
+    assert is_member(2, 2) is True
+    assert users[1]['channels'] == [1, 2]
+    assert 2 in channels[0]['all_members']
+    assert len(channels[1]['all_members']) == 2
+
+    channel_leave(users[1]['token'], 1)
+    assert channels_of(2) == [2]
+    assert members_of(1) == [1]
+    assert is_member(2, 1) is False
+    assert users[1]['channels'] == [2]
+    assert 2 not in channels[0]['all_members']
+
+def test_membership_add_remove(initial_data):
+    '''
+    adding twice or removing a non member changes nothing
+    '''
+    assert add_member(2, 1) is True
+    assert add_member(2, 1) is False
+    assert remove_member(2, 1) is True
+    assert remove_member(2, 1) is False
+    assert remove_member(2, 100) is False
+    assert channels_of(2) == []
+    assert members_of(1) == [1]
+
+def test_membership_channels_list(initial_data):
+    '''
+    channels_list reads from the index, in order of joining
+    '''
+    channel_join(users[2]['token'], 1)
+    assert channels_list(users[2]['token']) == {
+        'channels' : [
+            {'channel_id' : 2, 'name' : 'channel_2'},
+            {'channel_id' : 1, 'name' : 'channel_1'},
+        ],
+    }
+
+def test_membership_concurrent(initial_data):
+    '''
+    concurrent joins and leaves keep both sides consistent
+    '''
+    def churn(u_id):
+        for _ in range(200):
+            add_member(u_id, 1)
+            remove_member(u_id, 1)
+        add_member(u_id, 1)
+    threads = [threading.Thread(target=churn, args=[u_id]) for u_id in range(10, 30)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(members_of(1)) == [1] + list(range(10, 30))
+    for u_id in range(10, 30):
+        assert channels_of(u_id) == [1]
+
+def test_membership_bitmap(initial_data, monkeypatch):
+    '''
+    a channel switches to a bitmap past the threshold and back
+    once it shrinks, without changing who is a member
+    '''
+    monkeypatch.setattr(membership, 'BITMAP_THRESHOLD', 10)
+    for u_id in range(20, 11, -1):
+        add_member(u_id, 1)
+    assert isinstance(membership.channel_users[1], Bitmap)
+    assert member_count(1) == 10
+    assert members_of(1) == [1] + list(range(12, 21))
+    assert 15 in channels[0]['all_members']
+    assert list(channels[0]['all_members']) == [1] + list(range(12, 21))
+    assert members_page(1, 2, 5) == [13, 14, 15]
+    assert channels_of(15) == [1]
+
+    remove_member(15, 1)
+    assert is_member(15, 1) is False
+    assert channels_of(15) == []
+    assert isinstance(membership.channel_users[1], Bitmap)
+    for u_id in range(12, 18):
+        remove_member(u_id, 1)
+    assert isinstance(membership.channel_users[1], dict)
+    assert members_of(1) == [1, 18, 19, 20]
+    assert members_page(1, 1, 10) == [18, 19, 20]
+    assert members_page(2, 0, 10) == [3]
+    assert members_page(3, 0, 10) == []
+
+def test_membership_shared_members(initial_data, monkeypatch):
+    '''
+    members of both channels, for small and large channels
+    '''
+    monkeypatch.setattr(membership, 'BITMAP_THRESHOLD', 10)
+    add_member(2, 2)
+    add_member(2, 1)
+    assert list(shared_members(1, 2)) == [2]
+    for u_id in range(100, 130):
+        add_member(u_id, 1)
+        if u_id % 2 == 0:
+            add_member(u_id, 2)
+    common = shared_members(1, 2)
+    assert len(common) == 16
+    assert list(common) == [2] + list(range(100, 130, 2))
+    assert len(shared_members(2, 3)) == 0
+
+def test_membership_clear(initial_data):
+    '''
+    clear empties the index
+    '''
+    clear()
+    assert membership.user_channels == {}
+    assert membership.channel_users == {}
@@ -0,0 +1,136 @@
+'''
+import re to find @handle mentions in a message
+import time to order the mentions of a user
+import threading to guard the index while it changes
+import bisect to keep every user's mentions sorted
+
+The mention index, used by notifications_get in other.py.
+Mentions are read from a message when it is sent (append_msg_to_channel,
+so sendlater and standup_end as well) and when it is edited, and are
+dropped when it is removed or its channel is archived.
+Handles are resolved through data.handle_index, and only members of the
+channel are notified. A user's mentions are kept sorted newest last by
+(time mentioned, message_id), so a page is read by bisecting to the cursor.
+'''
+import re
+import time
+import threading
+from bisect import bisect_left, insort
+from data import handle_index
+from membership import is_member
+
+# a handle can be followed by punctuation, but not by a letter or a digit
+MENTION = re.compile(r'@(\S+)')
+HANDLE_MIN = 3
+HANDLE_MAX = 20
+
+# u_id -> {'keys' : sorted list of (time mentioned, message_id),
+#          'live' : message_id -> its key}
+mention_index = {}
+# message_id -> set of u_id mentioned in it
+message_mentions = {}
+mention_lock = threading.Lock()
+
+def mentioned_users(text):
+    '''
+    This is a helper function to resolve the @handle mentions of a text.
+    The longest handle starting after each @ and not followed by a letter
+    or a digit is taken, so "@user1last," mentions user1last and
+    "@user1lastname" does not.
+
+    Args:
+        param1(str): message text
+
+    Returns:
+        It will return a set of u_id
+    '''
+    found = set()
+    for match in MENTION.finditer(text):
+        word = match.group(1)
+        for end in range(min(len(word), HANDLE_MAX), HANDLE_MIN - 1, -1):
+            if end < len(word) and word[end].isalnum():
+                continue
+            u_id = handle_index.get(word[:end])
+            if u_id is not None:
+                found.add(u_id)
+                break
+    return found
+
+def index_mentions(channel_id, message_id, text):
+    '''
+    This function records the mentions of a sent or edited message.
+    A user still mentioned after an edit keeps the place of the first mention.
+
+    Args:
+        param1(int): channel_id
+        param2(int): message_id
+        param3(str): message text
+    '''
+    mentioned = set(u_id for u_id in mentioned_users(text) if is_member(u_id, channel_id))
+    with mention_lock:
+        previous = message_mentions.get(message_id, set())
+        for u_id in previous - mentioned:
+            drop_mention(u_id, message_id)
+        key = (int(time.time()), message_id)
+        for u_id in mentioned - previous:
+            entry = mention_index.setdefault(u_id, {'keys' : [], 'live' : {}})
+            insort(entry['keys'], key)
+            entry['live'][message_id] = key
+        if len(mentioned) == 0:
+            message_mentions.pop(message_id, None)
+        else:
+            message_mentions[message_id] = mentioned
+
+def unindex_mentions(message_id):
+    '''
+    This function drops the mentions of a removed message.
+
+    Args:
+        param1(int): message_id
+    '''
+    with mention_lock:
+        for u_id in message_mentions.pop(message_id, set()):
+            drop_mention(u_id, message_id)
+
+def drop_mention(u_id, message_id):
+    '''
+    This is a helper function to drop one mention, under mention_lock.
+    '''
+    entry = mention_index[u_id]
+    key = entry['live'].pop(message_id)
+    del entry['keys'][bisect_left(entry['keys'], key)]
+
+def mention_key(u_id, message_id):
+    '''
+    This function gets the position of a mention, for a cursor.
+
+    Returns:
+        It will return (time mentioned, message_id),
+        or None if the user is not mentioned in the message
+    '''
+    return mention_index.get(u_id, {'live' : {}})['live'].get(message_id)
+
+def mentions_page(u_id, limit, before):
+    '''
+    This function reads a page of a user's mentions, newest first.
+
+    Args:
+        param1(int): u_id
+        param2(int): max number of mentions
+        param3(tuple): only mentions older than this key, None for the newest
+
+    Returns:
+        It will return a list of (time mentioned, message_id)
+    '''
+    with mention_lock:
+        keys = mention_index.get(u_id, {'keys' : []})['keys']
+        upper = len(keys) if before is None else bisect_left(keys, before)
+        return keys[max(0, upper - limit):upper][::-1]
+
+def reset_mentions():
+    '''
+    This is a helper function to empty the index when data is cleared.
+    '''
+    with mention_lock:
+        mention_index.clear()
+        message_mentions.clear()
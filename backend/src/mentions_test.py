@@ -0,0 +1,119 @@
+''' Test file for mentions.py and notifications_get in other.py '''
+
+import pytest
+from other import clear, notifications_get
+from data import users, handle_index
+from auth import auth_register, auth_login
+from user import user_profile_sethandle
+from channels import channels_create
+from channel import channel_join, channel_archive
+from message import message_send, message_edit, message_remove
+from standup import standup_end
+from data import channels
+from mentions import mentioned_users, mention_index
+from error import InputError, AccessError
+
+@pytest.fixture
+def initial_data():
+    '''
+    register 3 users, user 1 creates 2 channels, user 2 joins both
+    '''
+    clear()
+    for idx in range(1, 4):
+        auth_register('test' + str(idx) + '@test.com', 'password', 'user' + str(idx), 'last')
+        auth_login('test' + str(idx) + '@test.com', 'password')
+    channels_create(users[0]['token'], 'channel_1', True)
+    channels_create(users[0]['token'], 'channel_2', True)
+    channel_join(users[1]['token'], 1)
+    channel_join(users[1]['token'], 2)
+
+def notified(token, limit=None, cursor=None):
+    '''
+    message ids of a page of notifications
+    '''
+    page = notifications_get(token, limit, cursor)
+    return [item['message_id'] for item in page['notifications']], page['next_cursor']
+
+def test_mentioned_users(initial_data):
+    '''
+    handles are resolved through the handle index, with punctuation after them,
+    a handle followed by a letter or a digit is part of another word
+    '''
+    assert handle_index == {'user1last' : 1, 'user2last' : 2, 'user3last' : 3}
+    assert mentioned_users('hi @user2last, @user3last! @nobody @user1lastname') == {2, 3}
+    assert mentioned_users('user2last @ @us @user1last1') == set()
+    assert mentioned_users('@user1last\'s') == {1}
+    user_profile_sethandle(users[1]['token'], 'bob')
+    assert handle_index == {'user1last' : 1, 'bob' : 2, 'user3last' : 3}
+    assert mentioned_users('@user2last @bob.') == {2}
+    assert mentioned_users('@bobby @bob2') == set()
+    user_profile_sethandle(users[2]['token'], 'a' * 20)
+    assert mentioned_users('@' + 'a' * 21) == set()
+    assert mentioned_users('@' + 'a' * 20 + '!') == {3}
+    with pytest.raises(InputError):
+        user_profile_sethandle(users[0]['token'], 'bob')
+
+def test_notifications_standard(initial_data):
+    '''
+    send, edit, remove, standup_end and archive keep the notifications current
+    '''
+    token = users[1]['token']
+    first = message_send(users[0]['token'], 1, 'hello @user2last')['message_id']
+    message_send(users[0]['token'], 1, 'hello @user3last')
+    second = message_send(users[0]['token'], 2, '@user2last again')['message_id']
+    page = notifications_get(token)
+    assert page == {
+        'notifications' : [
+            {'channel_id' : 2, 'message_id' : second,
+             'notification_message' : 'user1last tagged you in channel_2: @user2last again'},
+            {'channel_id' : 1, 'message_id' : first,
+             'notification_message' : 'user1last tagged you in channel_1: hello @user2last'},
+        ],
+        'next_cursor' : -1,
+    }
+    # user 3 is not a member of channel 1
+    assert notified(users[2]['token']) == ([], -1)
+
+    message_edit(users[0]['token'], first, 'hello again @user2last')
+    assert notified(token) == ([second, first], -1)
+    message_edit(users[0]['token'], first, 'hello')
+    assert notified(token) == ([second], -1)
+    message_remove(users[0]['token'], second)
+    assert notified(token) == ([], -1)
+
+    channels[0]['standup_msg'] = '\nuser1last: ping @user2last'
+    standup_end(users[0], channels[0])
+    assert len(notified(token)[0]) == 1
+    channel_archive(users[0]['token'], 1)
+    assert notified(token) == ([], -1)
+    assert mention_index[2] == {'keys' : [], 'live' : {}}
+
+def test_notifications_pages(initial_data):
+    '''
+    notifications are paged newest first with limit and cursor
+    '''
+    sent = [message_send(users[0]['token'], 1 + idx % 2, '@user2last ' + str(idx))['message_id']
+            for idx in range(7)]
+    token = users[1]['token']
+    found = []
+    cursor = None
+    while cursor != -1:
+        page, cursor = notified(token, 3, cursor)
+        assert len(page) <= 3
+        found += page
+    assert sorted(found) == sorted(sent)
+    assert notified(token)[0] == found
+
+def test_notifications_errors(initial_data):
+    '''
+    1. input error when the limit is not positive
+    2. input error when the cursor is not a notification of the user
+    3. access error when given token is invalid
+    '''
+    message_send(users[0]['token'], 1, '@user2last')
+    with pytest.raises(InputError):
+        notifications_get(users[1]['token'], 0)
+    with pytest.raises(InputError):
+        notifications_get(users[0]['token'], 3, 10001)
+    with pytest.raises(AccessError):
+        notifications_get('invalid_token')
@@ -2,13 +2,35 @@
 import users and channels from data to manipulate data
 import error for error raising
 import datatime for creating timestamp
+import stream for pushing message events to listeners
+import locks so mutators hold the channel's write lock
+import search_index to keep message words searchable
+import search_parallel so edited and removed messages leave the search segments
+import mentions to notify users mentioned with @handle
+import unread to keep the unread counters current
+import stats to count messages for the workspace statistics
 '''
 import threading
 import time
-from data import create_new_msg
+from data import create_new_msg, messages, edit_history
+from helper import get_message_handle, touch_channel
+from stream import publish
+from locks import channel_lock, message_lock
+from search_index import index_message, unindex_message, record_time
+from search_parallel import segment_changed
+from mentions import index_mentions, unindex_mentions
+from unread import count_message, uncount_message, mark_read
+from stats import count_sent, count_removed
 from helper import get_channel_from_id, get_user_from_token, is_user_an_owner
 from error import InputError, AccessError
 
+# a channel is compacted once this share of its stored messages are tombstones
+TOMBSTONE_RATIO = 0.25
+# and it holds at least this many tombstones
+MIN_TOMBSTONES = 64
+# seconds to wait before compacting, so a burst of removes is compacted once
+COMPACT_DELAY = 1
+
 def message_send(token, channel_id, message):
     '''
     This function will send a message from authorised_user
@@ -28,7 +50,8 @@ def message_send(token, channel_id, message):
 
     Raises:
         InputError:
-            Message is more than 1000 characters
+            1. Message is more than 1000 characters
+            2. the channel has taken 9999 messages, see create_new_msg
         AccessError:
             1. given token does not refer to a valid user
             2. the authorised user has not joined the channel with channel_id
@@ -47,10 +70,12 @@ def message_send(token, channel_id, message):
     if auth_user['u_id'] not in channel['all_members']:
         raise AccessError(description='User is not a member of channel.')
 
-    #Send message
-    new_msg = create_new_msg(message, channel, auth_user['u_id'])
-    channel['latest_msg_id'] += 1
-    channel['messages'].append(new_msg)
+    #Send message, the id is taken and used under the channel's write lock
+    with channel_lock(channel_id).write():
+        new_msg = create_new_msg(message, channel, auth_user['u_id'])
+        channel['latest_msg_id'] += 1
+        record_time(channel_id, new_msg['time_created'])
+        append_msg_to_channel(new_msg, channel)
     return {
         'message_id': new_msg['message_id']
     }
@@ -74,30 +99,44 @@ def message_remove(token, message_id):
             2. Message with message_id was sent by the authorised user making this request
             3. The authorised user is an owner of this channel or the flockr
     '''
-    auth_user = get_user_from_token(token)
-    msg_info = get_message_info(message_id)
-
-    # access error when given token does not refer to a valid user
-    if auth_user is None:
-        raise AccessError(description='Invalid token.')
-
-    # input error when given message_id does not refer to a valid message
-    if msg_info is None:
-        raise InputError(description='Invalid message ID.')
-
-    # access error when auth user does not have permission
-    permittd = False
-    if msg_info['u_id'] == auth_user['u_id']:
-        permittd = True
-    if is_user_an_owner(token, msg_info['channel_id']) is True:
-        permittd = True
-    if permittd is False:
-        raise AccessError(description='User must be an owner.')
-
-    # do remove work
-    msg_info['msg_list'].remove(msg_info['message'])
-    return {
-    }
+    with message_lock(message_id).write():
+        auth_user = get_user_from_token(token)
+        msg_info = get_message_info(message_id)
+
+        # access error when given token does not refer to a valid user
+        if auth_user is None:
+            raise AccessError(description='Invalid token.')
+
+        # input error when given message_id does not refer to a valid message
+        if msg_info is None:
+            raise InputError(description='Invalid message ID.')
+
+        # access error when auth user does not have permission
+        permittd = False
+        if msg_info['u_id'] == auth_user['u_id']:
+            permittd = True
+        if is_user_an_owner(token, msg_info['channel_id']) is True:
+            permittd = True
+        if permittd is False:
+            raise AccessError(description='User must be an owner.')
+
+        # do remove work, the message stays in storage as a tombstone
+        channel = msg_info['channel']
+        channel['tombstones'].add(message_id)
+        unindex_message(msg_info['channel_id'], message_id, msg_info['message']['message'],
+                        msg_info['message']['u_id'])
+        unindex_mentions(message_id)
+        segment_changed(msg_info['channel_id'], message_id)
+        uncount_message(msg_info['channel_id'], message_id)
+        count_removed(msg_info['channel_id'])
+        channel['pinned'].pop(message_id, None)
+        messages.pop(message_id, None)
+        edit_history.pop(message_id, None)
+        touch_channel(channel)
+        schedule_compaction(channel)
+        publish(msg_info['channel_id'], 'message_remove', {'message_id' : message_id})
+        return {
+        }
 
 def message_edit(token, message_id, message):
     '''
@@ -113,6 +152,8 @@ def message_edit(token, message_id, message):
         it will return an empty dictionary
 
     Raises:
+        InputError:
+            Message (based on ID) does not exist
         AccessError:
             1. given token does not refer to a valid user
             2. Message with message_id was sent by the authorised user making this request
@@ -124,32 +165,47 @@ def message_edit(token, message_id, message):
         return {
         }
 
-    auth_user = get_user_from_token(token)
-    msg_info = get_message_info(message_id)
-    # access error when given token does not refer to a valid user
-    if auth_user is None:
-        raise AccessError(description='Invalid token')
-
-    # access error when auth user does not have permission
-    permittd = False
-    if msg_info['u_id'] == auth_user['u_id']:
-        permittd = True
-    if is_user_an_owner(token, msg_info['channel_id']) is True:
-        permittd = True
-    if permittd is False:
-        raise AccessError(description='User must be an owner')
-
-    # do edit work
-    for msg in msg_info['msg_list']:
-        if msg['message_id'] == message_id:
-            msg['message'] = message
-    return {
-    }
+    with message_lock(message_id).write():
+        auth_user = get_user_from_token(token)
+        handle = get_message_handle(message_id)
+        # access error when given token does not refer to a valid user
+        if auth_user is None:
+            raise AccessError(description='Invalid token')
+
+        # input error when given message_id does not refer to a valid message
+        if handle is None:
+            raise InputError(description='Invalid message ID.')
+
+        # access error when auth user does not have permission
+        msg = handle['message']
+        permittd = False
+        if msg['u_id'] == auth_user['u_id']:
+            permittd = True
+        if is_user_an_owner(token, handle['channel']['channel_id']) is True:
+            permittd = True
+        if permittd is False:
+            raise AccessError(description='User must be an owner')
+
+        # do edit work in place, keeping the previous text in the side table
+        edit_history.setdefault(message_id, []).append((int(time.time()), msg['message']))
+        unindex_message(handle['channel']['channel_id'], message_id, msg['message'])
+        msg['message'] = message
+        index_message(handle['channel']['channel_id'], message_id, message)
+        index_mentions(handle['channel']['channel_id'], message_id, message)
+        segment_changed(handle['channel']['channel_id'], message_id)
+        touch_channel(handle['channel'])
+        publish(handle['channel']['channel_id'], 'message_edit', {
+            'message_id' : message_id,
+            'message' : message,
+        })
+        return {
+        }
 
 def get_message_info(message_id):
     '''
     This is a helper function.
-    It will return a message with given message_id
+    It will return a message with given message_id from the message index.
+    Removed messages (tombstones) are treated as not existing.
 
     Args:
         param1: target message_id
@@ -164,22 +220,20 @@ def get_message_info(message_id):
             'msg_list' : channel['messages'],
         }
     '''
-    channel_id = int(str(message_id)[:-4])
-    channel = get_channel_from_id(channel_id)
-    if channel is None:
+    handle = get_message_handle(message_id)
+    if handle is None:
         return None
-    for msg in channel['messages']:
-        if msg['message_id'] == message_id:
-            return {
-                'message' : msg,
-                'u_id' : msg['u_id'],
-                'channel_id' : channel_id,
-                'msg_list' : channel['messages'],
-                'channel' : channel,
-                'reacts' : msg['reacts'],
-                'is_pinned' : msg['is_pinned'],
-            }
-    return None
+    msg = handle['message']
+    channel = handle['channel']
+    return {
+        'message' : msg,
+        'u_id' : msg['u_id'],
+        'channel_id' : channel['channel_id'],
+        'msg_list' : channel['messages'],
+        'channel' : channel,
+        'reacts' : msg['reacts'],
+        'is_pinned' : msg['is_pinned'],
+    }
 
 def message_send_later(token, channel_id, message, time_sent):
     '''
@@ -200,6 +254,7 @@ def message_send_later(token, channel_id, message, time_sent):
             - Channel_id is invalid
             - Message is more than 1000 characters
             - Time sent is a time in the past
+            - The channel has taken 9999 messages, see create_new_msg
 
         AccessError if:
             - when the authorised use hasn't joined the channel
@@ -227,8 +282,10 @@ def message_send_later(token, channel_id, message, time_sent):
         raise InputError(description='past time given')
 
     ### Initiate timer for message_send function
-    new_msg = create_new_msg(message, channel, auth_user['u_id'])
-    channel['latest_msg_id'] += 1
+    with channel_lock(channel_id).write():
+        new_msg = create_new_msg(message, channel, auth_user['u_id'])
+        channel['latest_msg_id'] += 1
+        record_time(channel_id, new_msg['time_created'])
     timer = threading.Timer(countdown, append_msg_to_channel, args=[new_msg, channel])
     timer.start()
     return {
@@ -258,32 +315,34 @@ def message_react(token, message_id, react_id):
         AccessError:
             given token is invalid
     '''
-    auth_user = get_user_from_token(token)
-    msg_info = get_message_info(message_id)
-    # access error when given token is invalid
-    if auth_user is None:
-        raise AccessError(description='Invalid token')
-    # input error when given message_id is invalid
-    if msg_info is None:
-        raise InputError(description='Invalid message_id')
-
-    channel = msg_info['channel']
-    ### InputError: User is not part of channel with the message
-    if auth_user['u_id'] not in channel['all_members']:
-        raise InputError(description='User is not a member of channel.')
-
-    ### InputError: React ID invalid (not 1)
-    if react_id != 1:
-        raise InputError(description='Invalid react_id')
-
-    ### InputError: React ID already contained by user
-    if auth_user['u_id'] in msg_info['reacts'][0]['u_ids']:
-        raise InputError(description='user has already reacted')
-
-    ### react to message
-    msg_info['reacts'][0]['u_ids'].append(auth_user['u_id'])
-    return {
-    }
+    with message_lock(message_id).write():
+        auth_user = get_user_from_token(token)
+        msg_info = get_message_info(message_id)
+        # access error when given token is invalid
+        if auth_user is None:
+            raise AccessError(description='Invalid token')
+        # input error when given message_id is invalid
+        if msg_info is None:
+            raise InputError(description='Invalid message_id')
+
+        channel = msg_info['channel']
+        ### InputError: User is not part of channel with the message
+        if auth_user['u_id'] not in channel['all_members']:
+            raise InputError(description='User is not a member of channel.')
+
+        ### InputError: React ID invalid (not 1)
+        if react_id != 1:
+            raise InputError(description='Invalid react_id')
+
+        ### InputError: React ID already contained by user
+        if auth_user['u_id'] in msg_info['reacts'][0]['u_ids']:
+            raise InputError(description='user has already reacted')
+
+        ### react to message
+        msg_info['reacts'][0]['u_ids'].append(auth_user['u_id'])
+        touch_channel(channel)
+        return {
+        }
 
 def message_unreact(token, message_id, react_id):
     '''
@@ -307,32 +366,34 @@ def message_unreact(token, message_id, react_id):
         AccessError:
             given token is invalid
     '''
-    auth_user = get_user_from_token(token)
-    msg_info = get_message_info(message_id)
-    # access error when given token is invalid
-    if auth_user is None:
-        raise AccessError(description='Invalid token')
-    # input error when given message_id is invalid
-    if msg_info is None:
-        raise InputError(description='Invalid message_id')
-
-    channel = msg_info['channel']
-    ### InputError: User is not part of channel with the message
-    if auth_user['u_id'] not in channel['all_members']:
-        raise InputError(description='User is not a member of channel.')
-
-    ### InputError: React ID invalid (not 1)
-    if react_id != 1:
-        raise InputError(description='Invalid react_id')
-
-    ### InputError: React ID not containd by user
-    if auth_user['u_id'] not in msg_info['reacts'][0]['u_ids']:
-        raise InputError(description='user hasnt reacted')
-
-    ### unreact to message
-    msg_info['reacts'][0]['u_ids'].remove(auth_user['u_id'])
-    return {
-    }
+    with message_lock(message_id).write():
+        auth_user = get_user_from_token(token)
+        msg_info = get_message_info(message_id)
+        # access error when given token is invalid
+        if auth_user is None:
+            raise AccessError(description='Invalid token')
+        # input error when given message_id is invalid
+        if msg_info is None:
+            raise InputError(description='Invalid message_id')
+
+        channel = msg_info['channel']
+        ### InputError: User is not part of channel with the message
+        if auth_user['u_id'] not in channel['all_members']:
+            raise InputError(description='User is not a member of channel.')
+
+        ### InputError: React ID invalid (not 1)
+        if react_id != 1:
+            raise InputError(description='Invalid react_id')
+
+        ### InputError: React ID not containd by user
+        if auth_user['u_id'] not in msg_info['reacts'][0]['u_ids']:
+            raise InputError(description='user hasnt reacted')
+
+        ### unreact to message
+        msg_info['reacts'][0]['u_ids'].remove(auth_user['u_id'])
+        touch_channel(channel)
+        return {
+        }
 
 def message_pin(token, message_id):
     '''
@@ -354,30 +415,33 @@ def message_pin(token, message_id):
             1. The authorised user is not a member of the channel that the message is within
             2. The authorised user is not an owner
     '''
-    auth_user = get_user_from_token(token)
-    msg_info = get_message_info(message_id)
-    # access error when given token is invalid
-    if auth_user is None:
-        raise AccessError(description='Invalid token')
-    # input error when given message_id is invalid
-    if msg_info is None:
-        raise InputError(description='Invalid message_id')
-
-    ### AccessError if user is not a member of the channel that the message is within
-    if auth_user['u_id'] not in msg_info['channel']['all_members']:
-        raise AccessError(description='Not a member of the channel that the message is within')
-
-    ### AccessError if user is not an owner of the channel
-    if is_user_an_owner(token, msg_info['channel_id']) is False:
-        raise AccessError(description='User isnt an owner of the channel')
-
-    ### InputError if message_id is already pinned
-    if msg_info['is_pinned'] is True:
-        raise InputError(description='Message already pinned')
-
-    ### Pin message
-    msg_info['message']['is_pinned'] = True
-    return {}
+    with message_lock(message_id).write():
+        auth_user = get_user_from_token(token)
+        msg_info = get_message_info(message_id)
+        # access error when given token is invalid
+        if auth_user is None:
+            raise AccessError(description='Invalid token')
+        # input error when given message_id is invalid
+        if msg_info is None:
+            raise InputError(description='Invalid message_id')
+
+        ### AccessError if user is not a member of the channel that the message is within
+        if auth_user['u_id'] not in msg_info['channel']['all_members']:
+            raise AccessError(description='Not a member of the channel that the message is within')
+
+        ### AccessError if user is not an owner of the channel
+        if is_user_an_owner(token, msg_info['channel_id']) is False:
+            raise AccessError(description='User isnt an owner of the channel')
+
+        ### InputError if message_id is already pinned
+        if msg_info['is_pinned'] is True:
+            raise InputError(description='Message already pinned')
+
+        ### Pin message
+        msg_info['message']['is_pinned'] = True
+        msg_info['channel']['pinned'][message_id] = None
+        touch_channel(msg_info['channel'])
+        return {}
 
 def message_unpin(token, message_id):
     '''
@@ -398,37 +462,145 @@ def message_unpin(token, message_id):
             1. The authorised user is not a member of the channel that the message is within
             2. The authorised user is not an owner
     '''
-    auth_user = get_user_from_token(token)
-    msg_info = get_message_info(message_id)
-    # access error when given token is invalid
-    if auth_user is None:
-        raise AccessError(description='Invalid token')
-    # input error when given message_id is invalid
-    if msg_info is None:
-        raise InputError(description='Invalid message_id')
+    with message_lock(message_id).write():
+        auth_user = get_user_from_token(token)
+        msg_info = get_message_info(message_id)
+        # access error when given token is invalid
+        if auth_user is None:
+            raise AccessError(description='Invalid token')
+        # input error when given message_id is invalid
+        if msg_info is None:
+            raise InputError(description='Invalid message_id')
+
+        ### AccessError if user is not a member of the channel that the message is within
+        if auth_user['u_id'] not in msg_info['channel']['all_members']:
+            raise AccessError(description='Not a member of the channel that the message is within')
+
+        ### AccessError if user is not an owner of the channel
+        if is_user_an_owner(token, msg_info['channel_id']) is False:
+            raise AccessError(description='User isnt an owner of the channel')
+
+        ### InputError if message_id is already pinned
+        if msg_info['message']['is_pinned'] is False:
+            raise InputError(description='Message not pinned')
+
+        ### Unpin message
+        msg_info['message']['is_pinned'] = False
+        msg_info['channel']['pinned'].pop(message_id, None)
+        touch_channel(msg_info['channel'])
+        return {}
+
+def message_history(token, message_id):
+    '''
+    This function returns the previous versions of an edited message,
+    served from the edit history side table.
 
-    ### AccessError if user is not a member of the channel that the message is within
-    if auth_user['u_id'] not in msg_info['channel']['all_members']:
-        raise AccessError(description='Not a member of the channel that the message is within')
+    Args:
+        param1(str): authorised user's token
+        param2(int): id of target message
 
-    ### AccessError if user is not an owner of the channel
-    if is_user_an_owner(token, msg_info['channel_id']) is False:
-        raise AccessError(description='User isnt an owner of the channel')
+    Returns:
+        It will return a dict with the history, oldest first
+        {
+            'history' : [
+                {
+                    'message' : previous message,
+                    'time_edited' : unix timestamp of the edit,
+                },
+            ],
+        }
 
-    ### InputError if message_id is already pinned
-    if msg_info['message']['is_pinned'] is False:
-        raise InputError(description='Message not pinned')
+    Raises:
+        InputError:
+            message_id is not a valid message
+        AccessError:
+            1. given token is invalid
+            2. The authorised user is not a member of the channel that the message is within
+    '''
+    with message_lock(message_id).read():
+        auth_user = get_user_from_token(token)
+        handle = get_message_handle(message_id)
+        # access error when given token is invalid
+        if auth_user is None:
+            raise AccessError(description='Invalid token')
+        # input error when given message_id is invalid
+        if handle is None:
+            raise InputError(description='Invalid message_id')
+        # access error when user is not a member of the channel that the message is within
+        if auth_user['u_id'] not in handle['channel']['all_members']:
+            raise AccessError(description='Not a member of the channel that the message is within')
 
-    ### Pin message
-    msg_info['message']['is_pinned'] = False
-    return {}
+        return {
+            'history' : [
+                {
+                    'message' : old_message,
+                    'time_edited' : time_edited,
+                } for time_edited, old_message in edit_history.get(message_id, [])
+            ],
+        }
 
 def append_msg_to_channel(new_msg, channel):
     '''
-    This is a simple helper function to append msg to channel
+    This is a simple helper function to append msg to channel.
+    Every new message goes through here, so it is added to the message
+    index and listeners of the channel are notified here as well.
 
     Args:
         param1(dict): message to append
         param2(dict): target channel
     '''
-    channel['messages'].append(new_msg)
+    with channel_lock(channel['channel_id']).write():
+        # a message sent later to a channel archived since is dropped
+        if channel['archived'] is True:
+            return
+        channel['messages'].append(new_msg)
+        messages[new_msg['message_id']] = {
+            'message' : new_msg,
+            'channel' : channel,
+        }
+        index_message(channel['channel_id'], new_msg['message_id'], new_msg['message'],
+                      new_msg['u_id'])
+        index_mentions(channel['channel_id'], new_msg['message_id'], new_msg['message'])
+        count_message(channel['channel_id'], new_msg['message_id'])
+        # the sender has seen the channel up to its own message
+        mark_read(new_msg['u_id'], channel['channel_id'])
+        count_sent(channel['channel_id'], new_msg['u_id'])
+        touch_channel(channel)
+        publish(channel['channel_id'], 'message_new', new_msg)
+
+def schedule_compaction(channel):
+    '''
+    This is a helper function to start a background compaction of a channel
+    once enough of its stored messages are tombstones.
+    At most one compaction is scheduled per channel at a time.
+
+    Args:
+        param1(dict): target channel
+    '''
+    if channel['compacting'] is True:
+        return
+    num_tombstones = len(channel['tombstones'])
+    if num_tombstones < MIN_TOMBSTONES:
+        return
+    if num_tombstones < TOMBSTONE_RATIO * len(channel['messages']):
+        return
+    channel['compacting'] = True
+    timer = threading.Timer(COMPACT_DELAY, compact_channel, args=[channel])
+    timer.daemon = True
+    timer.start()
+
+def compact_channel(channel):
+    '''
+    This is a helper function to rewrite a channel's storage without
+    its tombstones. It holds the channel's write lock, so no message
+    is appended or removed while compacting.
+
+    Args:
+        param1(dict): target channel
+    '''
+    with channel_lock(channel['channel_id']).write():
+        removed = channel['tombstones']
+        channel['messages'] = [msg for msg in channel['messages']
+                               if msg['message_id'] not in removed]
+        channel['tombstones'] = set()
+        channel['compacting'] = False
@@ -244,6 +244,28 @@ def test_edit_invalid_token(url, initial_conditions):
     resp = requests.put(url + 'message/edit', json = data)
     assert resp.status_code == 400
 
+def test_edit_history(url, initial_conditions):
+    # history holds previous versions, oldest first
+    data = {
+        'token' : token_generate(2, 'login'),
+        'message_id' : 10001,
+        'message' : 'new message',
+    }
+    requests.put(url + 'message/edit', json = data)
+    params = {
+        'token' : token_generate(3, 'login'),
+        'message_id' : 10001,
+    }
+    resp = requests.get(url + 'message/history', params=params)
+    assert resp.status_code == 200
+    history = json.loads(resp.text)['history']
+    assert len(history) == 1
+    assert history[0]['message'] == 'message 1'
+    # unknown message
+    params['message_id'] = 10009
+    resp = requests.get(url + 'message/history', params=params)
+    assert resp.status_code == 400
+
 ### message sendlater tests
 def test_sendlater_standard(url, initial_conditions):
     #standard send
@@ -0,0 +1,22 @@
+'''
+The message_id scheme, with no imports so that low level modules like
+locks.py can read it.
+A message_id is channel_id * MSG_ID_BASE + its order in the channel,
+so a channel takes at most MSG_ID_BASE - 1 messages, see create_new_msg
+in data.py, and every message_id maps back to one channel.
+'''
+
+MSG_ID_BASE = 10000
+
+def channel_id_of(message_id):
+    '''
+    This is a simple helper function to get the channel a message_id
+    was given out by.
+
+    Args:
+        param1: message_id
+
+    Returns:
+        This will return a channel_id (int)
+    '''
+    return message_id // MSG_ID_BASE
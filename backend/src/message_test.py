@@ -4,10 +4,12 @@ import pytest
 import auth
 from other import clear
 from error import InputError, AccessError
-from message import message_send, message_edit, message_remove, message_send_later, message_react, message_unreact, message_pin, message_unpin
-from data import channels, users
+from message import message_send, message_edit, message_remove, message_send_later, message_react, message_unreact, message_pin, message_unpin, message_history
+from data import channels, users, messages
 from channels import channels_create
 from channel import channel_join
+from helper import live_messages, get_message_handle
+import message
 import time
 
 @pytest.fixture
@@ -82,12 +84,28 @@ def test_msg_send(initial_data):
     with pytest.raises(AccessError):
         message_send(users[2]['token'], 0, 'msg')
 
+def test_msg_send_channel_full(initial_data, initial_msgs):
+    '''
+    a channel takes 9999 messages, its 10000th id would be
+    the first id of the next channel
+    '''
+    channels[0]['latest_msg_id'] = 9998
+    last = message_send(users[0]['token'], channels[0]['channel_id'], 'last')['message_id']
+    assert last == 19999
+    with pytest.raises(InputError):
+        message_send(users[0]['token'], channels[0]['channel_id'], 'overflow')
+    with pytest.raises(InputError):
+        message_send_later(users[0]['token'], channels[0]['channel_id'], 'overflow',
+                           int(time.time()) + 1)
+    assert get_message_handle(20001)['message']['message'] == 'msg_3'
+    assert get_message_handle(20001)['channel'] is channels[1]
+
 def test_msg_remove(initial_data, initial_msgs):
     ''' test for msg_remove'''
     # 1. msg_remove works well
     message_remove(users[1]['token'], 10002)    # removed by sender
     message_send(users[0]['token'], channels[0]['channel_id'], 'msg_4')
-    all_messages = channels[0]['messages']
+    all_messages = live_messages(channels[0])
     assert len(all_messages) == 2
     assert all_messages[0]['u_id'] == users[0]['u_id']
     assert all_messages[0]['message'] == 'msg_1'
@@ -99,7 +117,7 @@ def test_msg_remove(initial_data, initial_msgs):
     message_remove(users[2]['token'], 20001) # removed by owner
     message_send(users[2]['token'], channels[1]['channel_id'], 'msg_5')
     message_send(users[2]['token'], channels[1]['channel_id'], 'msg_6')
-    all_messages = channels[1]['messages']
+    all_messages = live_messages(channels[1])
     assert len(all_messages) == 2
     assert all_messages[0]['u_id'] == users[2]['u_id']
     assert all_messages[0]['message'] == 'msg_5'
@@ -129,14 +147,14 @@ def test_msg_edit(initial_data, initial_msgs):
     # 1. msg_edit works well
     message_edit(users[0]['token'], 10001, 'msg_new')
     message_edit(users[1]['token'], 10002, '')
-    all_messages = channels[0]['messages']
+    all_messages = live_messages(channels[0])
     assert len(all_messages) == 1
     assert all_messages[0]['u_id'] == users[0]['u_id']
     assert all_messages[0]['message'] == 'msg_new'
     assert all_messages[0]['message_id'] == 10001
 
     message_edit(users[2]['token'], 20001, 'msg_new_2')
-    all_messages = channels[1]['messages']
+    all_messages = live_messages(channels[1])
     assert len(all_messages) == 1
     assert all_messages[0]['u_id'] == users[2]['u_id']
     assert all_messages[0]['message'] == 'msg_new_2'
@@ -152,6 +170,12 @@ def test_msg_edit(initial_data, initial_msgs):
     with pytest.raises(AccessError):
         message_edit(users[1]['token'], 10001, 'msg')
 
+    # 4. input error when message (based on ID) does not exist
+    with pytest.raises(InputError):
+        message_edit(users[0]['token'], 10002, 'msg')
+    with pytest.raises(InputError):
+        message_edit(users[0]['token'], 100002, 'msg')
+
 def test_msg_send_later_standard_1(initial_data, initial_msgs):
     '''
     no error
@@ -352,3 +376,76 @@ def test_pin_unpin_invalid_token(initial_data, initial_msgs):
         message_pin('invalid_token', 10001)
     with pytest.raises(AccessError):
         message_unpin('invalid_token', 10001)
+
+def test_msg_remove_tombstone(initial_data, initial_msgs):
+    '''
+    removed messages stay in storage as tombstones and
+    can not be removed, edited or reacted again
+    '''
+    message_remove(users[0]['token'], 10001)
+    assert len(channels[0]['messages']) == 2
+    assert channels[0]['tombstones'] == {10001}
+    assert [msg['message_id'] for msg in live_messages(channels[0])] == [10002]
+    with pytest.raises(InputError):
+        message_remove(users[0]['token'], 10001)
+    with pytest.raises(InputError):
+        message_react(users[0]['token'], 10001, 1)
+
+def test_msg_compaction(initial_data, monkeypatch):
+    '''
+    a channel is compacted in background once tombstones reach the ratio
+    '''
+    monkeypatch.setattr(message, 'MIN_TOMBSTONES', 2)
+    monkeypatch.setattr(message, 'COMPACT_DELAY', 0)
+    for idx in range(8):
+        message_send(users[0]['token'], 1, str(idx))
+    # 1 of 8 is below the ratio
+    message_remove(users[0]['token'], 10001)
+    assert channels[0]['compacting'] is False
+    assert channels[0]['tombstones'] == {10001}
+    # 2 of 8 reaches the ratio
+    message_remove(users[0]['token'], 10002)
+    end_time = time.time() + 2
+    while channels[0]['compacting'] is True and time.time() < end_time:
+        time.sleep(0.01)
+    assert channels[0]['compacting'] is False
+    assert channels[0]['tombstones'] == set()
+    assert [msg['message'] for msg in channels[0]['messages']] == [str(idx) for idx in range(2, 8)]
+
+def test_msg_compact_channel(initial_data, initial_msgs):
+    '''
+    compaction keeps live messages in order and new ids are not reused
+    '''
+    message_remove(users[0]['token'], 10001)
+    message.compact_channel(channels[0])
+    assert [msg['message_id'] for msg in channels[0]['messages']] == [10002]
+    assert channels[0]['tombstones'] == set()
+    message_send(users[0]['token'], 1, 'msg_4')
+    assert [msg['message_id'] for msg in channels[0]['messages']] == [10002, 10003]
+
+def test_msg_history(initial_data, initial_msgs):
+    '''
+    edits are applied through the message index and
+    the previous versions are kept until the message is removed
+    '''
+    assert messages[10001]['message'] is channels[0]['messages'][0]
+    assert messages[10001]['channel'] is channels[0]
+    assert message_history(users[1]['token'], 10001) == {'history' : []}
+    message_edit(users[0]['token'], 10001, 'msg_1_v2')
+    message_edit(users[0]['token'], 10001, 'msg_1_v3')
+    assert channels[0]['messages'][0]['message'] == 'msg_1_v3'
+    history = message_history(users[1]['token'], 10001)['history']
+    assert [old['message'] for old in history] == ['msg_1', 'msg_1_v2']
+    assert history[0]['time_edited'] <= history[1]['time_edited']
+
+    # 1. access error when given token is invalid
+    with pytest.raises(AccessError):
+        message_history('invalid_token', 10001)
+    # 2. access error when user is not a member of the channel
+    with pytest.raises(AccessError):
+        message_history(users[2]['token'], 10001)
+    # 3. input error when message does not exist or has been removed
+    message_remove(users[0]['token'], 10001)
+    assert 10001 not in messages
+    with pytest.raises(InputError):
+        message_history(users[0]['token'], 10001)
@@ -10,19 +10,63 @@
 
     auth module allows us to use auth_register() and auth_login() to register
     and log in test users
+
+    heapq merges the newest first matches of every channel into a page,
+    bisect finds where a page starts in a channel's candidates
+
+    mentions holds the @handle mentions read by notifications_get
+
+    stats holds the counters read by stats_workspace and stats_channel
 """
 
-from data import users, channels
+from heapq import merge
+from bisect import bisect_right
+from data import users, channels, channel_index, messages, edit_history, member_projections
+from data import roles, decoded_tokens, handle_index
+from data import channel_name_index, listall_pages, cold_storage, reset_channel_ids
+from message_ids import MSG_ID_BASE
 from error import InputError, AccessError
 from helper import get_user_from_token, get_user_from_id, get_channel_from_id
+from helper import get_message_handle
+from stream import reset_streams
+from membership import reset_membership, channels_of
+from snapshot import read_snapshot, channel_snapshot, reset_snapshots
+from search_index import candidate_messages, filter_candidates, last_before, reset_search_index
+from search_index import time_of
+from search_parallel import parallel_candidates, reset_segments
+from search_cache import search_key, cached_search, cache_search, reset_search_cache
+from mentions import mention_key, mentions_page, reset_mentions
+from unread import reset_unread
+from membership import member_count
+from stats import read_stats, count_active, reset_stats
 
 def clear():
     """
         Resets internal data of Flockr by removing all elements of "users" and 
-        "channels" lists in data module.
+        "channels" lists in data module, along with every index built on them.
     """
     users.clear()
     channels.clear()
+    channel_index.clear()
+    messages.clear()
+    edit_history.clear()
+    member_projections.clear()
+    roles.clear()
+    decoded_tokens.clear()
+    handle_index.clear()
+    channel_name_index.clear()
+    listall_pages.clear()
+    cold_storage.clear()
+    reset_channel_ids()
+    reset_membership()
+    reset_streams()
+    reset_snapshots()
+    reset_search_index()
+    reset_segments()
+    reset_search_cache()
+    reset_mentions()
+    reset_unread()
+    reset_stats()
     return {
     }
 
@@ -42,8 +86,20 @@ def users_all(token):
     if get_user_from_token(token) is None:
         raise AccessError(description="Unauthorised access")
 
+    # the snapshot is rebuilt only after a user has been added or changed
+    return {
+        'users': list(read_snapshot('users', user_details_all)),
+    }
+
+def user_details_all():
+    """
+        A helper function to get the details of every user for the users snapshot.
+
+        :return: A list of user details
+        :rtype: list of dict
+    """
     all_users = []
-    for user in users:
+    for user in list(users):
         user_details = {}
         user_details['u_id'] = user['u_id']
         user_details['email'] = user['email']
@@ -52,10 +108,7 @@ def users_all(token):
         user_details['handle_str'] = user['handle']
         user_details['profile_img_url'] = user['profile_img_url']
         all_users.append(user_details)
-
-    return {
-        'users': all_users,
-    }
+    return all_users
 
 def admin_userpermission_change(token, u_id, permission_id):
     """
@@ -92,38 +145,135 @@ def admin_userpermission_change(token, u_id, permission_id):
 
     # change permission of u_id user to permission_id
     user['permission_id'] = permission_id
+    roles[u_id]['global_owner'] = permission_id == 1
 
     return {
     }
 
-def search(token, query_str):
+def search(token, query_str, limit=None, cursor=None, filters=None):
     """
         Given a query string, return a collection of messages in all of the 
         channels that the user has joined that match that query.
+        With limit or cursor, one page of the matches is returned,
+        newest first, see search_page.
+        Filters are looked up in the search indexes, see filter_candidates.
 
         :param token: The token of an authorised Flockr user
         :type token: str
 
-        :param u_id: The user ID of the user whose permissions we want to change
-        :type u_id: int
+        :param query_str: The string to search the messages for
+        :type query_str: str
+
+        :param limit: The max number of messages in a page, None for no limit
+        :type limit: int
+
+        :param cursor: The next_cursor of the previous page, None for the first page
+        :type cursor: int
+
+        :param filters: Any of 'channel_ids' (list of channel_id to search in),
+        'u_id' (sender), 'time_start' and 'time_end' (time_created range,
+        both included) and 'pinned_only' (bool), None for no filters
+        :type filters: dict
 
         :return: A dictionary with nested list of messages containing
-        the query string
+        the query string. A page also has next_cursor, the cursor
+        of the next page, or -1 on the last page
         :rtype: dict with nested list
     """
 
     # check token validity
-    if get_user_from_token(token) is None:
+    user = get_user_from_token(token)
+    if user is None:
         raise AccessError(description="Unauthorised access")
 
+    # repeated searches are answered from the cache until a message of
+    # the user's channels changes or the user joins or leaves a channel
+    if filters is None:
+        filters = {}
+    after = search_cursor_key(cursor)
+    key = search_key(user['u_id'], query_str, limit, after, filters)
+    cached = cached_search(key)
+    if cached is not None:
+        return cached
+
+    if limit is not None or cursor is not None:
+        found = search_page(token, query_str, limit, after, filters)
+    else:
+        found = search_all(user, query_str, filters)
+    cache_search(key, found)
+    return found
+
+def search_candidates(user, query_str, filters, every_match=False):
+    """
+        A helper function to narrow a search down in the indexes.
+        Every candidate is still checked for the whole query string.
+        A search reading every match, with a pool of search workers,
+        has a scan or a large set of candidates checked by the workers
+        instead. A page stops reading as soon as it is full, so it is
+        read in this process.
+
+        :param user: The searching user
+        :type user: dict
+
+        :param query_str: The string to search the messages for
+        :type query_str: str
+
+        :param filters: The filters of search
+        :type filters: dict
+
+        :param every_match: True when every match will be read
+        :type every_match: bool
+
+        :return: The channel_id to search in and a dict channel_id ->
+        sorted message_id, or None when any message may match
+        :rtype: tuple
+    """
+    channel_ids = channels_of(user['u_id'])
+    if filters.get('channel_ids') is not None:
+        wanted = set(filters['channel_ids'])
+        channel_ids = [channel_id for channel_id in channel_ids if channel_id in wanted]
+    candidates = candidate_messages(channel_ids, query_str)
+    if every_match:
+        matches = parallel_candidates(channel_ids, query_str, candidates)
+        if matches is not None:
+            candidates = matches
+    candidates = filter_candidates(channel_ids, candidates, filters)
+    return channel_ids, candidates
+
+def search_all(user, query_str, filters):
+    """
+        A helper function to find every message matching a query, in the
+        channels of the user, in order of channel and of message_id.
+
+        :param user: The searching user
+        :type user: dict
+
+        :param query_str: The string to search the messages for
+        :type query_str: str
+
+        :param filters: The filters of search
+        :type filters: dict
+
+        :return: A dictionary with a list of messages
+        :rtype: dict with nested list
+    """
     result = []
-    user = get_user_from_token(token)
 
-    # search for messages with query string
-    for channel_id in user['channels']:
-        channel = get_channel_from_id(channel_id)
-        for message in channel['messages']:
-            if query_str in message['message']:
+    channel_ids, candidates = search_candidates(user, query_str, filters, True)
+    for channel_id in channel_ids:
+        if candidates is None:
+            # scan each channel's snapshot,
+            # sends and removes are never blocked by it
+            found = channel_snapshot(get_channel_from_id(channel_id))
+        else:
+            found = []
+            for message_id in candidates.get(channel_id, []):
+                handle = get_message_handle(message_id)
+                # the message may have been removed since the index was read
+                if handle is not None:
+                    found.append((handle['message']['message'], handle['message']))
+        for text, message in found:
+            if query_str in text:
                 if user['u_id'] in message['reacts'][0]['u_ids']:
                     message['reacts'][0]['is_this_user_reacted'] = True
                 else:
@@ -133,3 +283,303 @@ def search(token, query_str):
     return {
         'messages': result
     }
+
+def search_cursor_key(cursor):
+    """
+        A helper function to get the position of a search cursor,
+        matches after it in a page are older than it.
+        The cursor's time is read from the time column, so the next page
+        can still be read after the cursor's message is removed.
+
+        :param cursor: message_id of the last message of a page, or None
+        :type cursor: int
+
+        :return: (time_created, message_id) of the cursor, or None
+        :rtype: tuple
+    """
+    if cursor is None:
+        return None
+    time_created = time_of(cursor)
+    if time_created is None:
+        raise InputError(description="Invalid cursor")
+    return (time_created, cursor)
+
+def search_page(token, query_str, limit, after, filters=None):
+    """
+        Return a page of the messages matching a query, newest first,
+        in order of (time_created, message_id).
+
+        Every channel is read newest first, its message ids are given
+        in order of time_created, and the channels are merged on a heap.
+        Reading starts right after the cursor, found by bisecting, and
+        stops as soon as the page is full, so a page costs as much as its
+        own messages however deep the cursor is.
+
+        :param token: The token of an authorised Flockr user
+        :type token: str
+
+        :param query_str: The string to search the messages for
+        :type query_str: str
+
+        :param limit: The max number of messages in a page, None for no limit
+        :type limit: int
+
+        :param after: Position from search_cursor_key, only older messages
+        are listed, None for the first page
+        :type after: tuple
+
+        :param filters: The filters of search, None for no filters
+        :type filters: dict
+
+        :return: A dictionary with a list of messages and next_cursor
+        :rtype: dict with nested list
+    """
+    user = get_user_from_token(token)
+    if user is None:
+        raise AccessError(description="Unauthorised access")
+    if limit is not None and limit <= 0:
+        raise InputError(description="Limit must be positive")
+
+    if filters is None:
+        filters = {}
+    channel_ids, candidates = search_candidates(user, query_str, filters)
+    newest = []
+    for channel_id in channel_ids:
+        if candidates is None:
+            channel = get_channel_from_id(channel_id)
+            # archived since its members were read
+            if channel is None:
+                continue
+            message_ids = range(channel_id * MSG_ID_BASE + 1,
+                                channel_id * MSG_ID_BASE + channel['latest_msg_id'] + 1)
+        else:
+            message_ids = candidates.get(channel_id, [])
+        end = len(message_ids)
+        if after is not None:
+            end = bisect_right(message_ids, last_before(channel_id, after))
+        newest.append(newest_matches(message_ids, end, query_str))
+
+    page = []
+    next_cursor = -1
+    for message in merge(*newest, reverse=True,
+                         key=lambda msg: (msg['time_created'], msg['message_id'])):
+        if limit is not None and len(page) == limit:
+            next_cursor = page[-1]['message_id']
+            break
+        if user['u_id'] in message['reacts'][0]['u_ids']:
+            message['reacts'][0]['is_this_user_reacted'] = True
+        else:
+            message['reacts'][0]['is_this_user_reacted'] = False
+        page.append(message)
+
+    return {
+        'messages': page,
+        'next_cursor': next_cursor,
+    }
+
+def newest_matches(message_ids, end, query_str):
+    """
+        A helper generator of the messages of one channel matching a query,
+        newest first, read lazily from the message index.
+
+        :param message_ids: sorted message_id of the channel
+        :type message_ids: list or range
+
+        :param end: Only message_ids before this index are read
+        :type end: int
+    """
+    for idx in range(end - 1, -1, -1):
+        message_id = message_ids[idx]
+        handle = get_message_handle(message_id)
+        # removed or not yet sent
+        if handle is None:
+            continue
+        message = handle['message']
+        if query_str in message['message']:
+            yield message
+
+# notifications in a page when no limit is given
+NOTIFICATIONS_PAGE = 20
+
+def notifications_get(token, limit=None, cursor=None):
+    """
+        Return the messages the user was mentioned in with @handle,
+        newest first, a page at a time. Mentions are read from the
+        mention index, so a page costs the same however many messages
+        there are.
+
+        :param token: The token of an authorised Flockr user
+        :type token: str
+
+        :param limit: The max number of notifications in a page, 20 if None
+        :type limit: int
+
+        :param cursor: The next_cursor of the previous page, None for the first page
+        :type cursor: int
+
+        :return: A dictionary with a list of notifications (channel_id,
+        message_id & notification_message) and next_cursor, the cursor
+        of the next page, or -1 on the last page
+        :rtype: dict with nested list
+    """
+    user = get_user_from_token(token)
+    if user is None:
+        raise AccessError(description="Unauthorised access")
+    before = None
+    if cursor is not None:
+        before = mention_key(user['u_id'], cursor)
+        if before is None:
+            raise InputError(description="Invalid cursor")
+    page = notifications_page(token, limit, before)
+    return {
+        'notifications': page['notifications'],
+        'next_cursor': page['next_cursor'],
+    }
+
+def notifications_page(token, limit, before):
+    """
+        A helper function to read a page of notifications older than a
+        mention key, with the key of every notification.
+
+        :param token: The token of an authorised Flockr user
+        :type token: str
+
+        :param limit: The max number of notifications in a page, 20 if None
+        :type limit: int
+
+        :param before: Key from mention_key, only older mentions are
+        listed, None for the first page
+        :type before: tuple
+
+        :return: A dictionary with notifications, their keys and next_cursor
+        :rtype: dict with nested list
+    """
+    user = get_user_from_token(token)
+    if user is None:
+        raise AccessError(description="Unauthorised access")
+    if limit is None:
+        limit = NOTIFICATIONS_PAGE
+    if limit <= 0:
+        raise InputError(description="Limit must be positive")
+
+    keys = mentions_page(user['u_id'], limit + 1, before)
+    next_cursor = -1
+    if len(keys) > limit:
+        keys = keys[:limit]
+        next_cursor = keys[-1][1]
+    notifications = []
+    listed = []
+    for key in keys:
+        handle = get_message_handle(key[1])
+        # the message may have been removed since the index was read
+        if handle is None:
+            continue
+        listed.append(key)
+        msg = handle['message']
+        sender = get_user_from_id(msg['u_id'])
+        notifications.append({
+            'channel_id': handle['channel']['channel_id'],
+            'message_id': msg['message_id'],
+            'notification_message': '{} tagged you in {}: {}'.format(
+                sender['handle'], handle['channel']['name'], msg['message'][:20]),
+        })
+    return {
+        'notifications': notifications,
+        'keys': listed,
+        'next_cursor': next_cursor,
+    }
+
+def stats_workspace(token):
+    """
+        Return the statistics of the whole workspace: counts of users,
+        channels and messages, and per minute and per hour rollups of
+        messages sent, active users, joins, leaves and registrations.
+        Everything is read from counters kept as events happen, so no
+        message is read.
+
+        :param token: The token of an owner of Flockr
+        :type token: str
+
+        :return: A dictionary with users, channels, messages (live),
+        sent, joins, leaves, minutes (the last 60) and hours (the last 24),
+        buckets oldest first
+        :rtype: dict with nested list
+    """
+    return stats_workspace_counts(token)
+
+def stats_workspace_counts(token, now=None, senders=False):
+    """
+        A helper function to read the statistics of the workspace,
+        with the u_id of the senders of every bucket if asked for.
+
+        :param token: The token of an owner of Flockr
+        :type token: str
+
+        :param now: The time to read the buckets at, now if None
+        :type now: int
+
+        :param senders: True to read the u_id of the senders of every
+        bucket, to merge the buckets of several shards
+        :type senders: bool
+
+        :return: A dictionary as read_stats, with users and channels
+        :rtype: dict with nested list
+    """
+    user = get_user_from_token(token)
+    if user is None:
+        raise AccessError(description="Unauthorised access")
+    if user['permission_id'] != 1:
+        raise AccessError(description="User is not an admin")
+    counts = read_stats(None, now, senders)
+    counts['users'] = len(users)
+    counts['channels'] = len(channels)
+    return counts
+
+def workspace_summary(counts):
+    """
+        A helper function to count the active users of every bucket,
+        once the buckets of several shards are merged.
+
+        :param counts: The merged results of stats_workspace_counts, with senders
+        :type counts: dict
+
+        :return: The result of stats_workspace
+        :rtype: dict with nested list
+    """
+    return dict(counts, minutes=count_active(counts['minutes']),
+                hours=count_active(counts['hours']))
+
+def stats_channel(token, channel_id):
+    """
+        Return the statistics of a channel: counts of members and
+        messages, and per minute and per hour rollups of messages sent,
+        active users, joins and leaves, read from counters.
+
+        :param token: The token of a member of the channel or an owner of Flockr
+        :type token: str
+
+        :param channel_id: The channel
+        :type channel_id: int
+
+        :return: A dictionary with channel_id, members, messages (live),
+        sent, joins, leaves, minutes (the last 60) and hours (the last 24),
+        buckets oldest first
+        :rtype: dict with nested list
+    """
+    user = get_user_from_token(token)
+    if user is None:
+        raise AccessError(description="Unauthorised access")
+    channel = get_channel_from_id(channel_id)
+    if channel is None:
+        raise InputError(description="Invalid channel_id")
+    if user['u_id'] not in channel['all_members'] and user['permission_id'] != 1:
+        raise AccessError(description="Not a member")
+
+    counts = read_stats(channel_id)
+    counts['channel_id'] = channel_id
+    counts['members'] = member_count(channel_id)
+    for width in ['minutes', 'hours']:
+        # users register to the workspace, not to a channel
+        for bucket in counts[width]:
+            del bucket['registered']
+    return counts
@@ -260,3 +260,148 @@ def test_search_invalid_token(url, initial_data):
     data['token'] = 'invalid_token'
     resp = requests.get(url + 'search', params=data)
     assert resp.status_code == 400
+
+# 3. pages
+def test_search_pages(url, initial_data):
+    """
+        Test for search() with limit and cursor, newest first.
+
+        :param url: pytest fixture that starts the server and gets its URL
+        :type url: pytest fixture
+
+        :param initial_data: pytest fixture to create two users and a channel
+        :type initial_data: pytest fixture
+    """
+    msg_data = {
+        'token' : token_generate(1, 'login'),
+        'channel_id' : 1,
+        'message' : ''
+    }
+    for i in range(3):
+        msg_data['message'] = 'msg' + str(i + 1)
+        requests.post(url + 'message/send', json=msg_data)
+
+    search_data = {
+        'token' : token_generate(1, 'login'),
+        'query_str' : 'msg',
+        'limit' : 2,
+    }
+    resp = requests.get(url + 'search', params=search_data)
+    assert resp.status_code == 200
+    page = json.loads(resp.text)
+    assert [msg['message_id'] for msg in page['messages']] == [10003, 10002]
+    assert page['next_cursor'] == 10002
+    search_data['cursor'] = page['next_cursor']
+    page = json.loads(requests.get(url + 'search', params=search_data).text)
+    assert [msg['message_id'] for msg in page['messages']] == [10001]
+    assert page['next_cursor'] == -1
+    search_data['limit'] = 0
+    resp = requests.get(url + 'search', params=search_data)
+    assert resp.status_code == 400
+
+# 4. filters
+def test_search_filters(url, initial_data):
+    """
+        Test for search() with sender, channel, time and pinned filters.
+
+        :param url: pytest fixture that starts the server and gets its URL
+        :type url: pytest fixture
+
+        :param initial_data: pytest fixture to create two users and a channel
+        :type initial_data: pytest fixture
+    """
+    msg_data = {
+        'token' : token_generate(1, 'login'),
+        'channel_id' : 1,
+        'message' : ''
+    }
+    for i in range(3):
+        msg_data['message'] = 'msg' + str(i + 1)
+        requests.post(url + 'message/send', json=msg_data)
+    requests.post(url + 'message/pin', json={'token' : token_generate(1, 'login'),
+                                             'message_id' : 10002})
+
+    search_data = {
+        'token' : token_generate(1, 'login'),
+        'query_str' : 'msg',
+        'u_id' : 1,
+        'channel_ids' : [1],
+        'time_start' : 0,
+        'pinned_only' : 'true',
+    }
+    resp = requests.get(url + 'search', params=search_data)
+    assert resp.status_code == 200
+    assert [msg['message_id'] for msg in json.loads(resp.text)['messages']] == [10002]
+    search_data['u_id'] = 2
+    resp = requests.get(url + 'search', params=search_data)
+    assert json.loads(resp.text)['messages'] == []
+
+########################################
+######### notifications tests ##########
+########################################
+def test_notifications(url, initial_data):
+    """
+        Test for notifications_get() through /notifications.
+
+        :param url: pytest fixture that starts the server and gets its URL
+        :type url: pytest fixture
+
+        :param initial_data: pytest fixture to create two users and a channel
+        :type initial_data: pytest fixture
+    """
+    requests.post(url + 'channel/invite', json={'token' : token_generate(1, 'login'),
+                                                'channel_id' : 1, 'u_id' : 2})
+    msg_data = {
+        'token' : token_generate(1, 'login'),
+        'channel_id' : 1,
+        'message' : 'hi @name_firstname_last and @2name_firstname_last',
+    }
+    requests.post(url + 'message/send', json=msg_data)
+    resp = requests.get(url + 'notifications', params={'token' : token_generate(2, 'login')})
+    assert resp.status_code == 200
+    assert json.loads(resp.text) == {
+        'notifications' : [{
+            'channel_id' : 1,
+            'message_id' : 10001,
+            'notification_message' : 'name_firstname_last tagged you in channel: hi @name_firstname_l',
+        }],
+        'next_cursor' : -1,
+    }
+    resp = requests.get(url + 'notifications', params={'token' : 'invalid_token'})
+    assert resp.status_code == 400
+
+########################################
+############# stats tests ##############
+########################################
+def test_stats(url, initial_data):
+    """
+        Test for stats_workspace() and stats_channel() through /stats.
+
+        :param url: pytest fixture that starts the server and gets its URL
+        :type url: pytest fixture
+
+        :param initial_data: pytest fixture to create two users and a channel
+        :type initial_data: pytest fixture
+    """
+    msg_data = {
+        'token' : token_generate(1, 'login'),
+        'channel_id' : 1,
+        'message' : 'hello',
+    }
+    requests.post(url + 'message/send', json=msg_data)
+    requests.post(url + 'message/send', json=msg_data)
+    resp = requests.get(url + 'stats/workspace', params={'token' : token_generate(1, 'login')})
+    assert resp.status_code == 200
+    stats = json.loads(resp.text)
+    assert (stats['users'], stats['channels'], stats['messages']) == (2, 1, 2)
+    assert len(stats['minutes']) == 60
+    assert len(stats['hours']) == 24
+    resp = requests.get(url + 'stats/workspace', params={'token' : token_generate(2, 'login')})
+    assert resp.status_code == 400
+
+    resp = requests.get(url + 'stats/channel', params={'token' : token_generate(1, 'login'),
+                                                       'channel_id' : 1})
+    assert resp.status_code == 200
+    stats = json.loads(resp.text)
+    assert (stats['channel_id'], stats['members'], stats['messages']) == (1, 1, 2)
+    assert sum(bucket['sent'] for bucket in stats['hours']) == 2
@@ -6,7 +6,9 @@ from other import users_all, clear, search, admin_userpermission_change
 from auth import auth_login, auth_register
 from error import AccessError, InputError
 from channel import channel_join
-from message import message_send, message_react
+from message import message_send, message_react, message_remove
+from helper import get_message_handle
+from search_index import time_column
 
 @pytest.fixture
 def create_users():
@@ -325,3 +327,57 @@ def test_userpermission_standard(create_users):
 
     admin_userpermission_change(users[1]['token'], users[0]['u_id'], 2)
     assert users[0]['permission_id'] == 2
+
+def test_search_pages(create_users):
+    """
+        Test for paging of search(): matches are listed newest first,
+        limit pages at a time, for word and non word queries.
+
+        :param create_users: pytest fixture to create two test users
+        :type create_users: pytest fixture
+    """
+
+    channel_1 = channels_create(users[0]['token'], 'Channel 01', True)['channel_id']
+    channel_2 = channels_create(users[0]['token'], 'Channel 02', True)['channel_id']
+    sent = []
+    for idx in range(10):
+        channel_id = [channel_1, channel_2][idx % 3 == 0]
+        sent.append(message_send(users[0]['token'], channel_id, 'msg ' + str(idx))['message_id'])
+    # spread the messages over time, the channels interleave,
+    # the time column is kept in step as search bisects it
+    for idx, message_id in enumerate(sent):
+        get_message_handle(message_id)['message']['time_created'] = 1000 + idx
+        time_column[message_id // 10000][message_id % 10000 - 1] = 1000 + idx
+    message_send(users[0]['token'], channel_1, 'no match')
+
+    for query in ['msg', ' ']:
+        found = []
+        cursor = None
+        while cursor != -1:
+            page = search(users[0]['token'], query, 3, cursor)
+            assert len(page['messages']) <= 3
+            found += [msg['message_id'] for msg in page['messages']]
+            cursor = page['next_cursor']
+        if query == 'msg':
+            assert found == sent[::-1]
+        else:
+            assert found[1:] == sent[::-1]
+
+    assert search(users[0]['token'], 'msg 9', 1) == {
+        'messages' : [get_message_handle(sent[9])['message']],
+        'next_cursor' : -1,
+    }
+    with pytest.raises(InputError):
+        search(users[0]['token'], 'msg', 0)
+    with pytest.raises(InputError):
+        search(users[0]['token'], 'msg', 3, 99999)
+    with pytest.raises(InputError):
+        search(users[0]['token'], 'msg', 3, channel_1 * 10000 + 99)
+
+    # the next page is still read after the cursor's message is removed
+    page = search(users[0]['token'], 'msg', 3)
+    message_remove(users[0]['token'], page['next_cursor'])
+    page = search(users[0]['token'], 'msg', 3, page['next_cursor'])
+    assert [msg['message_id'] for msg in page['messages']] == sent[::-1][3:6]
+    with pytest.raises(AccessError):
+        search('invalid_token', 'msg', 3)
@@ -0,0 +1,93 @@
+'''
+import dumps to pre-serialise messages of the first page
+from itertools import islice for taking the newest messages
+
+The first page (start = 0) of channel_messages is what almost every
+request asks for. It is kept per channel in channel['first_page'] with
+each message already encoded as JSON, except for is_this_user_reacted
+which depends on the viewer and is spliced in per request.
+An entry is only used while its version matches channel['version'],
+which every message mutation bumps through touch_channel in helper.py.
+'''
+from itertools import islice
+from json import dumps
+
+PAGE_SIZE = 50
+# is_this_user_reacted as encoded by dumps, it can not occur in an
+# encoded message text because quotes in strings are escaped
+REACTED_KEY = '"is_this_user_reacted": '
+
+def first_page(channel):
+    '''
+    This is a helper function to get the cached first page of a channel,
+    building it if the channel has changed since it was cached.
+
+    Args:
+        param1(dict): target channel
+
+    Returns:
+        It will return a dict
+        {
+            'version' : channel['version'] the page was built at,
+            'messages' : up to 50 messages, newest first,
+            'fragments' : (json before flag, json after flag, reacted u_ids)
+                          for each message,
+            'total' : number of messages in the channel,
+            'end' : 50 or -1 when there are no more messages,
+        }
+    '''
+    page = channel['first_page']
+    if page is not None and page['version'] == channel['version']:
+        return page
+
+    # read the version first, a mutation while building makes this page stale
+    version = channel['version']
+    msg_list = channel['messages']
+    tombstones = channel['tombstones']
+    total = len(msg_list) - len(tombstones)
+    live_msgs = (msg for msg in reversed(msg_list) if msg['message_id'] not in tombstones)
+    page_msgs = list(islice(live_msgs, PAGE_SIZE))
+    page = {
+        'version' : version,
+        'messages' : page_msgs,
+        'fragments' : [encode_message(msg) for msg in page_msgs],
+        'total' : total,
+        'end' : -1 if PAGE_SIZE >= total else PAGE_SIZE,
+    }
+    channel['first_page'] = page
+    return page
+
+def first_page_json(channel, u_id):
+    '''
+    This is a helper function to get the JSON encoded first page of a channel
+    as seen by user with u_id. It gives the same text as dumps on the result
+    of channel_messages with start 0.
+
+    Args:
+        param1(dict): target channel
+        param2(int): viewer's u_id
+
+    Returns:
+        It will return a JSON string
+    '''
+    page = first_page(channel)
+    encoded = []
+    for before, after, reacted in page['fragments']:
+        encoded.append(before + ('true' if u_id in reacted else 'false') + after)
+    return ('{"messages": [' + ', '.join(encoded) + '], "start": 0, "end": '
+            + str(page['end']) + '}')
+
+def encode_message(msg):
+    '''
+    This is a helper function to encode a message once for every viewer.
+
+    Args:
+        param1(dict): message
+
+    Returns:
+        It will return a tuple (json before flag, json after flag, reacted u_ids)
+    '''
+    react = msg['reacts'][0]
+    encoded = dumps(dict(msg, reacts=[dict(react, is_this_user_reacted=None)]))
+    before, after = encoded.split(REACTED_KEY + 'null', 1)
+    return (before + REACTED_KEY, after, frozenset(react['u_ids']))
@@ -0,0 +1,99 @@
+''' Test file for page_cache.py '''
+
+import json
+import pytest
+from other import clear
+from data import users, channels
+from auth import auth_register, auth_login
+from channels import channels_create
+from channel import channel_join, channel_messages, channel_messages_json
+from message import message_send, message_edit, message_remove, message_react, message_pin
+from standup import standup_end
+from page_cache import first_page, first_page_json
+from error import InputError, AccessError
+
+@pytest.fixture
+def initial_data():
+    '''
+    register 3 users, user 1 creates a public channel and user 2 joins it
+    '''
+    clear()
+    auth_register('test1@test.com', 'password', 'user1', 'user1')
+    auth_login('test1@test.com', 'password')
+    auth_register('test2@test.com', 'password', 'user2', 'user2')
+    auth_login('test2@test.com', 'password')
+    auth_register('test3@test.com', 'password', 'user3', 'user3')
+    auth_login('test3@test.com', 'password')
+    channels_create(users[0]['token'], 'channel_1', True)
+    channel_join(users[1]['token'], channels[0]['channel_id'])
+
+def expected_json(token):
+    ''' first page encoded the uncached way '''
+    return json.dumps(channel_messages(token, 1, 0))
+
+def test_first_page_json_matches(initial_data):
+    '''
+    the cached text is the same as encoding channel_messages,
+    for each viewer and for awkward message text
+    '''
+    assert first_page_json(channels[0], 1) == expected_json(users[0]['token'])
+    for idx in range(60):
+        message_send(users[0]['token'], 1, str(idx))
+    message_send(users[1]['token'], 1, '"is_this_user_reacted": null')
+    message_send(users[1]['token'], 1, '"is_this_user_reacted": ')
+    message_react(users[1]['token'], 10061, 1)
+    for user in users[:2]:
+        assert channel_messages_json(user['token'], 1, 0) == expected_json(user['token'])
+    assert json.loads(channel_messages_json(users[1]['token'], 1, 0))['end'] == 50
+    assert channel_messages_json(users[1]['token'], 1, 50) == json.dumps(
+        channel_messages(users[1]['token'], 1, 50))
+
+def test_first_page_reused(initial_data):
+    '''
+    reading twice does not rebuild the page
+    '''
+    message_send(users[0]['token'], 1, 'msg')
+    page = first_page(channels[0])
+    assert first_page(channels[0]) is page
+    channel_messages_json(users[1]['token'], 1, 0)
+    assert channels[0]['first_page'] is page
+
+def test_first_page_invalidated(initial_data):
+    '''
+    every message mutation makes the cached page stale
+    '''
+    message_send(users[0]['token'], 1, 'msg_1')
+    message_send(users[0]['token'], 1, 'msg_2')
+    mutations = [
+        lambda: message_send(users[0]['token'], 1, 'msg_3'),
+        lambda: message_edit(users[0]['token'], 10001, 'msg_1_v2'),
+        lambda: message_react(users[1]['token'], 10001, 1),
+        lambda: message_pin(users[0]['token'], 10001),
+        lambda: message_remove(users[0]['token'], 10002),
+    ]
+    for mutation in mutations:
+        page = first_page(channels[0])
+        mutation()
+        assert first_page(channels[0]) is not page
+        for user in users[:2]:
+            assert channel_messages_json(user['token'], 1, 0) == expected_json(user['token'])
+
+    page = first_page(channels[0])
+    channels[0]['standup_msg'] = '\nuser1user1: hi'
+    standup_end(users[0], channels[0])
+    assert first_page(channels[0]) is not page
+    assert json.loads(channel_messages_json(users[0]['token'], 1, 0))['messages'][0][
+        'message'] == '\nuser1user1: hi'
+
+def test_first_page_errors(initial_data):
+    '''
+    same errors as channel_messages
+    '''
+    with pytest.raises(AccessError):
+        channel_messages_json('invalid_token', 1, 0)
+    with pytest.raises(InputError):
+        channel_messages_json(users[0]['token'], 2, 0)
+    with pytest.raises(AccessError):
+        channel_messages_json(users[2]['token'], 1, 0)
+    with pytest.raises(InputError):
+        channel_messages_json(users[0]['token'], 1, 1)
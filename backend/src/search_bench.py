@@ -0,0 +1,240 @@
+'''
+import argparse for the command line arguments
+import time for timing the searches
+import random for generating a reproducible corpus
+import tracemalloc for the peak memory of the searches
+import the data store helpers to fill it without going through the routes
+
+Benchmark of search in other.py. A workspace of users, channels and
+messages is generated straight into the data store, with words drawn from
+a vocabulary of Zipf distributed frequency, then search is timed for every
+type of query and p50 / p99 latency and peak memory are reported, next to
+a full scan of the same messages as search did before its indexes.
+The search cache is emptied before every search, so only real work is timed.
+
+Run from backend/, e.g.:
+    python3 src/search_bench.py --channels 100 --messages 2000
+'''
+import argparse
+import time
+import random
+import tracemalloc
+from bisect import insort
+from auth import token_generate
+from data import users, channels, channel_name_index
+from data import create_user, create_new_channel, create_new_msg, next_channel_id
+from membership import add_member, channels_of
+from message import append_msg_to_channel
+from other import clear, search
+from search_cache import reset_search_cache
+from search_index import record_time
+from snapshot import new_version
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+def make_vocabulary(size, rand):
+    '''
+    This function makes distinct lower case words of 3 to 9 letters,
+    the first one is the most frequent.
+
+    Returns:
+        It will return a list of str
+    '''
+    words = []
+    seen = set()
+    while len(words) < size:
+        word = ''.join(rand.choice(LETTERS) for _ in range(rand.randint(3, 9)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+def zipf_weights(size, exponent):
+    '''
+    This function gets the cumulative weights of a Zipf distribution,
+    the word of rank r is drawn with weight 1 / r ** exponent.
+
+    Returns:
+        It will return a list of float for random.choices
+    '''
+    cumulative = []
+    total = 0.0
+    for rank in range(1, size + 1):
+        total += 1 / rank ** exponent
+        cumulative.append(total)
+    return cumulative
+
+def build_workspace(num_users=50, num_channels=20, messages_per_channel=500,
+                    members_per_channel=10, vocabulary_size=5000, exponent=1.1,
+                    words_per_message=(3, 15), seed=1531):
+    '''
+    This function clears the data and generates a workspace into it.
+    Every message goes through append_msg_to_channel, so the indexes
+    are built as they would be by message_send.
+
+    Returns:
+        It will return a dict
+        {
+            'tokens' : token of every user,
+            'vocabulary' : words, most frequent first,
+            'counts' : word -> number of messages holding it,
+        }
+    '''
+    rand = random.Random(seed)
+    clear()
+    vocabulary = make_vocabulary(vocabulary_size, rand)
+    cumulative = zipf_weights(vocabulary_size, exponent)
+    tokens = []
+    for idx in range(1, num_users + 1):
+        token = token_generate(idx, 'login')
+        create_user('bench' + str(idx) + '@test.com', '', 'bench', str(idx),
+                    'bench' + str(idx), token)
+        tokens.append(token)
+
+    counts = {}
+    start_time = int(time.time()) - num_channels * messages_per_channel
+    for idx in range(num_channels):
+        owner = rand.randint(1, num_users)
+        channel = create_new_channel(next_channel_id(), True, 'channel' + str(idx), owner)
+        insort(channel_name_index, (channel['name'], channel['channel_id']))
+        members = [owner] + rand.sample(range(1, num_users + 1),
+                                        min(members_per_channel, num_users) - 1)
+        for u_id in members:
+            add_member(u_id, channel['channel_id'])
+        for msg_idx in range(messages_per_channel):
+            words = rand.choices(vocabulary, cum_weights=cumulative,
+                                 k=rand.randint(*words_per_message))
+            for word in set(words):
+                counts[word] = counts.get(word, 0) + 1
+            new_msg = create_new_msg(' '.join(words), channel, rand.choice(members))
+            new_msg['time_created'] = start_time + msg_idx
+            channel['latest_msg_id'] += 1
+            record_time(channel['channel_id'], new_msg['time_created'])
+            append_msg_to_channel(new_msg, channel)
+    new_version('channels')
+    new_version('channel_names')
+    return {
+        'tokens' : tokens,
+        'vocabulary' : vocabulary,
+        'counts' : counts,
+    }
+
+def pick_queries(workspace):
+    '''
+    This function picks a query of every type from the workspace.
+
+    Returns:
+        It will return a list of (query type, query)
+    '''
+    counts = workspace['counts']
+    used = [word for word in workspace['vocabulary'] if word in counts]
+    rare = min(used, key=lambda word: (counts[word], word))
+    middle = used[len(used) // 10]
+    return [
+        ('common word', used[0]),
+        ('rare word', rare),
+        ('substring', middle[1:-1] if len(middle) > 3 else middle),
+        ('two words', used[0] + ' ' + used[1]),
+        ('no hit', 'qqqqqqqq'),
+        ('no word', ' '),
+    ]
+
+def percentile(sorted_values, fraction):
+    '''
+    This is a helper function to read a percentile of sorted values.
+    '''
+    idx = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[idx]
+
+def full_scan(u_id, query_str):
+    '''
+    This function searches the way search did before the indexes.
+    '''
+    found = []
+    joined = set(channels_of(u_id))
+    for channel in channels:
+        if channel['channel_id'] in joined:
+            found.extend(msg for msg in channel['messages'] if query_str in msg['message'])
+    return found
+
+def time_queries(workspace, rounds=20, limit=None):
+    '''
+    This function times search for every query type, each round by
+    another user.
+
+    Returns:
+        It will return a list of dict
+        {
+            'type', 'query', 'matches',
+            'p50' / 'p99' / 'scan p50' : ms,
+            'peak' : peak memory of a search in KiB,
+        }
+    '''
+    report = []
+    tokens = workspace['tokens']
+    for query_type, query_str in pick_queries(workspace):
+        latencies = []
+        scans = []
+        peak = 0
+        matches = 0
+        for round_idx in range(rounds):
+            u_id = round_idx % len(tokens) + 1
+            reset_search_cache()
+            start = time.perf_counter()
+            matches = len(search(tokens[u_id - 1], query_str, limit)['messages'])
+            latencies.append((time.perf_counter() - start) * 1000)
+            # tracing slows every allocation down, so it is run apart
+            reset_search_cache()
+            tracemalloc.start()
+            search(tokens[u_id - 1], query_str, limit)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            start = time.perf_counter()
+            full_scan(u_id, query_str)
+            scans.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        scans.sort()
+        report.append({
+            'type' : query_type,
+            'query' : query_str,
+            'matches' : matches,
+            'p50' : percentile(latencies, 0.5),
+            'p99' : percentile(latencies, 0.99),
+            'scan p50' : percentile(scans, 0.5),
+            'peak' : peak / 1024,
+        })
+    return report
+
+def main():
+    '''
+    This function builds a workspace from the command line and prints
+    the report.
+    '''
+    parser = argparse.ArgumentParser(description='Benchmark of search')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=500, help='messages per channel, at most 9999')
+    parser.add_argument('--members', type=int, default=10, help='members per channel')
+    parser.add_argument('--vocabulary', type=int, default=5000)
+    parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=None, help='page size, none for all')
+    parser.add_argument('--seed', type=int, default=1531)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    workspace = build_workspace(args.users, args.channels, args.messages, args.members,
+                                args.vocabulary, args.zipf, seed=args.seed)
+    print('generated %d users, %d channels, %d messages in %.1f s' % (
+        len(users), len(channels), args.channels * args.messages,
+        time.perf_counter() - start))
+    print('%-12s %-18s %8s %9s %9s %9s %10s' % (
+        'type', 'query', 'matches', 'p50 ms', 'p99 ms', 'scan ms', 'peak KiB'))
+    for row in time_queries(workspace, args.rounds, args.limit):
+        print('%-12s %-18r %8d %9.2f %9.2f %9.2f %10.1f' % (
+            row['type'], row['query'], row['matches'], row['p50'], row['p99'],
+            row['scan p50'], row['peak']))
+    clear()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+''' Test file for search_bench.py '''
+
+from other import clear, search
+from data import users, channels, messages
+from search_bench import build_workspace, pick_queries, time_queries, full_scan, zipf_weights
+
+def test_build_workspace():
+    '''
+    the workspace is reproducible and indexed like sent messages
+    '''
+    workspace = build_workspace(5, 3, 40, 3, 50, seed=1)
+    assert len(users) == 5
+    assert len(channels) == 3
+    assert len(messages) == 120
+    first = [msg['message'] for msg in channels[0]['messages']]
+    assert build_workspace(5, 3, 40, 3, 50, seed=1)['counts'] == workspace['counts']
+    assert [msg['message'] for msg in channels[0]['messages']] == first
+    for _, query_str in pick_queries(workspace):
+        for u_id in range(1, 6):
+            found = search(workspace['tokens'][u_id - 1], query_str)['messages']
+            assert [msg['message_id'] for msg in found] == [
+                msg['message_id'] for msg in full_scan(u_id, query_str)]
+    clear()
+
+def test_time_queries():
+    '''
+    every query type is reported, the most frequent word first
+    '''
+    cumulative = zipf_weights(3, 1)
+    assert cumulative == [1, 1.5, 1.5 + 1 / 3]
+    workspace = build_workspace(5, 3, 40, 3, 50, seed=1)
+    report = time_queries(workspace, rounds=2)
+    assert [row['type'] for row in report] == [
+        'common word', 'rare word', 'substring', 'two words', 'no hit', 'no word',
+    ]
+    for row in report:
+        assert row['p50'] <= row['p99']
+        assert row['peak'] > 0
+    clear()
@@ -0,0 +1,92 @@
+'''
+import threading to guard the cache
+import OrderedDict to evict the least recently used result
+
+Results of search in other.py, for dashboards repeating the same queries.
+A result is keyed by the query, the version of the user's channels
+(see membership_version) and the version of every one of those channels,
+which every message mutation bumps through touch_channel in helper.py.
+A result is never served after a message of its channels changes or
+the user joins or leaves a channel, its key just stops being asked for
+and it is evicted in turn.
+'''
+import threading
+from collections import OrderedDict
+from helper import get_channel_from_id
+from membership import membership_version, channels_of
+
+SEARCH_CACHE_SIZE = 256
+
+# key from search_key -> result of search
+search_results = OrderedDict()
+search_cache_lock = threading.Lock()
+
+def search_key(u_id, query_str, limit, after, filters):
+    '''
+    This function gets the cache key of a search, from the current versions.
+    Channels are read from data.channel_index, so a key costs as much as
+    the number of the user's channels.
+
+    Args:
+        param1(int): searching user's u_id
+        param2(str): query
+        param3(int): limit of the page, or None
+        param4(tuple): position of the cursor, or None
+        param5(dict): filters of search
+
+    Returns:
+        It will return a tuple
+    '''
+    # the version is read first, a change while reading makes the key stale
+    version = membership_version(u_id)
+    channel_versions = []
+    for channel_id in channels_of(u_id):
+        channel = get_channel_from_id(channel_id)
+        channel_versions.append(None if channel is None else channel['version'])
+    filter_key = tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                              for name, value in filters.items()))
+    return (u_id, query_str, limit, after, filter_key, version, tuple(channel_versions))
+
+def cached_search(key):
+    '''
+    This function gets a cached result of search.
+    is_this_user_reacted is set again for the searching user,
+    as the messages are shared with every other search.
+
+    Args:
+        param1(tuple): key from search_key
+
+    Returns:
+        It will return a result of search, or None if it is not cached
+    '''
+    with search_cache_lock:
+        result = search_results.get(key)
+        if result is None:
+            return None
+        search_results.move_to_end(key)
+    u_id = key[0]
+    for message in result['messages']:
+        message['reacts'][0]['is_this_user_reacted'] = u_id in message['reacts'][0]['u_ids']
+    return dict(result, messages=list(result['messages']))
+
+def cache_search(key, result):
+    '''
+    This function caches a result of search, evicting the least recently
+    used result once the cache is full.
+
+    Args:
+        param1(tuple): key from search_key, taken before searching
+        param2(dict): result of search
+    '''
+    with search_cache_lock:
+        search_results[key] = dict(result, messages=list(result['messages']))
+        search_results.move_to_end(key)
+        while len(search_results) > SEARCH_CACHE_SIZE:
+            search_results.popitem(last=False)
+
+def reset_search_cache():
+    '''
+    This is a helper function to empty the cache when data is cleared.
+    '''
+    with search_cache_lock:
+        search_results.clear()
@@ -0,0 +1,83 @@
+''' Test file for search_cache.py '''
+
+import pytest
+import other
+import search_cache
+from other import clear, search
+from data import users
+from auth import auth_register, auth_login
+from channels import channels_create
+from channel import channel_join, channel_leave
+from message import message_send, message_edit, message_react
+from search_cache import search_results
+
+@pytest.fixture
+def initial_data(monkeypatch):
+    '''
+    register 2 users, user 1 creates 2 channels and user 2 joins the first,
+    searches are counted
+    '''
+    clear()
+    auth_register('test1@test.com', 'password', 'user1', 'user1')
+    auth_login('test1@test.com', 'password')
+    auth_register('test2@test.com', 'password', 'user2', 'user2')
+    auth_login('test2@test.com', 'password')
+    channels_create(users[0]['token'], 'channel_1', True)
+    channels_create(users[0]['token'], 'channel_2', True)
+    channel_join(users[1]['token'], 1)
+    message_send(users[0]['token'], 1, 'hello')
+    calls = []
+    search_all = other.search_all
+    def counted(user, query_str, filters):
+        calls.append(query_str)
+        return search_all(user, query_str, filters)
+    monkeypatch.setattr(other, 'search_all', counted)
+    return calls
+
+def test_search_cache_hit(initial_data):
+    '''
+    a repeated search is answered from the cache, reacts are per user
+    '''
+    calls = initial_data
+    first = search(users[0]['token'], 'hello')
+    assert search(users[0]['token'], 'hello') == first
+    assert calls == ['hello']
+    message_react(users[1]['token'], 10001, 1)
+    assert search(users[1]['token'], 'hello')['messages'][0]['reacts'][0]['is_this_user_reacted']
+    assert search(users[1]['token'], 'hello')['messages'][0]['reacts'][0]['is_this_user_reacted']
+    assert not search(users[0]['token'], 'hello')['messages'][0]['reacts'][0]['is_this_user_reacted']
+    assert calls == ['hello'] * 3
+    assert search(users[0]['token'], 'hello', 1)['messages'] == first['messages']
+    assert calls == ['hello'] * 3
+
+def test_search_cache_invalidation(initial_data):
+    '''
+    a message mutation in a searched channel and joining or leaving
+    a channel make the cached result stale, other channels do not
+    '''
+    calls = initial_data
+    token = users[1]['token']
+    search(token, 'hello')
+    message_send(users[0]['token'], 2, 'hello two')
+    search(token, 'hello')
+    assert len(calls) == 1
+    message_edit(users[0]['token'], 10001, 'hello again')
+    assert search(token, 'hello')['messages'][0]['message'] == 'hello again'
+    channel_join(token, 2)
+    assert len(search(token, 'hello')['messages']) == 2
+    channel_leave(token, 1)
+    assert len(search(token, 'hello')['messages']) == 1
+    assert len(calls) == 4
+
+def test_search_cache_eviction(initial_data, monkeypatch):
+    '''
+    the least recently used result is evicted first
+    '''
+    calls = initial_data
+    monkeypatch.setattr(search_cache, 'SEARCH_CACHE_SIZE', 2)
+    for query in ['a', 'b', 'a', 'c', 'a', 'b']:
+        search(users[0]['token'], query)
+    assert calls == ['a', 'b', 'c', 'b']
+    assert len(search_results) == 2
+    clear()
+    assert len(search_results) == 0
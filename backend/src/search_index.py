@@ -0,0 +1,394 @@
+'''
+import re to split message text into words
+import threading to guard the index while it changes
+
+Inverted indexes of sent messages, used by search in other.py.
+They are kept current by append_msg_to_channel (send, sendlater, standup_end),
+message_edit, message_remove and channel_archive.
+
+search keeps its substring semantics: a query only narrows the candidates,
+every candidate is still checked with `query_str in message`.
+A query of 3 or more characters is looked up in the trigram index,
+a message containing the query contains every trigram of it.
+Every message is also split into words for the word index: if the query
+occurs in a message, every word of the query that has non-word characters
+on both sides is a whole word of the message, the first word of the query
+ends a word of the message, the last word starts one, and a query of one
+word is inside a word of the message. Whole words narrow any query, and
+a shorter query is looked up by its words only, the words containing
+1 or 2 characters are found in word_grams instead of the whole vocabulary.
+A query with no word and shorter than a trigram, or one whose rarest term
+is in a large share of the messages, is answered by scanning the messages
+instead, which is then cheaper than reading and checking the candidates.
+The filters of search are looked up here as well, see filter_candidates:
+the sender index, channel['pinned'] and a column of time_created per
+channel, so "messages from a user last week" reads no other message.
+'''
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from message_ids import MSG_ID_BASE, channel_id_of
+from helper import get_channel_from_id
+
+WORD = re.compile(r'\w+')
+
+# queries at least this long are looked up by trigram
+TRIGRAM_MIN = 3
+# the messages are scanned when the rarest term of a query is in more
+# than this share of them, once the channels hold SCAN_MIN_MESSAGES
+SCAN_RATIO = 0.2
+SCAN_MIN_MESSAGES = 1000
+
+# word -> channel_id -> set of message_id
+word_index = {}
+# 1 or 2 characters -> set of the indexed words containing them
+word_grams = {}
+# trigram -> channel_id -> set of message_id
+trigram_index = {}
+# u_id of sender -> channel_id -> set of message_id
+sender_index = {}
+# channel_id -> time_created of every message_id of the channel, in order of
+# message_id, ids are given out in order of time under the channel's lock
+time_column = {}
+# channel_id -> number of live messages in the indexes
+indexed_count = {}
+search_index_lock = threading.Lock()
+
+def words_of(text):
+    '''
+    This is a helper function to get the distinct words of a message.
+
+    Args:
+        param1(str): message text
+
+    Returns:
+        It will return a set of str
+    '''
+    return set(WORD.findall(text))
+
+def short_grams(word):
+    '''
+    This is a helper function to get the distinct 1 and 2 character
+    strings inside a word.
+
+    Returns:
+        It will return a set of str
+    '''
+    return {word[idx:idx + size] for size in [1, 2] for idx in range(len(word) - size + 1)}
+
+def trigrams_of(text):
+    '''
+    This is a helper function to get the distinct trigrams of a text.
+
+    Args:
+        param1(str): text
+
+    Returns:
+        It will return a set of str
+    '''
+    return {text[idx:idx + 3] for idx in range(len(text) - 2)}
+
+def index_message(channel_id, message_id, text, u_id=None):
+    '''
+    This function adds a message to the indexes.
+
+    Args:
+        param1(int): channel_id
+        param2(int): message_id
+        param3(str): message text
+        param4(int): sender's u_id, None when only the text is indexed again
+    '''
+    words = words_of(text)
+    with search_index_lock:
+        # a word new to the vocabulary is found by its short strings
+        for word in words:
+            if word not in word_index:
+                for gram in short_grams(word):
+                    word_grams.setdefault(gram, set()).add(word)
+        indexes = [(word_index, words), (trigram_index, trigrams_of(text))]
+        if u_id is not None:
+            indexes.append((sender_index, [u_id]))
+            indexed_count[channel_id] = indexed_count.get(channel_id, 0) + 1
+        for index, keys in indexes:
+            for key in keys:
+                index.setdefault(key, {}).setdefault(channel_id, set()).add(message_id)
+
+def unindex_message(channel_id, message_id, text, u_id=None):
+    '''
+    This function removes a message from the indexes.
+
+    Args:
+        param1(int): channel_id
+        param2(int): message_id
+        param3(str): message text it was indexed with
+        param4(int): sender's u_id, None when only the text is removed
+    '''
+    words = words_of(text)
+    with search_index_lock:
+        indexes = [(word_index, words), (trigram_index, trigrams_of(text))]
+        if u_id is not None:
+            indexes.append((sender_index, [u_id]))
+            indexed_count[channel_id] -= 1
+            if indexed_count[channel_id] == 0:
+                del indexed_count[channel_id]
+        for index, keys in indexes:
+            for key in keys:
+                postings = index.get(key)
+                if postings is None:
+                    continue
+                ids = postings.get(channel_id)
+                if ids is None:
+                    continue
+                ids.discard(message_id)
+                if len(ids) == 0:
+                    del postings[channel_id]
+                    if len(postings) == 0:
+                        del index[key]
+        # a word no message holds any more leaves the vocabulary
+        for word in words:
+            if word in word_index:
+                continue
+            for gram in short_grams(word):
+                known = word_grams.get(gram)
+                if known is not None:
+                    known.discard(word)
+                    if len(known) == 0:
+                        del word_grams[gram]
+
+def record_time(channel_id, time_created):
+    '''
+    This function adds the time of a new message_id of a channel
+    to its time column, it is called under the channel's write lock
+    right after create_new_msg.
+
+    Args:
+        param1(int): channel_id
+        param2(int): time_created
+    '''
+    with search_index_lock:
+        time_column.setdefault(channel_id, []).append(time_created)
+
+def time_of(message_id):
+    '''
+    This function gets the time_created of a message_id from its channel's
+    time column, which keeps the times of removed messages too.
+
+    Args:
+        param1(int): message_id
+
+    Returns:
+        It will return an int, or None when the message_id was never given out
+    '''
+    channel_id = channel_id_of(message_id)
+    seq = message_id - channel_id * MSG_ID_BASE
+    with search_index_lock:
+        times = time_column.get(channel_id, [])
+        if seq < 1 or seq > len(times):
+            return None
+        return times[seq - 1]
+
+def last_before(channel_id, after):
+    '''
+    This function finds the newest message_id of a channel older than a
+    search cursor. message_ids of a channel are given in order of
+    time_created, so the older messages are the ids up to this one, and
+    it is found by bisecting the time column.
+
+    Args:
+        param1(int): channel_id
+        param2(tuple): (time_created, message_id) of the cursor
+
+    Returns:
+        It will return a message_id, channel_id * MSG_ID_BASE when
+        no message of the channel is older
+    '''
+    time_created, cursor = after
+    with search_index_lock:
+        times = time_column.get(channel_id, [])
+        lowest = bisect_left(times, time_created)
+        highest = bisect_right(times, time_created)
+    # messages sent in the cursor's second are older when their id is smaller
+    base = channel_id * MSG_ID_BASE
+    return base + min(max(cursor - base - 1, lowest), highest)
+
+def drop_time_column(channel_id):
+    '''
+    This function drops the time column of an archived channel.
+    '''
+    with search_index_lock:
+        time_column.pop(channel_id, None)
+
+def query_terms(query_str):
+    '''
+    This is a helper function to split a query into the words
+    a matching message must contain.
+
+    Args:
+        param1(str): query
+
+    Returns:
+        It will return a list of (kind, word),
+        kind is 'exact' / 'prefix' / 'suffix' / 'inside'
+    '''
+    terms = []
+    for match in WORD.finditer(query_str):
+        open_left = match.start() == 0
+        open_right = match.end() == len(query_str)
+        if open_left and open_right:
+            kind = 'inside'
+        elif open_left:
+            kind = 'suffix'
+        elif open_right:
+            kind = 'prefix'
+        else:
+            kind = 'exact'
+        terms.append((kind, match.group()))
+    return terms
+
+def matching_words(kind, word):
+    '''
+    This is a helper function to get the indexed words satisfying a term
+    of a query shorter than a trigram, so word is 1 or 2 characters long
+    and never exact.
+
+    Returns:
+        It will return a list of str
+    '''
+    with search_index_lock:
+        known = list(word_grams.get(word, ()))
+    if kind == 'prefix':
+        return [other for other in known if other.startswith(word)]
+    if kind == 'suffix':
+        return [other for other in known if other.endswith(word)]
+    return known
+
+def candidate_messages(channel_ids, query_str):
+    '''
+    This function narrows a search down to the messages which may contain
+    the query, in the given channels only.
+
+    Args:
+        param1(list): channel_id to search in
+        param2(str): query
+
+    Returns:
+        It will return a dict channel_id -> sorted list of message_id,
+        or None when the messages should be scanned instead
+    '''
+    terms = query_terms(query_str)
+    # each term is (index, keys), a message holding any of the keys
+    if len(query_str) >= TRIGRAM_MIN:
+        term_keys = [(trigram_index, [trigram]) for trigram in trigrams_of(query_str)]
+        term_keys += [(word_index, [word]) for kind, word in terms if kind == 'exact']
+    else:
+        if len(terms) == 0:
+            return None
+        term_keys = [(word_index, matching_words(kind, word)) for kind, word in terms]
+    channel_terms = []
+    rarest = 0
+    total = 0
+    for channel_id in channel_ids:
+        term_ids = []
+        for index, keys in term_keys:
+            postings = [index.get(key, {}).get(channel_id, ()) for key in keys]
+            # the size of a term is at most the sum of its postings
+            term_ids.append((sum(len(ids) for ids in postings), postings))
+        # start from the rarest term, so the candidates shrink quickly
+        term_ids.sort(key=lambda term: term[0])
+        channel_terms.append((channel_id, term_ids))
+        rarest += term_ids[0][0]
+        total += indexed_count.get(channel_id, 0)
+    if total >= SCAN_MIN_MESSAGES and rarest > SCAN_RATIO * total:
+        return None
+
+    candidates = {}
+    for channel_id, term_ids in channel_terms:
+        found = set().union(*term_ids[0][1])
+        for _, postings in term_ids[1:]:
+            if len(found) == 0:
+                break
+            if len(postings) == 1:
+                found.intersection_update(postings[0])
+            else:
+                found = {message_id for message_id in found
+                         if any(message_id in ids for ids in postings)}
+        if len(found) != 0:
+            candidates[channel_id] = sorted(found)
+    return candidates
+
+def filter_candidates(channel_ids, candidates, filters):
+    '''
+    This function narrows the candidates of a search down to the messages
+    passing the filters, in the indexes only. The sets of every filter
+    are intersected from the smallest, and a time range is turned into a
+    range of message_id by bisecting the channel's time column.
+
+    Args:
+        param1(list): channel_id to search in
+        param2(dict): candidate_messages, or None when any message may match
+        param3(dict): filters of search, with any of
+            'u_id' : sender's u_id,
+            'time_start' / 'time_end' : time_created range, both included,
+            'pinned_only' : True for pinned messages only
+
+    Returns:
+        It will return a dict channel_id -> sorted list or range of message_id,
+        or None when nothing narrows the search
+    '''
+    u_id = filters.get('u_id')
+    time_start = filters.get('time_start')
+    time_end = filters.get('time_end')
+    pinned_only = filters.get('pinned_only', False)
+    timed = time_start is not None or time_end is not None
+    if u_id is None and not pinned_only and not timed:
+        return candidates
+
+    narrowed = {}
+    for channel_id in channel_ids:
+        term_ids = []
+        if candidates is not None:
+            term_ids.append(candidates.get(channel_id, []))
+        lowest = channel_id * MSG_ID_BASE + 1
+        highest = (channel_id + 1) * MSG_ID_BASE
+        # the live sets and columns change while messages are sent,
+        # so they are copied or bisected under the lock
+        with search_index_lock:
+            if u_id is not None:
+                term_ids.append(set(sender_index.get(u_id, {}).get(channel_id, ())))
+            if timed:
+                times = time_column.get(channel_id, [])
+                if time_start is not None:
+                    lowest += bisect_left(times, time_start)
+                highest = channel_id * MSG_ID_BASE + len(times)
+                if time_end is not None:
+                    highest = channel_id * MSG_ID_BASE + bisect_right(times, time_end)
+        if pinned_only:
+            channel = get_channel_from_id(channel_id)
+            term_ids.append(list(channel['pinned']) if channel is not None else [])
+        if len(term_ids) == 0:
+            # only a time range, every message_id in it may match
+            found = range(lowest, highest + 1)
+        else:
+            term_ids.sort(key=len)
+            found = set(message_id for message_id in term_ids[0]
+                        if lowest <= message_id <= highest)
+            for ids in term_ids[1:]:
+                if len(found) == 0:
+                    break
+                found.intersection_update(ids)
+            found = sorted(found)
+        if len(found) != 0:
+            narrowed[channel_id] = found
+    return narrowed
+
+def reset_search_index():
+    '''
+    This is a helper function to empty the indexes when data is cleared.
+    '''
+    with search_index_lock:
+        word_index.clear()
+        word_grams.clear()
+        trigram_index.clear()
+        sender_index.clear()
+        time_column.clear()
+        indexed_count.clear()
@@ -0,0 +1,216 @@
+''' Test file for search_index.py '''
+
+import random
+import threading
+import time
+import pytest
+from other import clear, search
+from data import users, channels, messages
+from auth import auth_register, auth_login
+from channels import channels_create
+from channel import channel_archive, channel_join
+from message import message_send, message_edit, message_remove, message_pin
+from standup import standup_end
+import search_index
+from search_index import trigram_index, candidate_messages, filter_candidates
+from search_index import index_message, word_index, word_grams, query_terms
+from search_index import time_column, last_before
+
+@pytest.fixture
+def initial_data():
+    '''
+    register a user who creates 2 channels
+    '''
+    clear()
+    auth_register('test1@test.com', 'password', 'user1', 'user1')
+    auth_login('test1@test.com', 'password')
+    channels_create(users[0]['token'], 'channel_1', True)
+    channels_create(users[0]['token'], 'channel_2', True)
+
+def test_candidates_or_scan(initial_data, monkeypatch):
+    '''
+    short queries and queries whose rarest trigram is in too many
+    messages are scanned instead of read from the index
+    '''
+    monkeypatch.setattr(search_index, 'SCAN_MIN_MESSAGES', 10)
+    token = users[0]['token']
+    sent = [message_send(token, 1, 'common ' + str(idx))['message_id'] for idx in range(9)]
+    rare = message_send(token, 1, 'common rare')['message_id']
+    assert candidate_messages([1], 'co') is None
+    assert candidate_messages([1], 'common') is None
+    assert candidate_messages([1], 'rare') == {1 : [rare]}
+    assert candidate_messages([1], 'common rare') == {1 : [rare]}
+    # below SCAN_MIN_MESSAGES the index is always read
+    message_remove(token, sent[0])
+    assert candidate_messages([1], 'common') == {1 : sent[1:] + [rare]}
+
+def test_query_terms():
+    '''
+    the words of a query are whole, ending, starting or inside words of a match
+    '''
+    assert query_terms('ab') == [('inside', 'ab')]
+    assert query_terms('a b') == [('suffix', 'a'), ('prefix', 'b')]
+    assert query_terms(' hi there') == [('exact', 'hi'), ('prefix', 'there')]
+    assert query_terms(' !') == []
+
+def test_word_candidates(initial_data, monkeypatch):
+    '''
+    short queries are looked up by their words, whole words narrow
+    longer queries, queries with no word are scanned
+    '''
+    monkeypatch.setattr(search_index, 'SCAN_MIN_MESSAGES', 10)
+    token = users[0]['token']
+    sent = [message_send(token, 1, 'ab cd ' + str(idx))['message_id'] for idx in range(9)]
+    rare = message_send(token, 1, 'ab zq, cdx')['message_id']
+    assert candidate_messages([1], 'zq') == {1 : [rare]}
+    assert candidate_messages([1], 'q,') == {1 : [rare]}
+    assert candidate_messages([1], ' z') == {1 : [rare]}
+    assert candidate_messages([1], 'x') == {1 : [rare]}
+    assert candidate_messages([1], 'd ') is None
+    assert candidate_messages([1], 'ab') is None
+    assert candidate_messages([1], ' !') is None
+    assert candidate_messages([1], 'b zq, ') == {1 : [rare]}
+    assert candidate_messages([2], 'zq') == {}
+    # both trigrams of ' cd ' are in the first message, the whole word is not
+    message_send(token, 2, 'a cdx xcd ')
+    whole = message_send(token, 2, 'a cd b')['message_id']
+    assert candidate_messages([2], ' cd ') == {2 : [whole]}
+    found = search(token, ' cd ', filters={'channel_ids' : [2]})['messages']
+    assert [msg['message_id'] for msg in found] == [whole]
+
+def test_last_before(initial_data):
+    '''
+    the newest message older than a cursor is found in the time column,
+    messages of the cursor's second are ordered by message_id
+    '''
+    time_column[1] = [100, 200, 200, 200, 300]
+    assert last_before(1, (200, 10003)) == 10002
+    assert last_before(1, (200, 20001)) == 10004
+    assert last_before(1, (200, 1)) == 10001
+    assert last_before(1, (250, 99999)) == 10004
+    assert last_before(1, (50, 10001)) == 10000
+    assert last_before(1, (400, 1)) == 10005
+
+def test_index_follows_messages(initial_data):
+    '''
+    send, edit, remove, standup_end and archive keep the index current
+    '''
+    token = users[0]['token']
+    msg_id = message_send(token, 1, 'hello world')['message_id']
+    assert trigram_index['o w'] == {1 : {msg_id}}
+    assert word_index['hello'] == {1 : {msg_id}}
+    assert word_grams['he'] == {'hello'}
+    assert word_grams['o'] == {'hello', 'world'}
+    assert candidate_messages([1, 2], 'lo wo') == {1 : [msg_id]}
+    assert candidate_messages([2], 'lo wo') == {}
+    message_edit(token, msg_id, 'goodbye world')
+    assert 'hel' not in trigram_index
+    assert 'hello' not in word_index
+    assert 'he' not in word_grams
+    assert word_grams['o'] == {'goodbye', 'world'}
+    assert candidate_messages([1, 2], 'bye') == {1 : [msg_id]}
+    message_remove(token, msg_id)
+    assert trigram_index == {}
+    assert word_index == {}
+    assert word_grams == {}
+    assert search_index.indexed_count == {}
+
+    channels[1]['standup_msg'] = '\nuser1user1: standup'
+    standup_end(users[0], channels[1])
+    assert list(trigram_index['tan']) == [2]
+    channel_archive(token, 2)
+    assert trigram_index == {}
+    assert search_index.indexed_count == {}
+
+def test_index_search_matches_scan(initial_data):
+    '''
+    search gives the same messages as checking every message
+    '''
+    token = users[0]['token']
+    rand = random.Random(1531)
+    alphabet = ['ab', 'ba', 'abc', 'cab', ' ', ' ', '!', 'a b', 'x']
+    sent = []
+    for idx in range(200):
+        text = ''.join(rand.choice(alphabet) for _ in range(rand.randint(0, 8)))
+        channel_id = 1 + idx % 2
+        msg_id = message_send(token, channel_id, text)['message_id']
+        sent.append((channel_id, msg_id, text))
+    queries = ['a', 'ab', 'b a', 'ab!', '!ab', 'c a', 'x ab', ' ', '', 'abcab', 'b!x']
+    for _ in range(50):
+        text = rand.choice(sent)[2]
+        start = rand.randint(0, len(text))
+        queries.append(text[start:rand.randint(start, len(text))])
+    for query in queries:
+        expected = sorted(msg_id for _, msg_id, text in sent if query in text)
+        found = sorted(msg['message_id'] for msg in search(token, query)['messages'])
+        assert found == expected, query
+
+def test_search_filters(initial_data, monkeypatch):
+    '''
+    filters give the same messages as checking every message,
+    with and without a query
+    '''
+    auth_register('test2@test.com', 'password', 'user2', 'user2')
+    auth_login('test2@test.com', 'password')
+    channel_join(users[1]['token'], 1)
+    channel_join(users[1]['token'], 2)
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(time, 'time', lambda: next(clock))
+    rand = random.Random(1531)
+    for idx in range(120):
+        sender = rand.randint(0, 1)
+        text = rand.choice(['hello', 'hello world', 'world', '!'])
+        msg_id = message_send(users[sender]['token'], 1 + idx % 2, text)['message_id']
+        if rand.random() < 0.2:
+            message_pin(users[0]['token'], msg_id)
+    message_remove(users[0]['token'], 10001)
+    sent = [handle['message'] for handle in messages.values()]
+
+    for _ in range(40):
+        filters = {}
+        if rand.random() < 0.5:
+            filters['channel_ids'] = rand.choice([[1], [2], [1, 2], [3]])
+        if rand.random() < 0.5:
+            filters['u_id'] = rand.randint(1, 2)
+        if rand.random() < 0.5:
+            filters['time_start'] = rand.randint(990, 1130)
+        if rand.random() < 0.5:
+            filters['time_end'] = rand.randint(990, 1130)
+        filters['pinned_only'] = rand.random() < 0.3
+        query = rand.choice(['hello', 'o w', 'd', '!', ''])
+        expected = sorted((msg['time_created'], msg['message_id']) for msg in sent
+                          if query in msg['message']
+                          and msg['message_id'] // 10000 in filters.get('channel_ids', [1, 2])
+                          and msg['u_id'] == filters.get('u_id', msg['u_id'])
+                          and msg['time_created'] >= filters.get('time_start', 0)
+                          and msg['time_created'] <= filters.get('time_end', 10000)
+                          and (msg['is_pinned'] or not filters['pinned_only']))
+        found = search(users[0]['token'], query, filters=filters)['messages']
+        assert sorted(msg['message_id'] for msg in found) == sorted(
+            msg_id for _, msg_id in expected), (query, filters)
+        page = search(users[0]['token'], query, 5, filters=filters)['messages']
+        assert [msg['message_id'] for msg in page] == [msg_id for _, msg_id in expected[::-1][:5]]
+
+def test_filter_while_indexing(initial_data):
+    '''
+    filtering by sender while the same sender's messages are indexed
+    reads a copy of the sender's set
+    '''
+    for idx in range(20000):
+        index_message(1, 10000 + idx, '', 1)
+    errors = []
+    def send():
+        for idx in range(20000, 40000):
+            index_message(1, 10000 + idx, '', 1)
+    def read():
+        try:
+            for _ in range(20):
+                filter_candidates([1], None, {'u_id' : 1})
+        except RuntimeError as error:
+            errors.append(error)
+    threads = [threading.Thread(target=send), threading.Thread(target=read)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
@@ -0,0 +1,402 @@
+'''
+import threading to guard the segments while they change
+import multiprocessing for the worker processes and shared memory
+import concurrent.futures for the pool of search workers
+import array and bisect to read and write a segment's offsets
+import islice to read the messages appended to a channel since the last search
+import locks to read a channel's messages under its read lock
+
+Parallel scan for searches reading every match, when the indexes can not
+narrow them down, see candidate_messages in search_index.py, or leave
+too many candidates to check in one process. Every channel searched is copied
+into a shared memory segment once, and the segments of the user's channels
+are split into one partition per worker. The workers attach to the
+segments by name, so no message is sent to them.
+
+Segments are append only: a later search appends the messages sent since,
+and marks the slots of removed and edited messages dead, an edited message
+being appended again with its new text. Reacts and pins do not touch the
+segment. A segment is only built again once its channel is compacted, or
+copied into a larger one once it is full, which leaves room for as
+many messages again.
+
+A segment holds, as int64, bits and utf-8:
+    capacity | offsets[capacity + 1] | message_ids[capacity] | dead[capacity] | texts
+every text is followed by a NUL, so a query without NUL never matches
+across two messages. Workers are given the number of slots to read,
+so messages can be appended while they scan.
+'''
+import threading
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+from bisect import bisect_right
+from itertools import islice
+from helper import get_channel_from_id, get_message_handle
+from locks import channel_lock
+
+# scans of fewer messages, or fewer candidates, than this are not worth
+# sending to the pool
+PARALLEL_MIN_MESSAGES = 20000
+# smallest number of slots and of text bytes of a segment
+MIN_SLOTS = 256
+MIN_TEXT_BYTES = 1 << 16
+
+pool = {
+    'executor' : None,
+    'workers' : 0,
+}
+# channel_id -> segment entry, from new_entry
+segments = {}
+# guards segments and the 'changed' and 'dropped' fields of the entries,
+# it is taken after a channel's lock and never held while waiting for one
+segments_lock = threading.Lock()
+
+def use_parallel_search(workers):
+    '''
+    This function starts a pool of search worker processes.
+    Workers are spawned, not forked, as the server runs threads.
+
+    Args:
+        param1(int): number of worker processes
+    '''
+    stop_parallel_search()
+    pool['executor'] = ProcessPoolExecutor(workers,
+                                           mp_context=multiprocessing.get_context('spawn'))
+    pool['workers'] = workers
+
+def stop_parallel_search():
+    '''
+    This function stops the pool and frees every segment.
+    '''
+    if pool['executor'] is not None:
+        pool['executor'].shutdown()
+    pool['executor'] = None
+    pool['workers'] = 0
+    reset_segments()
+
+def new_entry():
+    '''
+    This is a helper function to make the entry of a channel's segment.
+    The entry's lock is held while the segment is brought up to date.
+    '''
+    return {
+        'lock' : threading.Lock(),
+        'dropped' : False,
+        # message_id edited or removed since the last update
+        'changed' : set(),
+        'segment' : None,
+        'capacity' : 0,
+        'text_capacity' : 0,
+        # slots and text bytes used
+        'count' : 0,
+        'text_end' : 0,
+        # the channel's message list copied so far, and how much of it
+        'messages' : None,
+        'read' : 0,
+        # message_id -> slot of its current text
+        'slots' : {},
+    }
+
+def layout(capacity):
+    '''
+    This is a helper function to get where the parts of a segment start.
+
+    Args:
+        param1(int): number of slots of the segment
+
+    Returns:
+        It will return (offsets, message_ids, dead, texts) byte positions
+    '''
+    offsets_at = 8
+    ids_at = offsets_at + 8 * (capacity + 1)
+    dead_at = ids_at + 8 * capacity
+    texts_at = dead_at + (capacity + 7) // 8
+    return offsets_at, ids_at, dead_at, texts_at
+
+def free_segment(entry):
+    '''
+    This is a helper function to free the shared memory of an entry
+    and empty it, so the next update copies the channel again.
+    '''
+    if entry['segment'] is not None:
+        entry['segment'].close()
+        entry['segment'].unlink()
+    entry.update({
+        'segment' : None,
+        'capacity' : 0,
+        'text_capacity' : 0,
+        'count' : 0,
+        'text_end' : 0,
+        'messages' : None,
+        'read' : 0,
+        'slots' : {},
+    })
+
+def grow_segment(entry, slots, text_bytes):
+    '''
+    This is a helper function to copy a segment into a new one holding
+    twice the given number of slots and text bytes.
+    '''
+    # twice what is needed, so messages sent later are appended in place
+    capacity = max(2 * slots, MIN_SLOTS)
+    text_capacity = max(2 * text_bytes, MIN_TEXT_BYTES)
+    offsets_at, ids_at, dead_at, texts_at = layout(capacity)
+    segment = SharedMemory(create=True, size=texts_at + text_capacity)
+    segment.buf[:8] = array('q', [capacity]).tobytes()
+    old = entry['segment']
+    if old is not None:
+        count = entry['count']
+        old_offsets_at, old_ids_at, old_dead_at, old_texts_at = layout(entry['capacity'])
+        segment.buf[offsets_at:offsets_at + 8 * (count + 1)] = \
+            old.buf[old_offsets_at:old_offsets_at + 8 * (count + 1)]
+        segment.buf[ids_at:ids_at + 8 * count] = old.buf[old_ids_at:old_ids_at + 8 * count]
+        segment.buf[dead_at:dead_at + (count + 7) // 8] = \
+            old.buf[old_dead_at:old_dead_at + (count + 7) // 8]
+        segment.buf[texts_at:texts_at + entry['text_end']] = \
+            old.buf[old_texts_at:old_texts_at + entry['text_end']]
+        old.close()
+        old.unlink()
+    entry['segment'] = segment
+    entry['capacity'] = capacity
+    entry['text_capacity'] = text_capacity
+
+def append_texts(entry, items):
+    '''
+    This is a helper function to append messages to the tail of a segment,
+    past the slots the workers may be reading.
+
+    Args:
+        param1(dict): segment entry
+        param2(list): (message_id, text) to append
+    '''
+    if len(items) == 0:
+        return
+    texts = [text.encode() + b'\0' for _, text in items]
+    count = entry['count']
+    end = entry['text_end']
+    offsets = array('q')
+    for text in texts:
+        end += len(text)
+        offsets.append(end)
+    if count + len(texts) > entry['capacity'] or end > entry['text_capacity']:
+        grow_segment(entry, count + len(texts), end)
+    offsets_at, ids_at, _, texts_at = layout(entry['capacity'])
+    buf = entry['segment'].buf
+    buf[offsets_at + 8 * (count + 1):offsets_at + 8 * (count + 1 + len(texts))] = \
+        offsets.tobytes()
+    buf[ids_at + 8 * count:ids_at + 8 * (count + len(texts))] = \
+        array('q', [message_id for message_id, _ in items]).tobytes()
+    buf[texts_at + entry['text_end']:texts_at + end] = b''.join(texts)
+    for idx, (message_id, _) in enumerate(items):
+        entry['slots'][message_id] = count + idx
+    entry['count'] = count + len(texts)
+    entry['text_end'] = end
+
+def update_segment(entry, channel):
+    '''
+    This is a helper function to bring a channel's segment up to date,
+    under the entry's lock. The channel's read lock is only held to
+    read what changed, the texts are copied after it is released; a
+    message changed meanwhile is in 'changed' for the next update.
+
+    Returns:
+        It will return False if the channel was archived, else True
+    '''
+    with channel_lock(channel['channel_id']).read():
+        if channel['archived'] is True:
+            return False
+        msg_list = channel['messages']
+        count = len(msg_list)
+        tombstones = channel['tombstones']
+        with segments_lock:
+            changed = entry['changed']
+            entry['changed'] = set()
+        if msg_list is not entry['messages']:
+            # first update, or the channel was compacted into a new list
+            free_segment(entry)
+            entry['messages'] = msg_list
+            changed = set()
+        changed = [(message_id, get_message_handle(message_id)) for message_id in changed]
+        start = entry['read']
+        entry['read'] = count
+
+    _, _, dead_at, _ = layout(entry['capacity'])
+    items = []
+    for message_id, handle in changed:
+        slot = entry['slots'].pop(message_id, None)
+        # a message not copied yet is read from the list with its new text
+        if slot is None:
+            continue
+        buf = entry['segment'].buf
+        buf[dead_at + (slot >> 3)] |= 1 << (slot & 7)
+        if handle is not None:
+            items.append((message_id, handle['message']['message']))
+    items += [(msg['message_id'], msg['message']) for msg in islice(msg_list, start, count)
+              if msg['message_id'] not in tombstones]
+    append_texts(entry, items)
+    return True
+
+def current_segment(channel):
+    '''
+    This is a helper function to get the segment of a channel,
+    with the changes made to the channel since the last search.
+
+    Returns:
+        It will return (segment name, number of slots to read),
+        or None when there is nothing to read
+    '''
+    channel_id = channel['channel_id']
+    with segments_lock:
+        entry = segments.get(channel_id)
+        if entry is None:
+            entry = new_entry()
+            segments[channel_id] = entry
+    entry['lock'].acquire()
+    try:
+        current = None
+        if not entry['dropped'] and update_segment(entry, channel):
+            if entry['count'] != 0:
+                current = (entry['segment'].name, entry['count'])
+    finally:
+        # a segment dropped while it was updated is freed here
+        with segments_lock:
+            if entry['dropped']:
+                free_segment(entry)
+                current = None
+            entry['lock'].release()
+    return current
+
+def segment_changed(channel_id, message_id):
+    '''
+    This function is called by writers, under the channel's write lock,
+    when a message is edited or removed, so the next search marks its
+    text dead in the channel's segment.
+
+    Args:
+        param1(int): channel_id
+        param2(int): message_id
+    '''
+    with segments_lock:
+        entry = segments.get(channel_id)
+        if entry is not None:
+            entry['changed'].add(message_id)
+
+def scan_segments(partition, needle):
+    '''
+    This function is run by a worker to find the messages of its
+    segments containing the query.
+
+    Args:
+        param1(list): (channel_id, segment name, number of slots) to scan
+        param2(bytes): utf-8 query, without NUL
+
+    Returns:
+        It will return a list of (channel_id, list of message_id)
+    '''
+    found = []
+    for channel_id, name, count in partition:
+        segment = SharedMemory(name=name)
+        try:
+            header = array('q')
+            header.frombytes(segment.buf[:8])
+            offsets_at, ids_at, dead_at, texts_at = layout(header[0])
+            offsets = array('q')
+            offsets.frombytes(segment.buf[offsets_at:offsets_at + 8 * (count + 1)])
+            message_ids = array('q')
+            message_ids.frombytes(segment.buf[ids_at:ids_at + 8 * count])
+            dead = bytes(segment.buf[dead_at:dead_at + (count + 7) // 8])
+            text = bytes(segment.buf[texts_at:texts_at + offsets[count]])
+        finally:
+            segment.close()
+        matches = []
+        pos = text.find(needle)
+        while pos != -1 and pos < offsets[count]:
+            idx = bisect_right(offsets, pos) - 1
+            if (dead[idx >> 3] >> (idx & 7)) & 1 == 0:
+                matches.append(message_ids[idx])
+            # one match per message is enough, go on from the next message
+            pos = text.find(needle, offsets[idx + 1])
+        found.append((channel_id, matches))
+    return found
+
+def parallel_candidates(channel_ids, query_str, candidates=None):
+    '''
+    This function scans the given channels in the worker pool.
+
+    Args:
+        param1(list): channel_id to search in
+        param2(str): query
+        param3(dict): candidate_messages of the query, None to scan
+
+    Returns:
+        It will return a dict channel_id -> sorted list of message_id
+        containing the query, or None when the search should be run
+        in this process: no pool, too few messages or candidates
+        to check, or a query with NUL
+    '''
+    if pool['executor'] is None or '\0' in query_str:
+        return None
+    if candidates is not None:
+        if sum(len(ids) for ids in candidates.values()) < PARALLEL_MIN_MESSAGES:
+            return None
+        # only the channels holding candidates may match
+        channel_ids = [channel_id for channel_id in channel_ids if channel_id in candidates]
+    searched = [get_channel_from_id(channel_id) for channel_id in channel_ids]
+    searched = [channel for channel in searched if channel is not None]
+    total = sum(len(channel['messages']) - len(channel['tombstones']) for channel in searched)
+    if total < PARALLEL_MIN_MESSAGES:
+        return None
+    entries = []
+    for channel in searched:
+        current = current_segment(channel)
+        if current is not None:
+            entries.append((channel['channel_id'],) + current)
+
+    # largest segments first, each into the smallest partition
+    entries.sort(key=lambda entry: entry[2], reverse=True)
+    partitions = [[] for _ in range(pool['workers'])]
+    sizes = [0] * pool['workers']
+    for entry in entries:
+        smallest = sizes.index(min(sizes))
+        partitions[smallest].append(entry)
+        sizes[smallest] += entry[2]
+    needle = query_str.encode()
+    futures = [pool['executor'].submit(scan_segments, partition, needle)
+               for partition in partitions if len(partition) != 0]
+    candidates = {}
+    try:
+        for future in futures:
+            for channel_id, matches in future.result():
+                if len(matches) != 0:
+                    candidates[channel_id] = sorted(matches)
+    except FileNotFoundError:
+        # a segment was grown or dropped by another thread meanwhile
+        return None
+    return candidates
+
+def drop_segment(channel_id):
+    '''
+    This function frees the segment of a channel, e.g. when it is archived.
+    It may be called under the channel's write lock, so it never waits for
+    a search updating the segment, that search frees it instead.
+
+    Args:
+        param1(int): channel_id
+    '''
+    with segments_lock:
+        entry = segments.pop(channel_id, None)
+        if entry is None:
+            return
+        entry['dropped'] = True
+        if entry['lock'].acquire(blocking=False):
+            free_segment(entry)
+            entry['lock'].release()
+
+def reset_segments():
+    '''
+    This is a helper function to free every segment when data is cleared.
+    '''
+    for channel_id in list(segments):
+        drop_segment(channel_id)
@@ -0,0 +1,141 @@
+''' Test file for search_parallel.py '''
+
+import random
+import threading
+import time
+import pytest
+import search_parallel
+from other import clear, search
+from data import users
+from auth import auth_register, auth_login
+from channels import channels_create
+from channel import channel_archive
+from helper import get_channel_from_id
+from message import message_send, message_edit, message_remove, message_react
+from message import compact_channel
+from locks import channel_lock
+from search_parallel import use_parallel_search, stop_parallel_search, segments
+from search_parallel import segments_lock, current_segment
+
+@pytest.fixture
+def workers(monkeypatch):
+    '''
+    start 2 search workers, every search goes to them
+    '''
+    monkeypatch.setattr(search_parallel, 'PARALLEL_MIN_MESSAGES', 0)
+    use_parallel_search(2)
+    yield
+    stop_parallel_search()
+
+@pytest.fixture
+def initial_data(workers):
+    '''
+    register a user who creates 3 channels
+    '''
+    clear()
+    auth_register('test1@test.com', 'password', 'user1', 'user1')
+    auth_login('test1@test.com', 'password')
+    for name in ['channel_1', 'channel_2', 'channel_3']:
+        channels_create(users[0]['token'], name, True)
+
+def test_parallel_search_matches_scan(initial_data):
+    '''
+    queries the indexes can not narrow are scanned by the workers,
+    with the same result as one process
+    '''
+    token = users[0]['token']
+    rand = random.Random(1531)
+    sent = []
+    for idx in range(150):
+        text = ''.join(rand.choice(['a', 'b', ' ', '!', 'é']) for _ in range(rand.randint(0, 6)))
+        sent.append((message_send(token, 1 + idx % 3, text)['message_id'], text))
+    for query in ['', ' ', '!', 'é', ' !', 'a', '\0']:
+        expected = sorted(msg_id for msg_id, text in sent if query in text)
+        found = search(token, query)['messages']
+        assert sorted(msg['message_id'] for msg in found) == expected, query
+        page = search(token, query, 10)['messages']
+        assert [msg['message_id'] for msg in page] == sorted(expected, reverse=True)[:10]
+    assert sorted(segments) == [1, 2, 3]
+
+def test_parallel_search_candidates(initial_data):
+    '''
+    large sets of candidates are checked by the workers, in the channels
+    holding candidates only, and filters still apply; pages are read
+    in this process
+    '''
+    token = users[0]['token']
+    first = message_send(token, 1, 'abcd')['message_id']
+    message_send(token, 1, 'abc d')
+    second = message_send(token, 2, 'xabcd')['message_id']
+    message_send(token, 3, 'nothing')
+    assert search(token, 'abcd', 10)['messages'][0]['message_id'] == second
+    assert segments == {}
+    found = search(token, 'abcd')['messages']
+    assert [msg['message_id'] for msg in found] == [first, second]
+    assert sorted(segments) == [1, 2]
+    found = search(token, 'abcd', filters={'channel_ids' : [2]})['messages']
+    assert [msg['message_id'] for msg in found] == [second]
+
+def test_parallel_search_segments(initial_data):
+    '''
+    a segment is appended to after its channel changes, reacts leave it
+    alone, it is built again after compaction and freed on archive
+    '''
+    token = users[0]['token']
+    msg_id = message_send(token, 1, 'a')['message_id']
+    assert [msg['message_id'] for msg in search(token, 'a')['messages']] == [msg_id]
+    name = segments[1]['segment'].name
+    message_edit(token, msg_id, 'b')
+    assert search(token, 'a')['messages'] == []
+    assert [msg['message_id'] for msg in search(token, 'b')['messages']] == [msg_id]
+    other_id = message_send(token, 1, 'ab')['message_id']
+    message_react(token, other_id, 1)
+    assert [msg['message_id'] for msg in search(token, 'a')['messages']] == [other_id]
+    # the first text of the edited message is dead, its new text appended
+    assert (segments[1]['count'], segments[1]['segment'].name) == (3, name)
+    message_remove(token, msg_id)
+    assert [msg['message_id'] for msg in search(token, 'b')['messages']] == [other_id]
+    assert segments[1]['segment'].name == name
+    compact_channel(get_channel_from_id(1))
+    assert [msg['message_id'] for msg in search(token, 'ab')['messages']] == [other_id]
+    assert segments[1]['count'] == 1
+    assert segments[1]['segment'].name != name
+    channel_archive(token, 1)
+    assert 1 not in segments
+    clear()
+    assert segments == {}
+
+def test_parallel_search_segment_grows(initial_data, monkeypatch):
+    '''
+    a full segment is copied into a larger one
+    '''
+    monkeypatch.setattr(search_parallel, 'MIN_SLOTS', 4)
+    token = users[0]['token']
+    sent = [message_send(token, 1, 'msg ' + str(idx))['message_id'] for idx in range(3)]
+    search(token, 'msg')
+    assert segments[1]['capacity'] == 6
+    sent += [message_send(token, 1, 'msg ' + str(idx))['message_id'] for idx in range(3, 10)]
+    found = search(token, 'msg')['messages']
+    assert [msg['message_id'] for msg in found] == sent
+    assert segments[1]['capacity'] == 20
+
+def test_segment_lock_order(initial_data):
+    '''
+    a search waiting for a channel's lock does not hold segments_lock,
+    so archiving the channel meanwhile can drop the segment
+    '''
+    token = users[0]['token']
+    message_send(token, 1, 'a')
+    channel = get_channel_from_id(1)
+    with channel_lock(1).write():
+        waiting = threading.Thread(target=current_segment, args=[channel])
+        waiting.start()
+        time.sleep(0.1)
+        assert segments_lock.acquire(timeout=1)
+        segments_lock.release()
+        channel['archived'] = True
+        search_parallel.drop_segment(1)
+    waiting.join(timeout=5)
+    assert not waiting.is_alive()
+    assert segments == {}
+    channel['archived'] = False
@@ -1,15 +1,21 @@
+import os
 import sys
 from auth import auth_login, auth_logout, auth_register, auth_pwreset_req, auth_pwreset_set, get_reset_code
-from channel import channel_invite, channel_details, channel_messages, channel_leave
-from channel import channel_join, channel_addowner, channel_removeowner
-from channels import channels_create, channels_list, channels_listall
+from channel import channel_invite, channel_invite_bulk, channel_details, channel_messages_json, channel_leave
+from channel import channel_join, channel_addowner, channel_removeowner, channel_pinned
+from channel import channel_archive
+from channels import channels_create, channels_list, channels_listall_json, channels_unread
 from message import message_send, message_remove, message_edit, message_send_later
-from message import message_pin, message_unpin, message_react, message_unreact
+from message import message_pin, message_unpin, message_react, message_unreact, message_history
 from user import user_profile, user_profile_setemail, user_profile_sethandle, user_profile_setname, user_profile_uploadphoto
-from other import clear, users_all, search, admin_userpermission_change
+from other import clear, users_all, search, admin_userpermission_change, notifications_get
+from other import stats_workspace, stats_channel
 from standup import standup_start, standup_active, standup_send
+from stream import stream_subscribe, stream_events
+from shard import ShardRouter
+from search_parallel import use_parallel_search
 from json import dumps
-from flask import Flask, request, send_from_directory
+from flask import Flask, Response, request, send_from_directory
 from flask_cors import CORS
 from error import InputError
 from flask_mail import Mail, Message
@@ -104,18 +110,46 @@ def invite():
     u_id = int(data['u_id'])
     return dumps(channel_invite(token, channel_id, u_id))
 
+@APP.route('/channel/invite/bulk', methods=['POST'])
+def invite_bulk():
+    data = request.get_json()
+    token = data['token']
+    channel_id = int(data['channel_id'])
+    u_ids = [int(u_id) for u_id in data['u_ids']]
+    return dumps(channel_invite_bulk(token, channel_id, u_ids))
+
 @APP.route('/channel/details', methods=['GET'])
 def get_details():
     token = request.args.get('token')
     channel_id = int(request.args.get('channel_id'))
-    return dumps(channel_details(token, channel_id))
+    start = int(request.args.get('start', 0))
+    limit = request.args.get('limit')
+    if limit is not None:
+        limit = int(limit)
+    count_only = request.args.get('count_only', 'false').lower() == 'true'
+    return dumps(channel_details(token, channel_id, start, limit, count_only))
 
 @APP.route('/channel/messages', methods=['GET'])
 def recent_messages():
     token = request.args.get('token')
     channel_id = int(request.args.get('channel_id'))
     start = int(request.args.get('start'))
-    return dumps(channel_messages(token, channel_id, start))
+    return channel_messages_json(token, channel_id, start)
+
+@APP.route('/channel/pinned', methods=['GET'])
+def pinned_messages():
+    token = request.args.get('token')
+    channel_id = int(request.args.get('channel_id'))
+    start = int(request.args.get('start'))
+    return dumps(channel_pinned(token, channel_id, start))
+
+@APP.route('/channel/stream', methods=['GET'])
+def stream_messages():
+    token = request.args.get('token')
+    channel_id = int(request.args.get('channel_id'))
+    subscriber = stream_subscribe(token, channel_id)
+    return Response(stream_events(subscriber), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
 
 @APP.route('/channel/leave', methods=['POST'])
 def leave_channel():
@@ -147,6 +181,13 @@ def removeowner():
     u_id = int(data['u_id'])
     return dumps(channel_removeowner(token, channel_id, u_id))
 
+@APP.route('/channel/archive', methods=['POST'])
+def archive_channel():
+    data = request.get_json()
+    token = data['token']
+    channel_id = int(data['channel_id'])
+    return dumps(channel_archive(token, channel_id))
+
 ########################################
 ############ channels.py ###############
 ########################################
@@ -163,10 +204,22 @@ def list_joined_channels():
     token = request.args.get('token')
     return dumps(channels_list(token))
 
+@APP.route('/channels/unread', methods=['GET'])
+def unread_channels():
+    token = request.args.get('token')
+    return dumps(channels_unread(token))
+
 @APP.route('/channels/listall', methods=['GET'])
 def list_all_channels():
     token = request.args.get('token')
-    return dumps(channels_listall(token))
+    limit = request.args.get('limit')
+    if limit is not None:
+        limit = int(limit)
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        cursor = int(cursor)
+    name_prefix = request.args.get('name_prefix')
+    return channels_listall_json(token, limit, cursor, name_prefix)
 
 ########################################
 ############# message.py ###############
@@ -233,6 +286,12 @@ def unpin_msg():
     msg_id = int(data['message_id'])
     return dumps(message_unpin(token, msg_id))
 
+@APP.route('/message/history', methods=['GET'])
+def get_msg_history():
+    token = request.args.get('token')
+    msg_id = int(request.args.get('message_id'))
+    return dumps(message_history(token, msg_id))
+
 ########################################
 ############### user.py ################
 ########################################
@@ -294,7 +353,44 @@ def change_permission():
 def search_msg():
     token = request.args.get('token')
     query_str = request.args.get('query_str')
-    return dumps(search(token, query_str))
+    limit = request.args.get('limit')
+    if limit is not None:
+        limit = int(limit)
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        cursor = int(cursor)
+    filters = {
+        'pinned_only' : request.args.get('pinned_only', 'false').lower() == 'true',
+    }
+    channel_ids = request.args.getlist('channel_ids')
+    if len(channel_ids) != 0:
+        filters['channel_ids'] = [int(channel_id) for channel_id in channel_ids]
+    for name in ['u_id', 'time_start', 'time_end']:
+        if request.args.get(name) is not None:
+            filters[name] = int(request.args.get(name))
+    return dumps(search(token, query_str, limit, cursor, filters))
+
+@APP.route('/notifications', methods=['GET'])
+def get_notifications():
+    token = request.args.get('token')
+    limit = request.args.get('limit')
+    if limit is not None:
+        limit = int(limit)
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        cursor = int(cursor)
+    return dumps(notifications_get(token, limit, cursor))
+
+@APP.route('/stats/workspace', methods=['GET'])
+def get_workspace_stats():
+    token = request.args.get('token')
+    return dumps(stats_workspace(token))
+
+@APP.route('/stats/channel', methods=['GET'])
+def get_channel_stats():
+    token = request.args.get('token')
+    channel_id = int(request.args.get('channel_id'))
+    return dumps(stats_channel(token, channel_id))
 
 ########################################
 ############# standup.py ###############
@@ -315,5 +411,26 @@ def send_standup_msg():
     data = request.get_json()
     return dumps(standup_send(data['token'], int(data['channel_id']), data['message']))
 
+########################################
+############## shard.py ################
+########################################
+def use_shards(count):
+    """
+    Serve the backend from count shard worker processes, see shard.py.
+    The backend functions used by the routes above are replaced by
+    functions routing each call to its shard.
+    """
+    router = ShardRouter(count)
+    globals().update(router.functions())
+    return router
+
 if __name__ == "__main__":
+    # FLOCKR_SHARDS=4 python3 src/server.py runs 4 shard workers
+    shard_count = int(os.environ.get('FLOCKR_SHARDS', '1'))
+    if shard_count > 1:
+        use_shards(shard_count)
+    # FLOCKR_SEARCH_WORKERS=16 scans unindexed searches in 16 processes
+    search_workers = int(os.environ.get('FLOCKR_SEARCH_WORKERS', '0'))
+    if search_workers > 0:
+        use_parallel_search(search_workers)
     APP.run(port=0) # Do not edit this port
@@ -0,0 +1,489 @@
+'''
+import itertools for spreading new channels over the shards
+import multiprocessing for the shard worker processes and their pipes
+import threading to guard each pipe and to forward stream events
+import heapq to merge the name ordered channel lists of the shards
+import dumps to encode merged channels_listall pages
+import time so every shard reads its statistics at the same time
+import the backend functions run by the workers
+
+In sharded mode the channels are split over N worker processes, so
+channels on different shards are served on different cores.
+Shard `index` holds the channels with (channel_id - 1) % N == index and
+all of their messages, message ids are routed by their channel, see message_ids.py.
+Every shard holds a full copy of the users: user changes are sent to all
+shards in the same order, and tokens do not depend on the shard.
+The router lives in the server process, see use_shards in server.py.
+'''
+import heapq
+import itertools
+import multiprocessing
+import threading
+import time
+from json import dumps
+from auth import auth_login, auth_logout, auth_register, auth_pwreset_req, auth_pwreset_set
+from auth import get_reset_code
+from channel import channel_invite, channel_invite_bulk, channel_details, channel_messages_json
+from channel import channel_leave, channel_join, channel_addowner, channel_removeowner
+from channel import channel_pinned, channel_archive
+from channels import channels_create, channels_list, channels_listall, channels_unread
+from message import message_send, message_remove, message_edit, message_send_later
+from message import message_pin, message_unpin, message_react, message_unreact, message_history
+from user import user_profile, user_profile_setemail, user_profile_sethandle
+from user import user_profile_setname, user_profile_uploadphoto
+from other import clear, users_all, search, admin_userpermission_change
+from other import search_page, search_cursor_key, notifications_page
+from other import stats_workspace_counts, workspace_summary, stats_channel
+from mentions import mention_key
+from standup import standup_start, standup_active, standup_send
+from stream import stream_authorise, add_subscriber, drop_subscribers, event_sink, publish
+from stream import reset_streams
+from data import shard, member_projections
+from message_ids import channel_id_of
+from snapshot import new_version
+from error import InputError, AccessError
+from helper import get_user_from_email, get_user_from_token
+
+# calls with channel_id as 2nd argument, run by the shard holding the channel
+CHANNEL_CALLS = [
+    'channel_invite', 'channel_invite_bulk', 'channel_details', 'channel_messages_json',
+    'channel_pinned', 'channel_leave', 'channel_join', 'channel_addowner',
+    'channel_removeowner', 'channel_archive', 'message_send', 'message_send_later',
+    'standup_start', 'standup_active', 'standup_send', 'stats_channel',
+]
+# calls with message_id as 2nd argument, run by the shard holding its channel
+MESSAGE_CALLS = [
+    'message_remove', 'message_edit', 'message_react', 'message_unreact',
+    'message_pin', 'message_unpin', 'message_history',
+]
+# calls changing users, run by every shard
+BROADCAST_CALLS = [
+    'auth_register', 'auth_login', 'auth_logout', 'auth_pwreset_set',
+    'user_profile_setname', 'user_profile_setemail', 'user_profile_sethandle',
+    'admin_userpermission_change',
+]
+# calls only reading users, run by the first shard
+USER_CALLS = [
+    'user_profile', 'users_all', 'get_reset_code',
+]
+
+def notification_cursor_key(token, cursor):
+    '''
+    This is a helper function run by a worker to get the mention key of
+    a notifications cursor, for the user of token.
+    '''
+    user = get_user_from_token(token)
+    if user is None:
+        raise AccessError(description="Unauthorised access")
+    key = mention_key(user['u_id'], cursor)
+    if key is None:
+        raise InputError(description="Invalid cursor")
+    return key
+
+def copy_reset_code(email, code):
+    '''
+    This is a helper function run by a worker to store a reset code
+    generated by another shard.
+    '''
+    get_user_from_email(email)['reset_code'] = code
+    return {}
+
+def profile_img_url(token):
+    '''
+    This is a helper function run by a worker to read a user's photo url.
+    '''
+    return get_user_from_token(token)['profile_img_url']
+
+def copy_profile_img_url(token, url):
+    '''
+    This is a helper function run by a worker to store a photo url
+    uploaded through another shard.
+    '''
+    user = get_user_from_token(token)
+    user['profile_img_url'] = url
+    member_projections.pop(user['u_id'], None)
+    new_version('users')
+    return {}
+
+WORKER_CALLS = {
+    function.__name__ : function for function in [
+        auth_login, auth_logout, auth_register, auth_pwreset_req, auth_pwreset_set,
+        get_reset_code, channel_invite, channel_invite_bulk, channel_details,
+        channel_messages_json, channel_leave, channel_join, channel_addowner,
+        channel_removeowner, channel_pinned, channel_archive, channels_create, channels_list,
+        channels_unread, channels_listall, message_send, message_remove, message_edit,
+        message_send_later,
+        message_pin, message_unpin, message_react, message_unreact, message_history,
+        user_profile, user_profile_setemail, user_profile_sethandle, user_profile_setname,
+        user_profile_uploadphoto, clear, users_all, search, search_page, search_cursor_key,
+        notifications_page, notification_cursor_key, stats_workspace_counts, stats_channel,
+        admin_userpermission_change,
+        standup_start, standup_active, standup_send, stream_authorise,
+        copy_reset_code, profile_img_url, copy_profile_img_url,
+    ]
+}
+
+ERRORS = {
+    'InputError' : InputError,
+    'AccessError' : AccessError,
+}
+
+def worker_main(conn, index, count, events):
+    '''
+    This is the main loop of a shard worker process.
+    It runs one call at a time from the router and sends back
+    ('ok', result) or ('error', error name, description).
+    Stream events of its channels are put on the shared events queue.
+
+    Args:
+        param1(Connection): worker end of the router's pipe
+        param2(int): index of this shard
+        param3(int): number of shards
+        param4(Queue): queue of (channel_id, event, data) read by the router
+    '''
+    # a forked worker starts without the data of the server process
+    clear()
+    shard['index'] = index
+    shard['count'] = count
+    event_sink['put'] = events.put
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        name, args, kwargs = request
+        try:
+            reply = ('ok', WORKER_CALLS[name](*args, **kwargs))
+        except (InputError, AccessError) as err:
+            reply = ('error', type(err).__name__, err.description)
+        except Exception as err:
+            reply = ('error', 'Exception', repr(err))
+        conn.send(reply)
+    conn.close()
+
+def unwrap(reply):
+    '''
+    This is a helper function to turn a worker's reply back into
+    a result or the error raised by the worker.
+    '''
+    if reply[0] == 'ok':
+        return reply[1]
+    if reply[1] in ERRORS:
+        raise ERRORS[reply[1]](description=reply[2])
+    raise RuntimeError(reply[2])
+
+class ShardRouter:
+    '''
+    Starts the shard workers and routes backend calls to them.
+    Each worker serves one call at a time over its own pipe,
+    calls to different shards run in parallel.
+    '''
+    def __init__(self, count):
+        self.count = count
+        self.conns = []
+        self.locks = []
+        self.workers = []
+        self.create_counter = itertools.count()
+        self.events = multiprocessing.Queue()
+        for index in range(count):
+            router_conn, worker_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=worker_main, daemon=True,
+                                             args=(worker_conn, index, count, self.events))
+            worker.start()
+            self.conns.append(router_conn)
+            self.locks.append(threading.Lock())
+            self.workers.append(worker)
+        forwarder = threading.Thread(target=self.forward_events, daemon=True)
+        forwarder.start()
+
+    def forward_events(self):
+        '''
+        Publish the stream events of every shard to the subscribers
+        held in this process. Subscribers dropped by a shard, see
+        drop_subscribers, come through the same queue, so they are dropped
+        before the channel's next event.
+        '''
+        while True:
+            event = self.events.get()
+            if event is None:
+                break
+            if event[1] == 'drop':
+                drop_subscribers(event[0], event[2]['u_id'])
+            else:
+                publish(*event)
+
+    def close(self):
+        '''
+        Stop the workers.
+        '''
+        for lock, conn in zip(self.locks, self.conns):
+            with lock:
+                conn.send(None)
+        for worker in self.workers:
+            worker.join()
+        self.events.put(None)
+
+    def shard_of(self, channel_id):
+        return (channel_id - 1) % self.count
+
+    def call(self, index, name, *args, **kwargs):
+        '''
+        Run a backend function on one shard.
+        '''
+        with self.locks[index]:
+            self.conns[index].send((name, args, kwargs))
+            reply = self.conns[index].recv()
+        return unwrap(reply)
+
+    def call_all(self, name, *args, **kwargs):
+        '''
+        Run a backend function on every shard and return their results.
+        The pipes are taken in order, so calls sent to every shard
+        reach all of them in the same order.
+        '''
+        for lock in self.locks:
+            lock.acquire()
+        try:
+            for conn in self.conns:
+                conn.send((name, args, kwargs))
+            replies = [conn.recv() for conn in self.conns]
+        finally:
+            for lock in self.locks:
+                lock.release()
+        return [unwrap(reply) for reply in replies]
+
+    def channel_call(self, name):
+        def routed(token, channel_id, *args):
+            return self.call(self.shard_of(channel_id), name, token, channel_id, *args)
+        return routed
+
+    def message_call(self, name):
+        def routed(token, message_id, *args):
+            return self.call(self.shard_of(channel_id_of(message_id)), name, token, message_id,
+                             *args)
+        return routed
+
+    def broadcast_call(self, name):
+        def routed(*args):
+            return self.call_all(name, *args)[0]
+        return routed
+
+    def user_call(self, name):
+        def routed(*args):
+            return self.call(0, name, *args)
+        return routed
+
+    def functions(self):
+        '''
+        It will return a dict of function name -> routed function,
+        taking the same arguments as the backend functions in server.py.
+        '''
+        routed = {}
+        for name in CHANNEL_CALLS:
+            routed[name] = self.channel_call(name)
+        for name in MESSAGE_CALLS:
+            routed[name] = self.message_call(name)
+        for name in BROADCAST_CALLS:
+            routed[name] = self.broadcast_call(name)
+        for name in USER_CALLS:
+            routed[name] = self.user_call(name)
+        for function in [self.channels_create, self.channels_list, self.channels_unread,
+                         self.channels_listall_json,
+                         self.search, self.auth_pwreset_req, self.user_profile_uploadphoto,
+                         self.notifications_get, self.stats_workspace, self.stream_subscribe,
+                         self.clear]:
+            routed[function.__name__] = function
+        return routed
+
+    def channels_create(self, token, name, is_public):
+        '''
+        New channels are spread over the shards in turn.
+        '''
+        index = next(self.create_counter) % self.count
+        return self.call(index, 'channels_create', token, name, is_public)
+
+    def channels_list(self, token):
+        '''
+        The channels of every shard, in order of channel_id.
+        '''
+        user_channels = []
+        for page in self.call_all('channels_list', token):
+            user_channels.extend(page['channels'])
+        user_channels.sort(key=lambda channel: channel['channel_id'])
+        return {
+            'channels' : user_channels,
+        }
+
+    def channels_unread(self, token):
+        '''
+        The unread counts of every shard, in order of channel_id.
+        '''
+        user_channels = []
+        for page in self.call_all('channels_unread', token):
+            user_channels.extend(page['channels'])
+        user_channels.sort(key=lambda channel: channel['channel_id'])
+        return {
+            'channels' : user_channels,
+        }
+
+    def channels_listall_json(self, token, limit=None, cursor=None, name_prefix=None):
+        '''
+        Without paging, every channel in order of channel_id. Otherwise the
+        name ordered lists of the shards are merged and paged here, with
+        the same cursors as channels_listall.
+        '''
+        if limit is None and cursor is None and name_prefix is None:
+            all_channels = []
+            for page in self.call_all('channels_listall', token):
+                all_channels.extend(page['channels'])
+            all_channels.sort(key=lambda channel: channel['channel_id'])
+            return dumps({
+                'channels' : all_channels,
+            })
+
+        if name_prefix is None:
+            name_prefix = ''
+        pages = self.call_all('channels_listall', token, None, None, name_prefix)
+        if limit is not None and limit <= 0:
+            raise InputError(description="Limit must be positive")
+        merged = list(heapq.merge(*[page['channels'] for page in pages],
+                                  key=lambda channel: (channel['name'], channel['channel_id'])))
+        lower = 0
+        if cursor is not None:
+            positions = [idx for idx, channel in enumerate(merged)
+                         if channel['channel_id'] == cursor]
+            if len(positions) == 0:
+                raise InputError(description="Invalid cursor")
+            lower = positions[0] + 1
+        upper = len(merged) if limit is None else lower + limit
+        page_channels = merged[lower:upper]
+        next_cursor = -1
+        if upper < len(merged):
+            next_cursor = page_channels[-1]['channel_id']
+        return dumps({
+            'channels' : page_channels,
+            'next_cursor' : next_cursor,
+        })
+
+    def search(self, token, query_str, limit=None, cursor=None, filters=None):
+        '''
+        The matches of every shard, oldest first. A page is made of the
+        newest first pages of the shards, merged here: the shard holding
+        the cursor gives its position to the others.
+        '''
+        if limit is not None or cursor is not None:
+            after = None
+            if cursor is not None:
+                after = self.call(self.shard_of(channel_id_of(cursor)), 'search_cursor_key',
+                                  cursor)
+            pages = self.call_all('search_page', token, query_str, limit, after, filters)
+            page = []
+            next_cursor = -1
+            for message in heapq.merge(*[shard_page['messages'] for shard_page in pages], reverse=True,
+                                       key=lambda msg: (msg['time_created'], msg['message_id'])):
+                if limit is not None and len(page) == limit:
+                    next_cursor = page[-1]['message_id']
+                    break
+                page.append(message)
+            # a shard with more matches than its page
+            if any(shard_page['next_cursor'] != -1 for shard_page in pages) and next_cursor == -1:
+                next_cursor = page[-1]['message_id']
+            return {
+                'messages' : page,
+                'next_cursor' : next_cursor,
+            }
+
+        found = []
+        for result in self.call_all('search', token, query_str, None, None, filters):
+            found.extend(result['messages'])
+        found.sort(key=lambda msg: (msg['time_created'], msg['message_id']))
+        return {
+            'messages' : found,
+        }
+
+    def notifications_get(self, token, limit=None, cursor=None):
+        '''
+        The newest first pages of the shards, merged by mention key:
+        the shard holding the cursor gives its key to the others.
+        '''
+        before = None
+        if cursor is not None:
+            before = self.call(self.shard_of(channel_id_of(cursor)), 'notification_cursor_key',
+                               token, cursor)
+        pages = self.call_all('notifications_page', token, limit, before)
+        if limit is None:
+            limit = 20
+        merged = heapq.merge(*[zip(shard_page['keys'], shard_page['notifications'])
+                               for shard_page in pages], reverse=True, key=lambda pair: pair[0])
+        page = list(itertools.islice(merged, limit + 1))
+        next_cursor = -1
+        if len(page) > limit or any(shard_page['next_cursor'] != -1 for shard_page in pages):
+            page = page[:limit]
+            next_cursor = page[-1][1]['message_id']
+        return {
+            'notifications' : [notification for _, notification in page],
+            'next_cursor' : next_cursor,
+        }
+
+    def stats_workspace(self, token):
+        '''
+        The counters of the shards added up, bucket by bucket. Every shard
+        reads its buckets at the same time and the senders of a bucket
+        are joined, a user active on several shards counts once.
+        Users are on every shard, so they are counted on the first one.
+        '''
+        counts = self.call_all('stats_workspace_counts', token, int(time.time()), True)
+        merged = dict(counts[0])
+        for name in ['channels', 'messages', 'sent', 'joins', 'leaves']:
+            merged[name] = sum(shard_counts[name] for shard_counts in counts)
+        for width in ['minutes', 'hours']:
+            buckets = []
+            for shard_buckets in zip(*[shard_counts[width] for shard_counts in counts]):
+                bucket = dict(shard_buckets[0])
+                for name in ['sent', 'joins', 'leaves']:
+                    bucket[name] = sum(shard_bucket[name] for shard_bucket in shard_buckets)
+                bucket['senders'] = set().union(*[shard_bucket['senders']
+                                                  for shard_bucket in shard_buckets])
+                buckets.append(bucket)
+            merged[width] = buckets
+        return workspace_summary(merged)
+
+    def auth_pwreset_req(self, email):
+        '''
+        The reset code is random, so it is made by the first shard
+        and copied to the others.
+        '''
+        self.call(0, 'auth_pwreset_req', email)
+        code = self.call(0, 'get_reset_code', email)
+        for index in range(1, self.count):
+            self.call(index, 'copy_reset_code', email, code)
+        return {}
+
+    def user_profile_uploadphoto(self, token, img_url, x_start, y_start, x_end, y_end,
+                                 server_url):
+        '''
+        The photo is downloaded once by the first shard,
+        and its url is copied to the others.
+        '''
+        self.call(0, 'user_profile_uploadphoto', token, img_url,
+                  x_start, y_start, x_end, y_end, server_url)
+        url = self.call(0, 'profile_img_url', token)
+        for index in range(1, self.count):
+            self.call(index, 'copy_profile_img_url', token, url)
+        return {}
+
+    def stream_subscribe(self, token, channel_id):
+        '''
+        The shard holding the channel checks the user,
+        the subscriber is kept in this process.
+        '''
+        u_id = self.call(self.shard_of(channel_id), 'stream_authorise', token, channel_id)
+        return add_subscriber(channel_id, u_id)
+
+    def clear(self):
+        self.call_all('clear')
+        self.create_counter = itertools.count()
+        reset_streams()
+        return {}
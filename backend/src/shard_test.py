@@ -0,0 +1,155 @@
+''' Test file for shard.py '''
+
+import json
+import pytest
+from error import InputError, AccessError
+from shard import ShardRouter
+from stream import stream_next
+
+@pytest.fixture(scope='module')
+def router():
+    '''
+    start 2 shard workers for the whole module
+    '''
+    shard_router = ShardRouter(2)
+    yield shard_router.functions()
+    shard_router.close()
+
+@pytest.fixture
+def initial_data(router):
+    '''
+    register 2 users, user 1 creates 3 channels spread over both shards
+    and user 2 joins the last one
+    '''
+    router['clear']()
+    tokens = []
+    for idx in range(1, 3):
+        router['auth_register']('test' + str(idx) + '@test.com', 'password',
+                                'user' + str(idx), 'user' + str(idx))
+        tokens.append(router['auth_login']('test' + str(idx) + '@test.com',
+                                           'password')['token'])
+    channel_ids = [router['channels_create'](tokens[0], name, True)['channel_id']
+                   for name in ['c', 'a', 'b']]
+    router['channel_join'](tokens[1], channel_ids[2])
+    return tokens, channel_ids
+
+def test_shard_channels(router, initial_data):
+    '''
+    channel ids are unique over the shards and listings are merged
+    '''
+    tokens, channel_ids = initial_data
+    assert channel_ids == [1, 2, 3]
+    assert router['channels_list'](tokens[1]) == {
+        'channels' : [{'channel_id' : 3, 'name' : 'b'}],
+    }
+    assert [channel['channel_id'] for channel in
+            json.loads(router['channels_listall_json'](tokens[0]))['channels']] == [1, 2, 3]
+    page = json.loads(router['channels_listall_json'](tokens[0], 2))
+    assert page == {
+        'channels' : [{'channel_id' : 2, 'name' : 'a'}, {'channel_id' : 3, 'name' : 'b'}],
+        'next_cursor' : 3,
+    }
+    page = json.loads(router['channels_listall_json'](tokens[0], 2, 3))
+    assert page == {
+        'channels' : [{'channel_id' : 1, 'name' : 'c'}],
+        'next_cursor' : -1,
+    }
+    with pytest.raises(InputError):
+        router['channels_listall_json'](tokens[0], 2, 99)
+
+def test_shard_messages(router, initial_data):
+    '''
+    messages are routed to the shard of their channel and search fans out
+    '''
+    tokens, channel_ids = initial_data
+    first = router['message_send'](tokens[0], channel_ids[0], 'hello one')['message_id']
+    second = router['message_send'](tokens[0], channel_ids[1], 'hello two')['message_id']
+    assert first // 10000 == channel_ids[0]
+    assert second // 10000 == channel_ids[1]
+    router['message_edit'](tokens[0], second, 'hello again')
+    page = json.loads(router['channel_messages_json'](tokens[0], channel_ids[1], 0))
+    assert [msg['message'] for msg in page['messages']] == ['hello again']
+    found = router['search'](tokens[0], 'hello')['messages']
+    assert [msg['message_id'] for msg in found] == [first, second]
+    assert router['search'](tokens[1], 'hello') == {'messages' : []}
+    page = router['search'](tokens[0], 'hello', 1)
+    assert [msg['message_id'] for msg in page['messages']] == [second]
+    page = router['search'](tokens[0], 'hello', 1, page['next_cursor'])
+    assert [msg['message_id'] for msg in page['messages']] == [first]
+    assert page['next_cursor'] == -1
+
+    router['channel_join'](tokens[1], channel_ids[0])
+    mentions = [router['message_send'](tokens[0], channel_id, 'hi @user2user2')['message_id']
+                for channel_id in [channel_ids[0], channel_ids[2], channel_ids[0]]]
+    page = router['notifications_get'](tokens[1], 2)
+    assert [item['message_id'] for item in page['notifications']] == [mentions[1], mentions[2]]
+    page = router['notifications_get'](tokens[1], 2, page['next_cursor'])
+    assert [item['message_id'] for item in page['notifications']] == [mentions[0]]
+    assert page['next_cursor'] == -1
+    assert router['channels_unread'](tokens[1]) == {
+        'channels' : [
+            {'channel_id' : channel_ids[0], 'unread' : 2},
+            {'channel_id' : channel_ids[2], 'unread' : 1},
+        ],
+    }
+
+def test_shard_stats(router, initial_data):
+    '''
+    workspace statistics are added up over the shards
+    '''
+    tokens, channel_ids = initial_data
+    for channel_id in channel_ids:
+        router['message_send'](tokens[0], channel_id, 'hello')
+    router['message_send'](tokens[1], channel_ids[2], 'hi')
+    stats = router['stats_workspace'](tokens[0])
+    assert (stats['users'], stats['channels'], stats['messages'], stats['joins']) == (2, 3, 4, 1)
+    assert sum(bucket['sent'] for bucket in stats['minutes']) == 4
+    assert sum(bucket['registered'] for bucket in stats['hours']) == 2
+    assert max(bucket['active_users'] for bucket in stats['hours']) == 2
+    stats = router['stats_channel'](tokens[1], channel_ids[2])
+    assert (stats['members'], stats['messages'], stats['joins']) == (2, 2, 1)
+    with pytest.raises(AccessError):
+        router['stats_workspace'](tokens[1])
+
+def test_shard_users(router, initial_data):
+    '''
+    user changes reach every shard
+    '''
+    tokens, channel_ids = initial_data
+    router['user_profile_setname'](tokens[1], 'new', 'name')
+    for channel_id in channel_ids:
+        router['channel_invite'](tokens[0], channel_id, 2)
+        members = router['channel_details'](tokens[0], channel_id)['all_members']
+        assert members[-1]['name_first'] == 'new'
+    router['auth_pwreset_req']('test2@test.com')
+    code = router['get_reset_code']('test2@test.com')
+    router['auth_pwreset_set'](code, 'new_password')
+    assert router['auth_login']('test2@test.com', 'new_password')['token'] == tokens[1]
+
+def test_shard_stream(router, initial_data):
+    '''
+    events published by a worker reach subscribers of the router
+    '''
+    tokens, channel_ids = initial_data
+    subscriber = router['stream_subscribe'](tokens[1], channel_ids[2])
+    msg_id = router['message_send'](tokens[0], channel_ids[2], 'hi')['message_id']
+    event, data = stream_next(subscriber, 5)
+    assert event == 'message_new'
+    assert json.loads(data)['message_id'] == msg_id
+    with pytest.raises(AccessError):
+        router['stream_subscribe'](tokens[1], channel_ids[0])
+    router['channel_leave'](tokens[1], channel_ids[2])
+    router['message_send'](tokens[0], channel_ids[2], 'secret')
+    assert stream_next(subscriber, 5) == ('evicted', '{}')
+
+def test_shard_errors(router, initial_data):
+    '''
+    errors raised by a worker are raised by the router
+    '''
+    tokens, channel_ids = initial_data
+    with pytest.raises(AccessError):
+        router['message_send']('invalid_token', channel_ids[0], 'hi')
+    with pytest.raises(InputError):
+        router['message_remove'](tokens[0], 99990001)
+    with pytest.raises(AccessError):
+        router['channels_list']('invalid_token')
@@ -0,0 +1,105 @@
+'''
+import threading to count versions from many threads
+import islice to copy a channel's messages up to a length
+import locks so a channel's messages are read under its read lock
+
+Copy on write snapshots for the read heavy listing endpoints.
+Readers get an immutable tuple built from the live data at some version,
+and keep using it however long their scan takes, while writers go on
+changing the live lists. A writer only bumps a version number, the
+first reader after a change builds the next snapshot and publishes it
+by replacing a single reference, so readers never block writers.
+'''
+import threading
+from itertools import islice
+from locks import channel_lock
+
+# name -> {'version': latest version, 'current': (version, snapshot) or None}
+views = {}
+views_lock = threading.Lock()
+
+def new_version(name):
+    '''
+    This function is called by writers after changing the data behind a view.
+
+    Args:
+        param1(str): name of the view, 'users' / 'channels' / 'channel_names'
+    '''
+    with views_lock:
+        entry = views.setdefault(name, {'version' : 0, 'current' : None})
+        entry['version'] += 1
+
+def view_version(name):
+    '''
+    This function gets the latest version of a view, so results
+    derived from a snapshot can be cached along with its version.
+
+    Args:
+        param1(str): name of the view
+
+    Returns:
+        It will return an int
+    '''
+    with views_lock:
+        entry = views.setdefault(name, {'version' : 0, 'current' : None})
+        return entry['version']
+
+def read_snapshot(name, build):
+    '''
+    This function gets the snapshot of a view, building it from the live
+    data if there has been a new version since it was last built.
+
+    Args:
+        param1(str): name of the view
+        param2(function): builds the items of the view from the live data
+
+    Returns:
+        It will return a tuple
+    '''
+    with views_lock:
+        entry = views.setdefault(name, {'version' : 0, 'current' : None})
+    # read the version first, a change while building makes this snapshot stale
+    version = entry['version']
+    current = entry['current']
+    if current is not None and current[0] == version:
+        return current[1]
+    snapshot = tuple(build())
+    entry['current'] = (version, snapshot)
+    return snapshot
+
+def channel_snapshot(channel):
+    '''
+    This function gets the snapshot of a channel's live messages,
+    as (text, message) pairs, oldest first. It is rebuilt after
+    the channel's version is bumped by touch_channel in helper.py.
+
+    Args:
+        param1(dict): target channel
+
+    Returns:
+        It will return a tuple
+    '''
+    current = channel['snapshot']
+    version = channel['version']
+    if current is not None and current[0] == version:
+        return current[1]
+    # messages are only appended and compaction swaps in a new list,
+    # so the list and its length taken under the lock can be copied after it
+    with channel_lock(channel['channel_id']).read():
+        version = channel['version']
+        msg_list = channel['messages']
+        count = len(msg_list)
+        tombstones = frozenset(channel['tombstones'])
+    snapshot = tuple((msg['message'], msg) for msg in islice(msg_list, count)
+                     if msg['message_id'] not in tombstones)
+    channel['snapshot'] = (version, snapshot)
+    return snapshot
+
+def reset_snapshots():
+    '''
+    This is a helper function to drop every snapshot when data is cleared.
+    '''
+    with views_lock:
+        for entry in views.values():
+            entry['version'] += 1
+            entry['current'] = None
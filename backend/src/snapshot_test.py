@@ -0,0 +1,99 @@
+''' Test file for snapshot.py '''
+
+import pytest
+from other import clear, users_all, search
+from data import users, channels
+from auth import auth_register, auth_login
+from channels import channels_create, channels_listall
+from message import message_send, message_edit, message_remove
+from user import user_profile_setname
+from snapshot import new_version, read_snapshot, channel_snapshot
+from helper import touch_channel
+from locks import channel_lock
+
+@pytest.fixture
+def initial_data():
+    '''
+    register 2 users and user 1 creates a public channel
+    '''
+    clear()
+    auth_register('test1@test.com', 'password', 'user1', 'user1')
+    auth_login('test1@test.com', 'password')
+    auth_register('test2@test.com', 'password', 'user2', 'user2')
+    auth_login('test2@test.com', 'password')
+    channels_create(users[0]['token'], 'channel_1', True)
+
+def test_snapshot_versions(initial_data):
+    '''
+    a snapshot is built once per version and never changes once built
+    '''
+    live = [1, 2]
+    builds = []
+    def build():
+        builds.append(1)
+        return live
+    first = read_snapshot('test', build)
+    assert read_snapshot('test', build) is first
+    assert len(builds) == 1
+    live.append(3)
+    new_version('test')
+    second = read_snapshot('test', build)
+    assert first == (1, 2)
+    assert second == (1, 2, 3)
+    assert len(builds) == 2
+
+def test_snapshot_users_all(initial_data):
+    '''
+    users_all is served from the snapshot until a user is added or changed
+    '''
+    before = users_all(users[0]['token'])['users']
+    assert users_all(users[0]['token'])['users'] == before
+    user_profile_setname(users[1]['token'], 'new', 'name')
+    after = users_all(users[0]['token'])['users']
+    assert before[1]['name_first'] == 'user2'
+    assert after[1]['name_first'] == 'new'
+    auth_register('test3@test.com', 'password', 'user3', 'user3')
+    assert len(users_all(users[0]['token'])['users']) == 3
+
+def test_snapshot_listall(initial_data):
+    '''
+    channels_listall sees channels created after its first call
+    '''
+    assert len(channels_listall(users[0]['token'])['channels']) == 1
+    channels_create(users[0]['token'], 'channel_2', True)
+    assert len(channels_listall(users[0]['token'])['channels']) == 2
+    assert len(channels_listall(users[0]['token'], 5)['channels']) == 2
+
+def test_snapshot_search(initial_data):
+    '''
+    search scans a snapshot that follows sends, edits and removes,
+    and a snapshot held by a reader is not changed by them
+    '''
+    msg_id = message_send(users[0]['token'], 1, 'hello')['message_id']
+    held = channel_snapshot(channels[0])
+    assert channel_snapshot(channels[0]) is held
+    message_edit(users[0]['token'], msg_id, 'goodbye')
+    assert search(users[0]['token'], 'hello') == {'messages' : []}
+    assert len(search(users[0]['token'], 'goodbye')['messages']) == 1
+    message_remove(users[0]['token'], msg_id)
+    assert search(users[0]['token'], 'goodbye') == {'messages' : []}
+    assert [text for text, _ in held] == ['hello']
+
+def test_snapshot_copied_outside_lock(initial_data):
+    '''
+    a channel's messages are copied after its read lock is released,
+    up to the length they had under the lock
+    '''
+    message_send(users[0]['token'], 1, 'hello')
+    readers = []
+
+    class WatchedList(list):
+        def __iter__(self):
+            readers.append(channel_lock(1).readers)
+            self.append(dict(self[0], message_id=self[0]['message_id'] + 1))
+            return super().__iter__()
+
+    channels[0]['messages'] = WatchedList(channels[0]['messages'])
+    touch_channel(channels[0])
+    assert [text for text, _ in channel_snapshot(channels[0])] == ['hello']
+    assert readers == [0]
@@ -3,12 +3,19 @@ import time module to get current time
 import threading to start standup_end function
 import error for error raising
 import helper for getting data
+import locks so a standup is started, fed and ended under the channel's write lock
+import record_time to add the standup's message to the time column
 '''
 import time
 import threading
 from data import create_new_msg
+from message_ids import MSG_ID_BASE
+from message import append_msg_to_channel
 from error import InputError, AccessError
 from helper import get_user_from_token, get_channel_from_id
+from membership import is_member
+from locks import channel_lock
+from search_index import record_time
 
 def standup_start(token, channel_id, length):
     '''
@@ -42,16 +49,17 @@ def standup_start(token, channel_id, length):
     # input error when given channel_id is invalid
     if channel is None:
         raise InputError(description='Invalid channel_id')
-    # input error when an active standup is currently runing in this channel
-    if standup_active(token, channel_id)['is_active'] is True:
-        raise InputError(description='Standup has started')
-
-    # reset data for standup
-    channel['time_standupend'] = int(time.time()) + length
-    channel['standup_msg'] = ''
-    # set standup_end
-    timer = threading.Timer(length, standup_end, args=[user, channel])
-    timer.start()
+    with channel_lock(channel_id).write():
+        # input error when an active standup is currently runing in this channel
+        if standup_active(token, channel_id)['is_active'] is True:
+            raise InputError(description='Standup has started')
+
+        # reset data for standup
+        channel['time_standupend'] = int(time.time()) + length
+        channel['standup_msg'] = ''
+        # set standup_end
+        timer = threading.Timer(length, standup_end, args=[user, channel])
+        timer.start()
     return {
         'time_finish' : int(time.time()) + length
     }
@@ -129,20 +137,21 @@ def standup_send(token, channel_id, message):
     if channel is None:
         raise InputError(description='Invalid channel_id')
 
-    # input error when An active standup is not currently running in this channel
-    if standup_active(token, channel_id)['is_active'] is False:
-        raise InputError(description='No active standup')
+    with channel_lock(channel_id).write():
+        # input error when An active standup is not currently running in this channel
+        if standup_active(token, channel_id)['is_active'] is False:
+            raise InputError(description='No active standup')
 
-    # input error when msg is too long
-    if len(message) > 1000:
-        raise InputError(description='Message is too long')
+        # input error when msg is too long
+        if len(message) > 1000:
+            raise InputError(description='Message is too long')
 
-    # access error when The authorised user is not a member of
-    # the channel that the message is within
-    if channel_id not in user['channels']:
-        raise AccessError(description='Not a member')
+        # access error when The authorised user is not a member of
+        # the channel that the message is within
+        if is_member(user['u_id'], channel_id) is False:
+            raise AccessError(description='Not a member')
 
-    channel['standup_msg'] += '\n' + user['handle'] + ': ' + message
+        channel['standup_msg'] += '\n' + user['handle'] + ': ' + message
     return {}
 
 def standup_end(user, channel):
@@ -159,8 +168,12 @@ def standup_end(user, channel):
     Returns:
         no return
     '''
-    channel['time_standupend'] = 0
-    if len(channel['standup_msg']) != 0:
-        new_msg = create_new_msg(channel['standup_msg'], channel, user['u_id'])
-        channel['latest_msg_id'] += 1
-        channel['messages'].append(new_msg)
+    with channel_lock(channel['channel_id']).write():
+        channel['time_standupend'] = 0
+        # a full channel takes no more messages, see create_new_msg,
+        # and a timer has no caller to raise to
+        if len(channel['standup_msg']) != 0 and channel['latest_msg_id'] + 1 < MSG_ID_BASE:
+            new_msg = create_new_msg(channel['standup_msg'], channel, user['u_id'])
+            channel['latest_msg_id'] += 1
+            record_time(channel['channel_id'], new_msg['time_created'])
+            append_msg_to_channel(new_msg, channel)
@@ -0,0 +1,243 @@
+'''
+import time to put every event into its minute and hour
+import threading to guard the counters while they change
+
+Workspace and channel statistics, read by stats_workspace and
+stats_channel in other.py. Counters are moved by the events themselves:
+registering, sending and removing a message, joining and leaving a
+channel. Every event is also added to a ring of per minute and per hour
+buckets, a bucket being reused once its slot comes round again, so
+reading the statistics never reads a message and costs the same however
+old or busy the workspace is.
+'''
+import time
+import threading
+
+MINUTE = 60
+HOUR = 3600
+# width of a bucket -> number of buckets kept
+KEPT = {
+    MINUTE : 60,
+    HOUR : 24,
+}
+
+def new_stats():
+    '''
+    This is a helper function to make the counters of the workspace
+    or of a channel.
+    '''
+    return {
+        # live messages, sent minus removed
+        'messages' : 0,
+        'sent' : 0,
+        'joins' : 0,
+        'leaves' : 0,
+        # width -> ring of buckets, None until an event falls in the slot
+        'rollup' : {width : [None] * kept for width, kept in KEPT.items()},
+    }
+
+workspace_stats = new_stats()
+# channel_id -> counters of the channel, from new_stats
+channel_stats = {}
+stats_lock = threading.Lock()
+
+def add_event(counters, event, now, u_id=None):
+    '''
+    This is a helper function to add an event to the buckets it falls in,
+    under stats_lock.
+
+    Args:
+        param1(dict): counters from new_stats
+        param2(str): 'sent', 'joins', 'leaves' or 'registered'
+        param3(int): time of the event
+        param4(int): u_id of the sender, counted as an active user
+    '''
+    for width, ring in counters['rollup'].items():
+        start = now - now % width
+        slot = (now // width) % len(ring)
+        bucket = ring[slot]
+        if bucket is None or bucket['time_start'] != start:
+            bucket = {
+                'time_start' : start,
+                'sent' : 0,
+                'joins' : 0,
+                'leaves' : 0,
+                'registered' : 0,
+                'senders' : set(),
+                'active_users' : 0,
+            }
+            ring[slot] = bucket
+        bucket[event] += 1
+        if u_id is not None and u_id not in bucket['senders']:
+            bucket['senders'].add(u_id)
+            bucket['active_users'] += 1
+
+def channel_counters(channel_id):
+    '''
+    This is a helper function to get the counters of a channel, under stats_lock.
+    '''
+    counters = channel_stats.get(channel_id)
+    if counters is None:
+        counters = new_stats()
+        channel_stats[channel_id] = counters
+    return counters
+
+def count_registered():
+    '''
+    This function counts a newly registered user.
+    '''
+    with stats_lock:
+        add_event(workspace_stats, 'registered', int(time.time()))
+
+def count_sent(channel_id, u_id):
+    '''
+    This function counts a message appended to a channel.
+
+    Args:
+        param1(int): channel_id
+        param2(int): u_id of the sender
+    '''
+    now = int(time.time())
+    with stats_lock:
+        for counters in [workspace_stats, channel_counters(channel_id)]:
+            counters['messages'] += 1
+            counters['sent'] += 1
+            add_event(counters, 'sent', now, u_id)
+
+def count_removed(channel_id):
+    '''
+    This function counts a message removed from a channel.
+
+    Args:
+        param1(int): channel_id
+    '''
+    with stats_lock:
+        for counters in [workspace_stats, channel_counters(channel_id)]:
+            counters['messages'] -= 1
+
+def count_membership(channel_id, event):
+    '''
+    This function counts a user joining or leaving a channel.
+
+    Args:
+        param1(int): channel_id
+        param2(str): 'joins' or 'leaves'
+    '''
+    now = int(time.time())
+    with stats_lock:
+        for counters in [workspace_stats, channel_counters(channel_id)]:
+            counters[event] += 1
+            add_event(counters, event, now)
+
+def drop_channel_stats(channel_id):
+    '''
+    This function drops the counters of an archived channel,
+    its messages are no longer live in the workspace.
+
+    Args:
+        param1(int): channel_id
+    '''
+    with stats_lock:
+        counters = channel_stats.pop(channel_id, None)
+        if counters is not None:
+            workspace_stats['messages'] -= counters['messages']
+
+def read_buckets(counters, width, now, senders=False):
+    '''
+    This is a helper function to read the last buckets of a width,
+    oldest first, with empty buckets for the slots without events.
+
+    Args:
+        param1(dict): counters from new_stats
+        param2(int): width of the buckets, MINUTE or HOUR
+        param3(int): time to read the buckets at
+        param4(bool): True to copy the u_id of the senders of every bucket,
+            only needed to merge the buckets of several shards
+
+    Returns:
+        It will return a list of dict
+        {
+            'time_start', 'sent', 'joins', 'leaves', 'registered', 'active_users',
+            'senders' : list of u_id, only if senders is True
+        }
+    '''
+    ring = counters['rollup'][width]
+    current = now // width
+    buckets = []
+    for idx in range(current - len(ring) + 1, current + 1):
+        bucket = ring[idx % len(ring)]
+        if bucket is None or bucket['time_start'] != idx * width:
+            bucket = {'sent' : 0, 'joins' : 0, 'leaves' : 0, 'registered' : 0,
+                      'senders' : (), 'active_users' : 0}
+        read = {
+            'time_start' : idx * width,
+            'sent' : bucket['sent'],
+            'joins' : bucket['joins'],
+            'leaves' : bucket['leaves'],
+            'registered' : bucket['registered'],
+            'active_users' : bucket['active_users'],
+        }
+        if senders:
+            read['senders'] = list(bucket['senders'])
+        buckets.append(read)
+    return buckets
+
+def read_stats(channel_id=None, now=None, senders=False):
+    '''
+    This function reads the counters of the workspace or of a channel.
+    Buckets keep the number of their senders, and their u_id as well so
+    buckets of several shards can be merged; count_active turns the merged
+    u_id into counts.
+
+    Args:
+        param1(int): channel_id, None for the workspace
+        param2(int): time to read the buckets at, now if None
+        param3(bool): True to read the u_id of the senders of every bucket
+
+    Returns:
+        It will return a dict
+        {
+            'messages', 'sent', 'joins', 'leaves',
+            'minutes' : buckets of the last hour, from read_buckets,
+            'hours' : buckets of the last day, from read_buckets,
+        }
+    '''
+    if now is None:
+        now = int(time.time())
+    with stats_lock:
+        if channel_id is None:
+            counters = workspace_stats
+        else:
+            counters = channel_stats.get(channel_id, new_stats())
+        return {
+            'messages' : counters['messages'],
+            'sent' : counters['sent'],
+            'joins' : counters['joins'],
+            'leaves' : counters['leaves'],
+            'minutes' : read_buckets(counters, MINUTE, now, senders),
+            'hours' : read_buckets(counters, HOUR, now, senders),
+        }
+
+def count_active(buckets):
+    '''
+    This function replaces the senders of every bucket by their number,
+    once the buckets of several shards are merged.
+
+    Returns:
+        It will return a list of dict
+        {'time_start', 'sent', 'joins', 'leaves', 'registered', 'active_users'}
+    '''
+    counted = []
+    for bucket in buckets:
+        bucket = dict(bucket)
+        bucket['active_users'] = len(bucket.pop('senders'))
+        counted.append(bucket)
+    return counted
+
+def reset_stats():
+    '''
+    This is a helper function to empty the counters when data is cleared.
+    '''
+    with stats_lock:
+        workspace_stats.update(new_stats())
+        channel_stats.clear()
@@ -0,0 +1,128 @@
+''' Test file for stats.py, stats_workspace and stats_channel in other.py '''
+
+import pytest
+from other import clear, stats_workspace, stats_channel
+from data import users
+from auth import auth_register, auth_login
+from channels import channels_create
+from channel import channel_join, channel_leave, channel_invite, channel_archive
+from message import message_send, message_remove
+from stats import MINUTE, HOUR, new_stats, add_event, read_buckets, count_active
+from error import InputError, AccessError
+
+@pytest.fixture
+def initial_data():
+    '''
+    register 3 users, user 1 creates 2 channels and user 2 joins the first
+    '''
+    clear()
+    for idx in range(1, 4):
+        auth_register('test' + str(idx) + '@test.com', 'password', 'user' + str(idx), 'last')
+        auth_login('test' + str(idx) + '@test.com', 'password')
+    channels_create(users[0]['token'], 'channel_1', True)
+    channels_create(users[0]['token'], 'channel_2', True)
+    channel_join(users[1]['token'], 1)
+
+def test_buckets_roll_over():
+    '''
+    events fall in their minute and hour, a slot is reused once its
+    bucket is older than the buckets kept
+    '''
+    counters = new_stats()
+    start = 1000 * HOUR
+    add_event(counters, 'sent', start, 1)
+    add_event(counters, 'sent', start + 30, 2)
+    add_event(counters, 'sent', start + MINUTE, 1)
+
+    minutes = read_buckets(counters, MINUTE, start + MINUTE)
+    assert len(minutes) == 60
+    assert minutes[-1]['time_start'] == start + MINUTE
+    assert [(bucket['sent'], bucket['active_users']) for bucket in minutes[-2:]] == [(2, 2), (1, 1)]
+    assert sum(bucket['sent'] for bucket in minutes[:-2]) == 0
+
+    # two hours later the slot of the first minute holds the new minute
+    add_event(counters, 'joins', start + 2 * HOUR)
+    minutes = read_buckets(counters, MINUTE, start + 2 * HOUR)
+    assert [bucket['joins'] for bucket in minutes if bucket['joins'] != 0] == [1]
+    assert sum(bucket['sent'] for bucket in minutes) == 0
+    hours = read_buckets(counters, HOUR, start + 2 * HOUR)
+    assert len(hours) == 24
+    assert [(bucket['sent'], bucket['active_users'], bucket['joins'])
+            for bucket in hours[-3:]] == [(3, 2, 0), (0, 0, 0), (0, 0, 1)]
+    # an hour later than a day, the first hour's slot is read as empty
+    hours = read_buckets(counters, HOUR, start + 24 * HOUR)
+    assert sum(bucket['sent'] for bucket in hours) == 0
+    add_event(counters, 'sent', start + 24 * HOUR, 3)
+    hours = read_buckets(counters, HOUR, start + 24 * HOUR)
+    assert (hours[-1]['sent'], hours[-1]['active_users']) == (1, 1)
+    assert 'senders' not in hours[-1]
+
+def test_buckets_senders():
+    '''
+    the senders of a bucket are only copied when asked for,
+    to be merged and counted by count_active
+    '''
+    counters = new_stats()
+    start = 1000 * HOUR
+    for u_id in [1, 2, 1]:
+        add_event(counters, 'sent', start, u_id)
+    minutes = read_buckets(counters, MINUTE, start, True)
+    assert sorted(minutes[-1]['senders']) == [1, 2]
+    assert minutes[-1]['active_users'] == 2
+    assert minutes[0]['senders'] == []
+    counted = count_active(minutes)
+    assert counted[-1]['active_users'] == 2
+    assert 'senders' not in counted[-1]
+
+def test_stats_workspace(initial_data):
+    '''
+    counters follow sends, removes, joins, leaves and archives
+    '''
+    sent = [message_send(users[0]['token'], 1, 'msg ' + str(idx))['message_id']
+            for idx in range(3)]
+    message_send(users[1]['token'], 1, 'reply')
+    message_send(users[0]['token'], 2, 'other')
+    message_remove(users[0]['token'], sent[0])
+    channel_invite(users[0]['token'], 2, users[2]['u_id'])
+    channel_leave(users[1]['token'], 1)
+
+    stats = stats_workspace(users[0]['token'])
+    assert (stats['users'], stats['channels']) == (3, 2)
+    assert (stats['messages'], stats['sent'], stats['joins'], stats['leaves']) == (4, 5, 2, 1)
+    for width in ['minutes', 'hours']:
+        assert sum(bucket['sent'] for bucket in stats[width]) == 5
+        assert sum(bucket['registered'] for bucket in stats[width]) == 3
+        assert sum(bucket['joins'] for bucket in stats[width]) == 2
+    assert max(bucket['active_users'] for bucket in stats['hours']) == 2
+
+    channel_archive(users[0]['token'], 2)
+    stats = stats_workspace(users[0]['token'])
+    assert (stats['channels'], stats['messages'], stats['sent']) == (1, 3, 5)
+
+    with pytest.raises(AccessError):
+        stats_workspace(users[1]['token'])
+    with pytest.raises(AccessError):
+        stats_workspace('invalid_token')
+
+def test_stats_channel(initial_data):
+    '''
+    a channel's counters are its own, read by its members and owners of flockr
+    '''
+    message_send(users[0]['token'], 1, 'hello')
+    message_send(users[1]['token'], 1, 'hi')
+    message_send(users[0]['token'], 2, 'other')
+    channel_join(users[2]['token'], 1)
+    channel_leave(users[2]['token'], 1)
+
+    stats = stats_channel(users[1]['token'], 1)
+    assert stats['channel_id'] == 1
+    assert (stats['members'], stats['messages'], stats['joins'], stats['leaves']) == (2, 2, 2, 1)
+    assert sum(bucket['sent'] for bucket in stats['minutes']) == 2
+    assert max(bucket['active_users'] for bucket in stats['minutes']) == 2
+    assert 'registered' not in stats['hours'][0]
+    assert stats_channel(users[0]['token'], 2)['messages'] == 1
+
+    with pytest.raises(AccessError):
+        stats_channel(users[2]['token'], 1)
+    with pytest.raises(InputError):
+        stats_channel(users[0]['token'], 99)
@@ -0,0 +1,237 @@
+'''
+import itertools for subscriber ids
+import queue for bounded per-subscriber buffers
+import threading to guard the subscriber table
+import dumps to serialise each event once for all subscribers
+import error for error raising
+import helper for getting data
+'''
+import itertools
+import queue
+import threading
+from json import dumps
+from error import InputError, AccessError
+from helper import get_user_from_token, get_channel_from_id
+
+# max number of undelivered events a subscriber may hold before eviction
+QUEUE_SIZE = 64
+# seconds between keepalive comments on an idle stream
+KEEPALIVE = 15
+
+# channel_id -> set of subscriber ids, and subscriber id -> subscriber
+channel_subscribers = {}
+subscribers = {}
+subscribers_lock = threading.Lock()
+sub_id_counter = itertools.count(1)
+# when set, events are handed to it instead of local subscribers,
+# a shard worker forwards them to the router this way, see shard.py
+event_sink = {
+    'put' : None,
+}
+
+def stream_subscribe(token, channel_id):
+    '''
+    This function registers the authorised user as a listener
+    of new, edited and removed messages in given channel.
+
+    Args:
+        param1(str): authorised user's token
+        param2(int): id of target channel
+
+    Returns:
+        It will return a subscriber (dict)
+        {
+            'sub_id' : unique id of this subscriber,
+            'channel_id' : channel_id,
+            'u_id' : u_id of the listening user,
+            'queue' : bounded queue of pending events,
+            'evicted' : True once the subscriber fell too far behind,
+        }
+
+    Raises:
+        InputError:
+            Channel ID is not a valid channel
+        AccessError:
+            1. given token is invalid
+            2. the authorised user is not a member of the channel
+    '''
+    u_id = stream_authorise(token, channel_id)
+    return add_subscriber(channel_id, u_id)
+
+def stream_authorise(token, channel_id):
+    '''
+    This function checks that the authorised user may listen to given channel.
+    In sharded mode it runs on the shard holding the channel, while the
+    subscriber itself lives with the router, see shard.py.
+
+    Args:
+        param1(str): authorised user's token
+        param2(int): id of target channel
+
+    Returns:
+        It will return the u_id of the authorised user
+
+    Raises:
+        Same errors as stream_subscribe.
+    '''
+    auth_user = get_user_from_token(token)
+    channel = get_channel_from_id(channel_id)
+    # access error when given token is invalid
+    if auth_user is None:
+        raise AccessError(description='Invalid token')
+    # input error when given channel_id is invalid
+    if channel is None:
+        raise InputError(description='Invalid channel_id')
+    # access error when user hasn't joined the channel
+    if auth_user['u_id'] not in channel['all_members']:
+        raise AccessError(description='Not a member')
+    return auth_user['u_id']
+
+def add_subscriber(channel_id, u_id):
+    '''
+    This is a helper function to register a subscriber of a channel
+    once the user has been authorised.
+
+    Args:
+        param1(int): id of target channel
+        param2(int): u_id of the listening user
+
+    Returns:
+        It will return a subscriber (dict), see stream_subscribe
+    '''
+    subscriber = {
+        'sub_id' : next(sub_id_counter),
+        'channel_id' : channel_id,
+        'u_id' : u_id,
+        'queue' : queue.Queue(maxsize=QUEUE_SIZE),
+        'evicted' : False,
+    }
+    with subscribers_lock:
+        subscribers[subscriber['sub_id']] = subscriber
+        channel_subscribers.setdefault(channel_id, set()).add(subscriber['sub_id'])
+    return subscriber
+
+def stream_unsubscribe(subscriber):
+    '''
+    This function drops a subscriber from the table.
+    It is safe to call more than once.
+
+    Args:
+        param1(dict): subscriber returned by stream_subscribe
+    '''
+    with subscribers_lock:
+        subscribers.pop(subscriber['sub_id'], None)
+        sub_ids = channel_subscribers.get(subscriber['channel_id'])
+        if sub_ids is not None:
+            sub_ids.discard(subscriber['sub_id'])
+            if len(sub_ids) == 0:
+                del channel_subscribers[subscriber['channel_id']]
+
+def stream_next(subscriber, timeout):
+    '''
+    This function waits for the next event of a subscriber.
+
+    Args:
+        param1(dict): subscriber returned by stream_subscribe
+        param2(int): max seconds to wait
+
+    Returns:
+        It will return a tuple (event name, json data),
+        ('evicted', '{}') if the subscriber has been evicted,
+        or None if nothing happened within timeout
+    '''
+    if subscriber['evicted'] is True:
+        return ('evicted', '{}')
+    try:
+        return subscriber['queue'].get(timeout=timeout)
+    except queue.Empty:
+        return None
+
+def stream_events(subscriber):
+    '''
+    This is a generator producing the Server-Sent Events body of a stream.
+    It ends when the subscriber is evicted and always unsubscribes on exit,
+    including when the client goes away.
+
+    Args:
+        param1(dict): subscriber returned by stream_subscribe
+
+    Returns:
+        It yields SSE formatted strings
+    '''
+    try:
+        # flush headers straight away so clients know they are connected
+        yield ': connected\n\n'
+        while True:
+            event = stream_next(subscriber, KEEPALIVE)
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            yield 'event: ' + event[0] + '\ndata: ' + event[1] + '\n\n'
+            if event[0] == 'evicted':
+                break
+    finally:
+        stream_unsubscribe(subscriber)
+
+def publish(channel_id, event, data):
+    '''
+    This is a helper function to push an event to every subscriber of a channel.
+    The event is serialised once. A subscriber whose queue is full is evicted
+    instead of blocking the publisher, and it will be told so on its next read.
+
+    Args:
+        param1(int): id of the channel the event happened in
+        param2(str): event name, 'message_new' / 'message_edit' / 'message_remove'
+        param3(dict): event data
+    '''
+    if event_sink['put'] is not None:
+        event_sink['put']((channel_id, event, data))
+        return
+    if channel_id not in channel_subscribers:
+        return
+    event = (event, dumps(data))
+    with subscribers_lock:
+        targets = [subscribers[sub_id] for sub_id in channel_subscribers.get(channel_id, ())]
+    for subscriber in targets:
+        try:
+            subscriber['queue'].put_nowait(event)
+        except queue.Full:
+            subscriber['evicted'] = True
+            stream_unsubscribe(subscriber)
+
+def drop_subscribers(channel_id, u_id=None):
+    '''
+    This function evicts the subscribers of a channel a user may no longer
+    listen to, as membership is only checked when subscribing.
+    In a shard worker the request is forwarded to the router like an event.
+
+    Args:
+        param1(int): id of the channel
+        param2(int): u_id of the user who left, None for every subscriber
+    '''
+    if event_sink['put'] is not None:
+        event_sink['put']((channel_id, 'drop', {'u_id' : u_id}))
+        return
+    with subscribers_lock:
+        targets = [subscribers[sub_id] for sub_id in channel_subscribers.get(channel_id, ())
+                   if u_id is None or subscribers[sub_id]['u_id'] == u_id]
+    for subscriber in targets:
+        subscriber['evicted'] = True
+        stream_unsubscribe(subscriber)
+        # wake up a reader waiting on the queue
+        try:
+            subscriber['queue'].put_nowait(('evicted', '{}'))
+        except queue.Full:
+            pass
+
+def reset_streams():
+    '''
+    This is a helper function to evict every subscriber.
+    It is called when data is cleared.
+    '''
+    with subscribers_lock:
+        targets = list(subscribers.values())
+        subscribers.clear()
+        channel_subscribers.clear()
+    for subscriber in targets:
+        subscriber['evicted'] = True
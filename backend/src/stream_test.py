@@ -0,0 +1,136 @@
+''' Test file for stream.py '''
+
+import json
+import pytest
+import stream
+from other import clear
+from error import InputError, AccessError
+from data import users, channels
+from auth import auth_register, auth_login
+from channels import channels_create
+from channel import channel_join, channel_leave, channel_archive
+from message import message_send, message_edit, message_remove
+from standup import standup_end
+from stream import stream_subscribe, stream_unsubscribe, stream_next, stream_events, publish
+
+@pytest.fixture
+def initial_data():
+    '''
+    register 3 users, user 1 creates a public channel and user 2 joins it
+    '''
+    clear()
+    auth_register('test1@test.com', 'password', 'user1', 'user1')
+    auth_login('test1@test.com', 'password')
+    auth_register('test2@test.com', 'password', 'user2', 'user2')
+    auth_login('test2@test.com', 'password')
+    auth_register('test3@test.com', 'password', 'user3', 'user3')
+    auth_login('test3@test.com', 'password')
+    channels_create(users[0]['token'], 'channel_1', True)
+    channel_join(users[1]['token'], channels[0]['channel_id'])
+
+def test_stream_message_events(initial_data):
+    '''
+    send, edit and remove are pushed to a subscriber in order
+    '''
+    subscriber = stream_subscribe(users[1]['token'], 1)
+    msg_id = message_send(users[0]['token'], 1, 'hello')['message_id']
+    message_edit(users[0]['token'], msg_id, 'hello again')
+    message_remove(users[0]['token'], msg_id)
+
+    event, data = stream_next(subscriber, 0)
+    assert event == 'message_new'
+    assert json.loads(data)['message_id'] == msg_id
+    assert json.loads(data)['message'] == 'hello'
+    event, data = stream_next(subscriber, 0)
+    assert event == 'message_edit'
+    assert json.loads(data) == {'message_id' : msg_id, 'message' : 'hello again'}
+    event, data = stream_next(subscriber, 0)
+    assert event == 'message_remove'
+    assert json.loads(data) == {'message_id' : msg_id}
+    assert stream_next(subscriber, 0) is None
+
+def test_stream_standup_end(initial_data):
+    '''
+    the buffered standup message is pushed when a standup ends
+    '''
+    subscriber = stream_subscribe(users[0]['token'], 1)
+    channels[0]['standup_msg'] = '\nuser1user1: hi'
+    standup_end(users[0], channels[0])
+    event, data = stream_next(subscriber, 0)
+    assert event == 'message_new'
+    assert json.loads(data)['message'] == '\nuser1user1: hi'
+
+def test_stream_slow_consumer_evicted(initial_data):
+    '''
+    a subscriber that never reads is evicted once its queue is full
+    and publishing keeps working for everyone else
+    '''
+    slow = stream_subscribe(users[0]['token'], 1)
+    for idx in range(stream.QUEUE_SIZE):
+        publish(1, 'message_new', {'message_id' : idx})
+    assert slow['evicted'] is False
+    fast = stream_subscribe(users[1]['token'], 1)
+    publish(1, 'message_new', {'message_id' : -1})
+    assert slow['evicted'] is True
+    assert stream_next(slow, 0) == ('evicted', '{}')
+    assert stream_next(fast, 0)[0] == 'message_new'
+    assert slow['sub_id'] not in stream.subscribers
+
+def test_stream_events_format(initial_data):
+    '''
+    the SSE body starts with a comment and ends after eviction
+    '''
+    subscriber = stream_subscribe(users[0]['token'], 1)
+    body = stream_events(subscriber)
+    assert next(body) == ': connected\n\n'
+    publish(1, 'message_remove', {'message_id' : 10001})
+    assert next(body) == 'event: message_remove\ndata: {"message_id": 10001}\n\n'
+    subscriber['evicted'] = True
+    assert next(body) == 'event: evicted\ndata: {}\n\n'
+    with pytest.raises(StopIteration):
+        next(body)
+    assert subscriber['sub_id'] not in stream.subscribers
+
+def test_stream_unsubscribe_and_clear(initial_data):
+    '''
+    unsubscribed listeners get nothing and clear evicts everyone
+    '''
+    subscriber = stream_subscribe(users[0]['token'], 1)
+    stream_unsubscribe(subscriber)
+    stream_unsubscribe(subscriber)
+    message_send(users[0]['token'], 1, 'hello')
+    assert stream_next(subscriber, 0) is None
+    assert 1 not in stream.channel_subscribers
+
+    subscriber = stream_subscribe(users[0]['token'], 1)
+    clear()
+    assert stream_next(subscriber, 0) == ('evicted', '{}')
+
+def test_stream_membership(initial_data):
+    '''
+    a user who leaves the channel stops getting its messages,
+    and archiving the channel evicts every subscriber
+    '''
+    leaving = stream_subscribe(users[1]['token'], 1)
+    staying = stream_subscribe(users[0]['token'], 1)
+    channel_leave(users[1]['token'], 1)
+    message_send(users[0]['token'], 1, 'secret')
+    assert stream_next(leaving, 0) == ('evicted', '{}')
+    assert stream_next(staying, 0)[0] == 'message_new'
+
+    channel_archive(users[0]['token'], 1)
+    assert stream_next(staying, 0) == ('evicted', '{}')
+    assert 1 not in stream.channel_subscribers
+
+def test_stream_errors(initial_data):
+    '''
+    1. access error when given token is invalid
+    2. input error when given channel_id is invalid
+    3. access error when user is not a member
+    '''
+    with pytest.raises(AccessError):
+        stream_subscribe('invalid_token', 1)
+    with pytest.raises(InputError):
+        stream_subscribe(users[0]['token'], 2)
+    with pytest.raises(AccessError):
+        stream_subscribe(users[2]['token'], 1)
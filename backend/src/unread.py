@@ -0,0 +1,110 @@
+'''
+import threading to guard the counters while they change
+import bisect to count the removed messages after a read marker
+
+Unread counters, read by channels_unread in channels.py.
+Every message appended to a channel takes the next position of the
+channel, and a user's read marker in a channel is the last position
+the user has seen. The unread count is the number of positions after
+the marker, minus the removed messages after it, so it is found
+without reading any message.
+
+A marker is moved to the newest position when the user joins or is
+invited, sends a message, or reads the first page of channel_messages.
+'''
+import threading
+from bisect import bisect_right, insort
+
+# channel_id -> {'count' : number of messages appended,
+#                'removed' : sorted positions of removed messages}
+channel_counters = {}
+# message_id -> its position in its channel
+message_positions = {}
+# u_id -> channel_id -> position of the last message read
+read_markers = {}
+unread_lock = threading.Lock()
+
+def count_message(channel_id, message_id):
+    '''
+    This function gives an appended message the next position of its channel.
+
+    Args:
+        param1(int): channel_id
+        param2(int): message_id
+    '''
+    with unread_lock:
+        counter = channel_counters.setdefault(channel_id, {'count' : 0, 'removed' : []})
+        counter['count'] += 1
+        message_positions[message_id] = counter['count']
+
+def uncount_message(channel_id, message_id):
+    '''
+    This function takes a removed message off the unread counts.
+
+    Args:
+        param1(int): channel_id
+        param2(int): message_id
+    '''
+    with unread_lock:
+        position = message_positions.pop(message_id, None)
+        if position is not None:
+            insort(channel_counters[channel_id]['removed'], position)
+
+def mark_read(u_id, channel_id):
+    '''
+    This function moves a user's read marker to the newest message of a channel.
+
+    Args:
+        param1(int): u_id
+        param2(int): channel_id
+    '''
+    with unread_lock:
+        count = channel_counters.get(channel_id, {'count' : 0})['count']
+        read_markers.setdefault(u_id, {})[channel_id] = count
+
+def unread_counts(u_id, channel_ids):
+    '''
+    This function counts the live messages of every channel after the
+    user's marker, in O(log n) per channel.
+
+    Args:
+        param1(int): u_id
+        param2(list): channel_id
+
+    Returns:
+        It will return a list of int, in the order of channel_ids
+    '''
+    counts = []
+    with unread_lock:
+        markers = read_markers.get(u_id, {})
+        for channel_id in channel_ids:
+            counter = channel_counters.get(channel_id, {'count' : 0, 'removed' : []})
+            marker = markers.get(channel_id, 0)
+            removed = counter['removed']
+            counts.append(counter['count'] - marker
+                          - (len(removed) - bisect_right(removed, marker)))
+    return counts
+
+def drop_channel_counters(channel_id, message_ids):
+    '''
+    This function drops the counters of an archived channel.
+
+    Args:
+        param1(int): channel_id
+        param2(list): message_id of the channel
+    '''
+    with unread_lock:
+        channel_counters.pop(channel_id, None)
+        for message_id in message_ids:
+            message_positions.pop(message_id, None)
+        for markers in read_markers.values():
+            markers.pop(channel_id, None)
+
+def reset_unread():
+    '''
+    This is a helper function to empty the counters when data is cleared.
+    '''
+    with unread_lock:
+        channel_counters.clear()
+        message_positions.clear()
+        read_markers.clear()
@@ -0,0 +1,71 @@
+''' Test file for unread.py and channels_unread in channels.py '''
+
+import pytest
+from other import clear
+from data import users
+from auth import auth_register, auth_login
+from channels import channels_create, channels_unread
+from channel import channel_join, channel_invite, channel_messages, channel_archive
+from channel import channel_messages_json
+from message import message_send, message_remove, message_edit
+from error import AccessError
+
+@pytest.fixture
+def initial_data():
+    '''
+    register 2 users, user 1 creates 2 channels and user 2 joins the first
+    '''
+    clear()
+    for idx in range(1, 3):
+        auth_register('test' + str(idx) + '@test.com', 'password', 'user' + str(idx), 'last')
+        auth_login('test' + str(idx) + '@test.com', 'password')
+    channels_create(users[0]['token'], 'channel_1', True)
+    channels_create(users[0]['token'], 'channel_2', True)
+    channel_join(users[1]['token'], 1)
+
+def unread(token):
+    '''
+    channel_id -> unread count of a user
+    '''
+    return {item['channel_id'] : item['unread']
+            for item in channels_unread(token)['channels']}
+
+def test_unread_standard(initial_data):
+    '''
+    sends count as unread for the other members until they read the first page,
+    removed messages are not counted
+    '''
+    sent = [message_send(users[0]['token'], 1, 'msg ' + str(idx))['message_id']
+            for idx in range(5)]
+    assert unread(users[0]['token']) == {1 : 0, 2 : 0}
+    assert unread(users[1]['token']) == {1 : 5}
+    message_remove(users[0]['token'], sent[4])
+    message_edit(users[0]['token'], sent[3], '')
+    assert unread(users[1]['token']) == {1 : 3}
+    channel_messages(users[1]['token'], 1, 0)
+    assert unread(users[1]['token']) == {1 : 0}
+    message_remove(users[0]['token'], sent[0])
+    assert unread(users[1]['token']) == {1 : 0}
+
+    message_send(users[0]['token'], 1, 'new')
+    channel_messages(users[1]['token'], 1, 1)
+    assert unread(users[1]['token']) == {1 : 1}
+    channel_messages_json(users[1]['token'], 1, 0)
+    assert unread(users[1]['token']) == {1 : 0}
+    message_send(users[0]['token'], 1, 'newer')
+    message_send(users[1]['token'], 1, 'reply')
+    assert unread(users[1]['token']) == {1 : 0}
+    assert unread(users[0]['token']) == {1 : 1, 2 : 0}
+
+def test_unread_membership(initial_data):
+    '''
+    history before joining is not unread, archived channels are dropped
+    '''
+    message_send(users[0]['token'], 2, 'before')
+    channel_invite(users[0]['token'], 2, users[1]['u_id'])
+    message_send(users[0]['token'], 2, 'after')
+    assert unread(users[1]['token']) == {1 : 0, 2 : 1}
+    channel_archive(users[0]['token'], 2)
+    assert unread(users[1]['token']) == {1 : 0}
+    with pytest.raises(AccessError):
+        channels_unread('invalid_token')
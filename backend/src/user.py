@@ -4,11 +4,13 @@ import AccessError and InputError for error raising
 import re module for email checking
 import urllib for downloading image
 import Image from PIL for cropping photo
+import snapshot so users_all sees the change
 '''
 from error import AccessError, InputError
-from data import users
+from data import users, handle_index, member_projections
 from helper import get_user_from_token, get_user_from_id, random_str_generate
 from auth import is_email_valid
+from snapshot import new_version
 import urllib
 from PIL import Image
 import requests
@@ -91,6 +93,8 @@ def user_profile_setname(token, name_first, name_last):
 
     request_user['name_first'] = name_first
     request_user['name_last'] = name_last
+    member_projections.pop(request_user['u_id'], None)
+    new_version('users')
     return {
     }
 
@@ -126,6 +130,7 @@ def user_profile_setemail(token, email):
             raise InputError(description='Email already in use')
 
     request_user['email'] = email
+    new_version('users')
     return {
     }
 
@@ -156,11 +161,13 @@ def user_profile_sethandle(token, handle_str):
         raise InputError(description='Invalid length of handle')
 
     # raise InputError if new handle has been occupied by someone
-    for user in users:
-        if user['handle'] == handle_str:
-            raise InputError(description='Handle already in use')
+    if handle_str in handle_index:
+        raise InputError(description='Handle already in use')
 
+    del handle_index[request_user['handle']]
+    handle_index[handle_str] = request_user['u_id']
     request_user['handle'] = handle_str
+    new_version('users')
     return {
     }
 
@@ -214,4 +221,6 @@ def user_profile_uploadphoto(token, img_url, x_start, y_start, x_end, y_end, ser
     cropped.save(file_path + file_name)
     # do store url
     auth_user['profile_img_url'] = server_url + '/static/' + file_name
+    member_projections.pop(auth_user['u_id'], None)
+    new_version('users')
     return {}